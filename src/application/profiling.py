@@ -0,0 +1,175 @@
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+import cProfile
+import csv
+import heapq
+import json
+import logging
+import marshal
+import time
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+_DISABLED = nullcontext()
+
+
+def _peak_rss_kb() -> int:
+    if resource is None:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class StageProfiler:
+    """Per-image, per-stage wall time, CPU time and peak-RSS growth; a no-op when disabled.
+    Folder-level work (``folder_stage``) is recorded apart from the images."""
+
+    def __init__(self, enabled: bool = False, top_n_cprofile: int = 0):
+        self.enabled = enabled or top_n_cprofile > 0
+        self.top_n_cprofile = top_n_cprofile
+        self.records: list[dict] = []
+        self.folder_records: list[dict] = []
+        self._current: dict | None = None
+        self._slowest: list[tuple[float, int, str, dict]] = []  # min-heap on wall time
+        self._seq = 0
+
+    def image(self, image_path: Path):
+        return self._image(image_path) if self.enabled else _DISABLED
+
+    def stage(self, name: str):
+        return self._stage(name) if self._current is not None else _DISABLED
+
+    def folder_stage(self, folder: Path, name: str):
+        return self._folder_stage(folder, name) if self.enabled else _DISABLED
+
+    @contextmanager
+    def _image(self, image_path: Path):
+        self._current = {"image": str(image_path), "folder": str(Path(image_path).parent), "stages": {}}
+        profile = cProfile.Profile() if self.top_n_cprofile else None
+        wall, cpu, rss = time.perf_counter(), time.process_time(), _peak_rss_kb()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            record, self._current = self._current, None
+            record["total"] = [time.perf_counter() - wall, time.process_time() - cpu, _peak_rss_kb() - rss]
+            self.records.append(record)
+            if profile is not None:
+                profile.create_stats()
+                self._keep_slowest(record["total"][0], record["image"], profile.stats)
+
+    @contextmanager
+    def _stage(self, name: str):
+        wall, cpu, rss = time.perf_counter(), time.process_time(), _peak_rss_kb()
+        try:
+            yield
+        finally:
+            self._current["stages"][name] = [time.perf_counter() - wall, time.process_time() - cpu,
+                                             _peak_rss_kb() - rss]
+
+    @contextmanager
+    def _folder_stage(self, folder: Path, name: str):
+        wall, cpu, rss = time.perf_counter(), time.process_time(), _peak_rss_kb()
+        try:
+            yield
+        finally:
+            self.folder_records.append({"folder": str(folder), "stages": {name: [
+                time.perf_counter() - wall, time.process_time() - cpu, _peak_rss_kb() - rss]}})
+
+    def pop_records(self) -> tuple[list[dict], list[tuple[float, int, str, dict]], list[dict]]:
+        records, slowest, folder_records = self.records, self._slowest, self.folder_records
+        self.records, self._slowest, self.folder_records = [], [], []
+        return records, slowest, folder_records
+
+    def extend(self, popped: tuple[list[dict], list[tuple[float, int, str, dict]], list[dict]]) -> None:
+        records, slowest, folder_records = popped
+        self.records.extend(records)
+        self.folder_records.extend(folder_records)
+        for wall, _, image, stats in slowest:
+            self._keep_slowest(wall, image, stats)
+
+    def _keep_slowest(self, wall: float, image: str, stats: dict) -> None:
+        self._seq += 1
+        entry = (wall, self._seq, image, stats)
+        if len(self._slowest) < self.top_n_cprofile:
+            heapq.heappush(self._slowest, entry)
+        elif wall > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, entry)
+
+    def summary(self) -> dict:
+        """p50/p95/max of every stage for the whole run and for each folder; folder-level
+        stages are aggregated the same way under ``folder_stages``."""
+        by_folder: dict[str, list[dict]] = {}
+        for r in self.records:
+            by_folder.setdefault(r["folder"], []).append(r)
+        folder_stages: dict[str, list[dict]] = {}
+        for r in self.folder_records:
+            folder_stages.setdefault(r["folder"], []).append(r)
+
+        return {
+            "images": len(self.records),
+            "run": self._aggregate(self.records),
+            "folders": {folder: self._aggregate(records) for folder, records in by_folder.items()},
+            "folder_stages": {
+                "run": self._aggregate(self.folder_records),
+                "folders": {folder: self._aggregate(records) for folder, records in folder_stages.items()},
+            },
+        }
+
+    @staticmethod
+    def _aggregate(records: list[dict]) -> dict:
+        samples: dict[str, list[list[float]]] = {}
+        for r in records:
+            for name, values in r["stages"].items():
+                samples.setdefault(name, []).append(values)
+            if "total" in r:
+                samples.setdefault("total", []).append(r["total"])
+
+        result = {}
+        for name, values in samples.items():
+            v = np.asarray(values, dtype=np.float64)
+            result[name] = {
+                "count": len(v),
+                "wall_s": {"p50": float(np.percentile(v[:, 0], 50)), "p95": float(np.percentile(v[:, 0], 95)),
+                           "max": float(v[:, 0].max()), "sum": float(v[:, 0].sum())},
+                "cpu_s": {"p50": float(np.percentile(v[:, 1], 50)), "p95": float(np.percentile(v[:, 1], 95)),
+                          "max": float(v[:, 1].max()), "sum": float(v[:, 1].sum())},
+                "peak_rss_delta_kb": {"max": float(v[:, 2].max()), "sum": float(v[:, 2].sum())},
+            }
+        return result
+
+    def write(self, directory: Path) -> None:
+        """Write profile.json (aggregates), profile.csv (per image and stage) and the cProfile dumps."""
+        if not self.enabled or not (self.records or self.folder_records):
+            return
+        directory.mkdir(parents=True, exist_ok=True)
+
+        with (directory / "profile.json").open("w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2)
+
+        with (directory / "profile.csv").open("w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["image", "folder", "stage", "wall_s", "cpu_s", "peak_rss_delta_kb"])
+            for r in self.records:
+                for name, values in [*r["stages"].items(), ("total", r["total"])]:
+                    writer.writerow([r["image"], r["folder"], name, *values])
+            for r in self.folder_records:  # no image: done once for the folder
+                for name, values in r["stages"].items():
+                    writer.writerow(["", r["folder"], name, *values])
+
+        if self._slowest:
+            dump_dir = directory / "profile_slowest"
+            dump_dir.mkdir(exist_ok=True)
+            for rank, (wall, _, image, stats) in enumerate(sorted(self._slowest, reverse=True), start=1):
+                with (dump_dir / f"{rank:02d}_{Path(image).stem}.prof").open("wb") as f:
+                    marshal.dump(stats, f)  # same format as cProfile.Profile.dump_stats
+
+        logger.info(f"Profile of {len(self.records)} images written to {directory}.")
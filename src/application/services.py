@@ -1,4 +1,6 @@
-from domain.entities import ImageSample, GreennessMeasurement, PatchRegion
+from domain.entities import (ImageSample, PatchRegion, ShardSpec, DecodedImage,
+                             FolderCalibration, PlotSummary)
+from domain.measurements import MeasurementBuffer
 from domain.exceptions import PipelineError, PipelineErrorType
 from domain.ports import (
     ImageLoaderPort,    
@@ -9,15 +11,51 @@ from domain.ports import (
     GreennessIndexCalculatorPort,
     DatasetDiscoveryPort,
     ResultWriterPort,
+    ArtifactCachePort,
+    PlotSummaryWriterPort,
 )
 from config.settings import ProjectConfig
+from application.profiling import StageProfiler
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import closing
+from functools import partial
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+import dataclasses
+import hashlib
+import itertools
+import json
+import numpy as np
 import logging
+import multiprocessing
+import multiprocessing.util
+import sys
+import traceback
 from presentation.cli import clear_screen
 
 logger = logging.getLogger(__name__)
 
 class ImageProcessingPipeline:
 
+    # Working memory of a tile with --tile-memory-mb, per pixel of the tile: threshold and
+    # morphology temporaries, the corrected tile, and the index gathers of its leaf pixels.
+    # The decoded frame and its leaf mask (4 bytes per pixel) stay resident on top of that.
+    TILE_BYTES_PER_PIXEL = 48
+
+    # With --folder-batch, a probe frame agrees with the folder's checker position when all
+    # its corners lie within this fraction of the checker's diagonal of the median quad.
+    FOLDER_QUAD_TOLERANCE = 0.05
+
+    # Every other frame keeps the folder's checker only when the swatches read at the folder's quad
+    # correlate with the folder's swatches at least this much; a quad off by a tenth of the
+    # checker's diagonal reads about 0.2.
+    FOLDER_SWATCH_MIN_CORR = 0.8
+
+    # Part of every artifact cache key. Bump it when a change to checker detection, the
+    # leaf-mask thresholds or morphology, or the colour fit changes what would be cached.
+    CACHE_VERSION = 1
+
     def __init__(
         self,
         loader: ImageLoaderPort,
@@ -30,7 +68,9 @@ class ImageProcessingPipeline:
         show_func,
         show: bool = False,
         save_fig: bool = False,
-        save_interval: int = 100
+        save_interval: int = 100,
+        profiler: StageProfiler | None = None,
+        cache: ArtifactCachePort | None = None
     ):
         self.loader = loader
         self.checker_detector = checker_detector
@@ -43,82 +83,517 @@ class ImageProcessingPipeline:
         self.show = show
         self.save_fig = save_fig
         self.save_interval = save_interval
+        self.profiler = profiler if profiler is not None else StageProfiler()
+        self.cache = cache
+
+        # whether the last process_image searched its frame for the checker instead of using its folder's
+        self.searched_checker = False
+        # checker searches of the last calibrate_folder's probes, reused when a probe is processed on its own
+        self._probe_checkers: dict[Path, tuple[np.ndarray, np.ndarray] | PipelineError] = {}
+
+        # artefacts are keyed by the image and every setting that can change them
+        checker_tag = (f"v{self.CACHE_VERSION},tracking={config.checker_tracking},"
+                       f"proxy={config.checker_proxy_width}")
+        segment_tag = f"segment={config.segment_method}"
+        if config.segment_method == "sam":
+            sam = json.dumps(dataclasses.asdict(config.sam_config), sort_keys=True, default=str)
+            segment_tag += f",sam={hashlib.sha1(sam.encode('utf-8')).hexdigest()[:16]}"
+        self._cache_tags = {
+            "checker": checker_tag,
+            "mask": f"{checker_tag},{segment_tag}",
+            "folder_mask": f"{checker_tag},{segment_tag},folder_batch={config.folder_batch}",
+            "ccm": f"{checker_tag},ccm_tolerance={config.ccm_tolerance}",
+        }
+
+    def process_image(self, sample: ImageSample, num: int,
+                      folder: FolderCalibration | None = None) -> MeasurementBuffer:
+        """``folder`` is the result of calibrate_folder for the sample's folder, if it found one."""
+        with self.profiler.image(sample.path):
+            return self._process_image(sample, num, folder)
+
+    def calibrate_folder(self, samples: list[ImageSample]) -> FolderCalibration | None:
+        """Search for the checker in ``config.folder_batch`` evenly spaced frames of one folder; when most of
+        them agree, their position and median swatches serve the folder, else None is returned."""
+        folder = samples[0].path.parent
+        picks = np.linspace(0, len(samples) - 1, min(self.config.folder_batch, len(samples)))
+        probes = [samples[i] for i in np.unique(picks.round().astype(int))]
+
+        found = []
+        self._probe_checkers = {}
+        with self.profiler.folder_stage(folder, "calibrate_folder"):
+            for sample in self.prefetch(probes):
+                try:
+                    frame = self.loader.load(sample.path)
+                    result = self._detect_checker(sample, frame, self._cache_keys(sample))
+                except PipelineError as e:
+                    self._probe_checkers[sample.path] = e
+                    continue
+                except Exception as e:
+                    logger.warning(f"[WARN] for {sample.path}: checker search in probe frame failed ({e}).")
+                    continue
+                found.append(result)
+                self._probe_checkers[sample.path] = result
+
+            quads = np.asarray([quad for _, quad in found], dtype=np.float64).reshape(len(found), -1, 2)
+            agree = np.zeros(len(found), dtype=bool)
+            if found:
+                median = np.median(quads, axis=0)
+                diagonal = np.linalg.norm(median.max(axis=0) - median.min(axis=0))
+                agree = np.linalg.norm(quads - median, axis=2).max(axis=1) <= self.FOLDER_QUAD_TOLERANCE * diagonal
+
+            if agree.sum() * 2 <= len(probes):
+                logger.warning(f"[WARN] for {folder}: the checker was found at a common position in only "
+                               f"{agree.sum()} of {len(probes)} probe frames; its frames are processed one by one.")
+                return None
 
-    def process_image(self, sample: ImageSample, num: int) -> list[GreennessMeasurement]:
-        img = self.loader.load(sample.path)
+            swatches = np.median(np.stack([found[i][0] for i in np.flatnonzero(agree)]), axis=0)
+            quad = np.rint(np.median(quads[agree], axis=0)).astype(np.int32)
+            matrix = self.calibrator.fit_matrix(swatches)
 
-        norm_image, swatch_colours, checker_bbox = self.checker_detector.detect(sample.path)
-        leaves_mask, leaves_rgb = self.leaf_segmentor.extract(img, checker_bbox)
-        calibrated = self.calibrator.calibrate(norm_image, swatch_colours)
+        logger.info(f"Folder {folder}: checker found at a common position in {agree.sum()} of {len(probes)} "
+                    f"probe frames; their median swatches calibrate all {len(samples)} frames.")
+        return FolderCalibration(quad=quad, swatches=swatches, matrix=matrix, probes=len(probes),
+                                 agreeing=int(agree.sum()))
 
-        patches: list[PatchRegion] = self.patch_selector.select_patches(calibrated, checker_bbox,
-                                                                        self.config.num_patches_per_image)
+    def _process_image(self, sample: ImageSample, num: int,
+                       folder: FolderCalibration | None) -> MeasurementBuffer:
+        stage = self.profiler.stage
+        self.searched_checker = folder is None
 
-        measurements: list[GreennessMeasurement] = []
-        for patch in patches:
-            patch_img = calibrated[patch.y:patch.y + patch.h, patch.x:patch.x + patch.w]
-            patch_mask = leaves_mask[patch.y:patch.y + patch.h, patch.x:patch.x + patch.w]
-            green_inx = self.greenness_calc.compute(patch_img, patch_mask)
+        with stage("load"):
+            frame = self.loader.load(sample.path)
 
-            measurements.append(
-                GreennessMeasurement(image_path=sample.path, folder_name=sample.folder_name, lat=sample.lat,
-                                     long=sample.long, patch_id=patch.patch_id, patch_region=patch,
-                                     greenness_value=green_inx))
-        
-        path_save_fig = (self.config.output_figure / sample.root_path / sample.path.name
-                         if self.save_fig and (num % self.save_interval == 0)
-                         else None)
-        self.show_func(path_save_fig, self.show, orig_img=img, leaves_RGB=leaves_rgb)
+        keys = self._cache_keys(sample)
+
+        if folder is not None:
+            with stage("verify_checker"):
+                if not self._checker_in_place(frame, folder):
+                    logger.info(f"{sample.path}: the checker is not at its folder's position; searching the frame.")
+                    folder = None
+                    self.searched_checker = True
+
+        if folder is not None:
+            swatch_colours, checker_bbox = folder.swatches, folder.quad
+        else:
+            with stage("detect_checker"):
+                swatch_colours, checker_bbox = self._detect_checker(sample, frame, keys)
+        frame.drop_views()  # the detector's float copies of the frame are not needed any more
+        tile_rows = self._tile_rows(frame.shape)
+
+        with stage("segment"):
+            mask_key = keys["mask" if folder is None else "folder_mask"] if keys else None
+            cached = self.cache.get(mask_key) if keys else None
+            if cached is not None:
+                leaves_mask = np.unpackbits(cached["bits"], count=frame.shape[0] * frame.shape[1])
+                leaves_mask = (leaves_mask * 255).reshape(frame.shape[:2])
+            else:
+                leaves_mask = self.leaf_segmentor.mask(frame.bgr, checker_bbox, tile_rows=tile_rows)
+                if keys:
+                    self.cache.put(mask_key, "mask", sample.path, {"bits": np.packbits(leaves_mask > 0)})
+        with stage("calibrate"):
+            cached = self.cache.get(keys["ccm"]) if keys and folder is None else None
+            matrix = folder.matrix if folder is not None else cached["matrix"] if cached is not None else None
+            if tile_rows is not None:
+                # the frame is corrected tile by tile while measuring
+                calibrated = None
+                if matrix is None:
+                    matrix = self.calibrator.matrix_for(swatch_colours, session=sample.path.parent)
+            elif matrix is not None:
+                calibrated = self.calibrator.apply(frame.bgr, matrix)
+            else:
+                calibrated = self.calibrator.calibrate(frame, swatch_colours, session=sample.path.parent)
+            if keys and folder is None and cached is None:
+                self.cache.put(keys["ccm"], "ccm", sample.path, {"matrix": self.calibrator.matrix})
+
+        with stage("select_patches"):
+            if calibrated is not None:
+                patches: list[PatchRegion] = self.patch_selector.select_patches(calibrated, checker_bbox,
+                                                                                self.config.num_patches_per_image,
+                                                                                mask=leaves_mask)
+            else:
+                patches = self.patch_selector.select_patches(frame.bgr, checker_bbox,
+                                                             self.config.num_patches_per_image, mask=leaves_mask,
+                                                             transform=lambda px: self.calibrator.apply(px, matrix))
+
+        with stage("greenness_index"):
+            if calibrated is not None:
+                results = [self.greenness_calc.compute_all(calibrated[patch.y:patch.y + patch.h, patch.x:patch.x + patch.w],
+                                                           leaves_mask[patch.y:patch.y + patch.h, patch.x:patch.x + patch.w])
+                           for patch in patches]
+            else:
+                results = self._measure_tiled(frame.bgr, leaves_mask, matrix, patches, tile_rows)
+
+        measurements = MeasurementBuffer.for_image(sample, patches, results)
+
+        if (self.save_fig or self.show) and num % self.save_interval == 0:
+            path_save_fig = self.config.output_figure / sample.root_path / sample.path.name if self.save_fig else None
+            with stage("visualize"):
+                leaves_rgb = self.leaf_segmentor.overlay(frame.bgr, leaves_mask)
+                self.show_func(path_save_fig, self.show, orig_img=frame.bgr, leaves_RGB=leaves_rgb)
 
         return measurements
 
+    def _detect_checker(self, sample: ImageSample, frame: DecodedImage, keys: dict[str, str] | None) -> tuple[np.ndarray, np.ndarray]:
+        probe = self._probe_checkers.pop(sample.path, None)
+        if isinstance(probe, PipelineError):
+            raise probe
+        if probe is not None:
+            return probe
+
+        cached = self.cache.get(keys["checker"]) if keys else None
+        if cached is not None:
+            return cached["swatches"], cached["quad"]
+
+        swatch_colours, checker_bbox = self.checker_detector.detect(frame)
+        if keys:
+            self.cache.put(keys["checker"], "checker", sample.path, {"swatches": swatch_colours, "quad": checker_bbox})
+        return swatch_colours, checker_bbox
+
+    def _checker_in_place(self, frame: DecodedImage, folder: FolderCalibration) -> bool:
+        swatches_at = getattr(self.checker_detector, "swatches_at", None)
+        if swatches_at is None:  # the detector can only search; trust the probes
+            return True
+        with np.errstate(divide="ignore", invalid="ignore"):  # a blank region has no correlation
+            corr = np.corrcoef(np.ravel(swatches_at(frame, folder.quad)), np.ravel(folder.swatches))[0, 1]
+        return bool(corr >= self.FOLDER_SWATCH_MIN_CORR)
+
+    def prefetch(self, items: Iterable, path: Callable = lambda sample: sample.path) -> Iterator:
+        """``items`` unchanged; a prefetching loader starts decoding the images of the next ones."""
+        prefetch = getattr(self.loader, "prefetch", None)
+        return prefetch(items, path) if prefetch is not None else iter(items)
+
+    def _tile_rows(self, shape: tuple[int, ...]) -> int | None:
+        """Rows per tile that keep the tiled stages within config.tile_memory_mb, or None for whole frames."""
+        if not self.config.tile_memory_mb:
+            return None
+        h, w = shape[:2]
+        rows = self.config.tile_memory_mb * 2**20 // (w * self.TILE_BYTES_PER_PIXEL)
+        return None if rows >= h else max(rows, 64)  # thinner tiles spend most of their time on the halo
+
+    def _measure_tiled(self, bgr: np.ndarray, leaves_mask: np.ndarray, matrix: np.ndarray,
+                       patches: list[PatchRegion], tile_rows: int) -> list[tuple[float, dict[str, float]]]:
+        """Colour-correct the frame one row tile at a time and feed each patch's rows to its accumulator."""
+        accumulators = [self.greenness_calc.accumulator() for _ in patches]
+        for y0 in range(0, bgr.shape[0], tile_rows):
+            y1 = min(bgr.shape[0], y0 + tile_rows)
+            overlapping = [(p, acc) for p, acc in zip(patches, accumulators) if p.y < y1 and p.y + p.h > y0]
+            if not overlapping:
+                continue
+
+            calibrated = self.calibrator.apply(bgr[y0:y1], matrix)
+            for patch, acc in overlapping:
+                top, bottom = max(patch.y, y0), min(patch.y + patch.h, y1)
+                acc.add(calibrated[top - y0:bottom - y0, patch.x:patch.x + patch.w],
+                        leaves_mask[top:bottom, patch.x:patch.x + patch.w])
+
+        return [acc.result() for acc in accumulators]
+
+    def _cache_keys(self, sample: ImageSample) -> dict[str, str] | None:
+        if self.cache is None:
+            return None
+        image = self.cache.image_key(sample.path)
+        return {kind: f"{image}|{kind}|{tag}" for kind, tag in self._cache_tags.items()}
+
+    def close(self) -> None:
+        """Release background resources, e.g. wait for figures still being rendered."""
+        for component in (self.loader, self.checker_detector, self.leaf_segmentor, self.calibrator,
+                          self.patch_selector, self.greenness_calc, self.show_func, self.cache):
+            close = getattr(component, "close", None)
+            if close is not None:
+                close()
+
 
 class DatasetProcessingService:
 
     def __init__(
         self,
         discovery: DatasetDiscoveryPort,
-        pipeline: ImageProcessingPipeline,
+        pipeline: ImageProcessingPipeline | None,
         writer: ResultWriterPort,
-        info_interval: int = 25
+        info_interval: int = 25,
+        workers: int = 1,
+        pipeline_factory: Callable[[], ImageProcessingPipeline] | None = None,
+        chunk_size: int = 16,
+        max_samples: int | None = None,
+        resume: bool = False,
+        profiler: StageProfiler | None = None,
+        profile_dir: Path | None = None,
+        shard: ShardSpec | None = None,
+        folder_batch: bool = False,
+        plot_writer: PlotSummaryWriterPort | None = None
     ):
         self.discovery = discovery
         self.pipeline = pipeline
         self.writer = writer
         self.info_interval = info_interval
+        self.workers = workers
+        self.pipeline_factory = pipeline_factory
+        self.chunk_size = chunk_size
+        self.max_samples = max_samples
+        self.resume = resume
+        self.profiler = profiler if profiler is not None else StageProfiler()
+        self.profile_dir = profile_dir
+        self.shard = shard if shard is not None else ShardSpec()
+        self.folder_batch = folder_batch
+        self.plot_writer = plot_writer
+        self._total = None
+
+        if self.workers > 1 and self.pipeline_factory is None:
+            raise ValueError("A pipeline_factory is required when workers > 1")
 
     def run(self, root) -> None:        
-        samples = self.discovery.discover_images(root)
+        samples = self.discovery.iter_images(root)
+        if self.shard.count > 1:
+            samples = (s for s in samples if self.shard.contains(s.path, root))
+            logger.info(f"Processing {self.shard.tag} (by {self.shard.by}).")
+        if self.max_samples is not None:
+            samples = itertools.islice(samples, self.max_samples)
+
+        # Counting only lists directories, so it runs next to the processing for progress reports.
+        counter = ThreadPoolExecutor(max_workers=1)
+        self._total = counter.submit(self._count, root)
+        counter.shutdown(wait=False)
+
+        done = self.writer.open(resume=self.resume)
+        recovered = None
+        if self.plot_writer is not None:
+            self.plot_writer.open()
+            if done:
+                recovered = _recovered_frames(self.writer.read_measurements())
+        try:
+            if done:
+                samples = (s for s in samples if str(s.path) not in done)
+                logger.info(f"Resuming: {len(done)} images already in the output are skipped.")
+
+            clear_screen()
+            logger.info(f"Scanning {root}; starting analysis.")
+
+            num_written = self._process(samples, recovered)
+
+        finally:
+            self.writer.close()
+            if self.plot_writer is not None:
+                self.plot_writer.close()
+            if self.profile_dir is not None:
+                self.profiler.write(self.profile_dir)
 
         clear_screen()
-        logger.info(f"{len(samples)} samples read; starting analysis.")
+        logger.info(f"{num_written} measurements written; data export completed successfully.")
 
-        all_measurements: list[GreennessMeasurement] = []
-        for num, sample in enumerate(samples[:10]):
+    def _process(self, samples: Iterable[ImageSample],
+                 recovered: dict[Path, list[tuple[ImageSample, MeasurementBuffer]]] | None = None) -> int:
+        """Run the pipeline over samples and stream each image's measurements to the writer. On resume,
+        ``recovered`` holds the frames already in the output, by folder, and the plot rows are written at the end."""
+        outcomes = self._iter_parallel(samples) if self.workers > 1 else self._iter_serial(samples)
 
-            try:
-                ms = self.pipeline.process_image(sample, num)
-                all_measurements.extend(ms)
+        num_written = 0
+        plot: list[tuple[ImageSample, MeasurementBuffer | None]] = []  # frames of the current folder
+        redetected = 0  # of which searched for the checker on their own
+        summaries: dict[Path, PlotSummary | None] | None = None
+        if recovered is not None:
+            summaries = dict.fromkeys(recovered)
+
+        def summarise(frames: list[tuple[ImageSample, MeasurementBuffer | None]], redetected: int) -> None:
+            if summaries is None:
+                self.plot_writer.write([_plot_summary(frames, redetected)])
+            else:
+                folder = frames[0][0].path.parent
+                summaries[folder] = _plot_summary(recovered.pop(folder, []) + frames, redetected)
+
+        with closing(outcomes):
+            for num, sample, ms, error, searched_checker in outcomes:
+
+                if self.plot_writer is not None:
+                    if plot and plot[0][0].path.parent != sample.path.parent:
+                        summarise(plot, redetected)
+                        plot, redetected = [], 0
+                    plot.append((sample, ms if error is None else None))
+                    redetected += searched_checker
 
-                if num % self.info_interval == 0:
-                    clear_screen()
-                    logger.info(f"{num} of {len(samples)} samples analyzed.")
+                if error is None:
+                    self.writer.write(ms)
+                    num_written += len(ms)
 
-            except PipelineError as e:
-                logger.warning(f"[WARN] at {e.step} step for {sample.path}: {e.message}.")
+                    if num % self.info_interval == 0:
+                        clear_screen()
+                        logger.info(f"{num} of {self._total_estimate()} samples analyzed.")
 
-                if e.error_type == PipelineErrorType.FATAL:
-                    logger.error(f"[ERROR] at step {e.step}: {e.message}. Fatal pipeline error encountered. Stopping processing")
+                    continue
+
+                if log_failure(sample, error):
                     break
 
-                continue
+        if plot:
+            summarise(plot, redetected)
+        if summaries is not None:
+            self.plot_writer.write([summary if summary is not None else _plot_summary(recovered[folder])
+                                    for folder, summary in summaries.items()])
 
-            except Exception as e:
-                logger.exception(f"Unexpected error for {sample.path}: {e}.")
-                continue
+        return num_written
 
-        if all_measurements:
-            clear_screen()
-            logger.info("Exporting data/results to a CSV file.")
-            self.writer.write_all(all_measurements)
-            logger.info("Data export to CSV completed successfully.")
+    def _count(self, root) -> int:
+        if self.shard.count == 1:
+            return self.discovery.count_images(root)
+        return sum(1 for path in self.discovery.iter_paths(root) if self.shard.contains(path, root))
+
+    def _total_estimate(self) -> str:
+        if self._total is None or not self._total.done() or self._total.exception() is not None:
+            return "?"
+        total = self._total.result()
+        return str(min(total, self.max_samples) if self.max_samples is not None else total)
+
+    def _iter_serial(self, samples: Iterable[ImageSample]) -> Iterator[tuple[int, ImageSample, MeasurementBuffer | list, Exception | None, bool]]:
+        pipeline = self.pipeline if self.pipeline is not None else self.pipeline_factory()
+
+        numbered = enumerate(samples)
+        units = _folder_chunks(numbered) if self.folder_batch else [numbered]
+        try:
+            for unit in units:
+                folder = pipeline.calibrate_folder([sample for _, sample in unit]) if self.folder_batch else None
+
+                for num, sample in pipeline.prefetch(unit, path=lambda item: item[1].path):
+                    try:
+                        ms, error = pipeline.process_image(sample, num, folder), None
+                    except Exception as e:
+                        ms, error = [], e
+
+                    if pipeline.profiler is not self.profiler:
+                        self.profiler.extend(pipeline.profiler.pop_records())
+
+                    yield num, sample, ms, error, pipeline.searched_checker
+
+        finally:
+            pipeline.close()
+
+    def _iter_parallel(self, samples: Iterable[ImageSample]) -> Iterator[tuple[int, ImageSample, MeasurementBuffer | list, Exception | None, bool]]:
+        """Fan contiguous chunks of samples (whole folders with folder_batch) out to worker processes
+        and yield the outcomes back in sample order, so the result is identical to a serial run."""
+        ctx = multiprocessing.get_context()
+        fatal_index = ctx.Value('q', sys.maxsize)
+
+        numbered = enumerate(samples)
+        if self.folder_batch:
+            chunks = _folder_chunks(numbered)
+        else:
+            chunks = iter(lambda: list(itertools.islice(numbered, self.chunk_size)), [])
+
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx, initializer=_init_worker,
+                                 initargs=(self.pipeline_factory, fatal_index)) as pool:
+            submit = partial(pool.submit, _process_chunk, folder_batch=self.folder_batch)
+            pending = deque((chunk, submit(chunk)) for chunk in itertools.islice(chunks, 2 * self.workers))
+            try:
+                while pending:
+                    chunk, future = pending.popleft()
+                    (measured, chunk_results), profile = future.result()
+                    results = {num: (measured[start:stop] if error is None else [], error, searched_checker)
+                               for num, start, stop, error, searched_checker in chunk_results}
+                    self.profiler.extend(profile)
+
+                    next_chunk = next(chunks, None)
+                    if next_chunk is not None:
+                        pending.append((next_chunk, submit(next_chunk)))
+
+                    for num, sample in chunk:
+                        if num not in results:  # worker stopped behind an earlier fatal error
+                            return
+                        yield num, sample, *results[num]
+
+            finally:
+                for _, future in pending:
+                    future.cancel()
+                with fatal_index.get_lock():
+                    fatal_index.value = -1
+
+
+def log_failure(sample: ImageSample, error: Exception) -> bool:
+    """Log why an image produced no measurements; True for a FATAL error that must stop the run."""
+    if isinstance(error, PipelineError):
+        logger.warning(f"[WARN] at {error.step} step for {sample.path}: {error.message}.")
+
+        if error.error_type == PipelineErrorType.FATAL:
+            logger.error(f"[ERROR] at step {error.step}: {error.message}. Fatal pipeline error encountered. Stopping processing")
+            return True
+
+        return False
+
+    logger.error(f"Unexpected error for {sample.path}: {error}.",
+                 exc_info=error if error.__traceback__ is not None else None)
+    return False
+
+
+def _folder_chunks(numbered: Iterable[tuple[int, ImageSample]]) -> Iterator[list[tuple[int, ImageSample]]]:
+    """Consecutive samples of the same folder; discovery yields every folder in one run."""
+    for _, chunk in itertools.groupby(numbered, key=lambda item: item[1].path.parent):
+        yield list(chunk)
+
+
+def _recovered_frames(measurements: MeasurementBuffer) -> dict[Path, list[tuple[ImageSample, MeasurementBuffer]]]:
+    """The frames of an earlier run, rebuilt from its rows and grouped by folder in output order."""
+    frames: dict[Path, list[tuple[ImageSample, MeasurementBuffer]]] = {}
+    for path, rows in measurements.by_image():
+        path, first = Path(path), rows[0]
+        # only summarised, never processed again, so root_path (figures) is not needed
+        sample = ImageSample(path=path, root_path=path.parent, folder_name=first.folder_name,
+                             lat=first.lat, long=first.long)
+        frames.setdefault(path.parent, []).append((sample, rows))
+    return frames
+
+
+def _plot_summary(frames: list[tuple[ImageSample, MeasurementBuffer | None]], redetected: int = 0) -> PlotSummary:
+    """Summary of one folder's frames; failed frames (None) are counted but not measured."""
+    summary = MeasurementBuffer.concat(ms for _, ms in frames if ms).folder_summaries()
+    stats = {name: float(summary[name][0]) if len(summary[name]) else np.nan
+             for name in ("greenness_mean", "greenness_median", "greenness_q1", "greenness_q3")}
+    first = frames[0][0]
+    return PlotSummary(folder_name=first.folder_name, folder_path=first.path.parent, frames=len(frames),
+                       failed=sum(ms is None for _, ms in frames), redetected=redetected,
+                       lat=float(np.mean([s.lat for s, _ in frames])), long=float(np.mean([s.long for s, _ in frames])),
+                       greenness_mean=stats["greenness_mean"], greenness_median=stats["greenness_median"],
+                       greenness_iqr=stats["greenness_q3"] - stats["greenness_q1"])
+
+
+# Per-process state of the worker pool used by DatasetProcessingService._iter_parallel.
+_worker_pipeline: ImageProcessingPipeline | None = None
+_worker_fatal_index = None
+
+
+def _init_worker(pipeline_factory: Callable[[], ImageProcessingPipeline], fatal_index) -> None:
+    global _worker_pipeline, _worker_fatal_index
+    _worker_pipeline = pipeline_factory()
+    _worker_fatal_index = fatal_index
+    multiprocessing.util.Finalize(_worker_pipeline, _worker_pipeline.close, exitpriority=10)
+
+
+def _process_chunk(chunk: list[tuple[int, ImageSample]], folder_batch: bool = False
+                   ) -> tuple[tuple[MeasurementBuffer, list[tuple[int, int, int, Exception | None, bool]]], tuple]:
+    """Process one share of the samples and return their rows in one buffer, each sample's as a [start, stop) range.
+    A FATAL error publishes its sample number, so workers skip the samples a serial run would not reach."""
+    measured = MeasurementBuffer()
+    results = []
+    folder = None
+    if folder_batch and chunk[0][0] <= _worker_fatal_index.value:
+        folder = _worker_pipeline.calibrate_folder([sample for _, sample in chunk])
+
+    for num, sample in _worker_pipeline.prefetch(chunk, path=lambda item: item[1].path):
+        if num > _worker_fatal_index.value:
+            break
+
+        try:
+            ms = _worker_pipeline.process_image(sample, num, folder)
+            start = len(measured)
+            measured.extend(ms)
+            results.append((num, start, len(measured), None, _worker_pipeline.searched_checker))
+
+        except PipelineError as e:
+            results.append((num, 0, 0, e, _worker_pipeline.searched_checker))
+
+            if e.error_type == PipelineErrorType.FATAL:
+                with _worker_fatal_index.get_lock():
+                    _worker_fatal_index.value = min(_worker_fatal_index.value, num)
+                break
+
+        except Exception as e:
+            results.append((num, 0, 0, RuntimeError(''.join(traceback.format_exception(e)).rstrip()),
+                            _worker_pipeline.searched_checker))
+
+    return (measured, results), _worker_pipeline.profiler.pop_records()
@@ -0,0 +1,200 @@
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+import json
+import logging
+import os
+import signal
+import threading
+import time
+import numpy as np
+from application.services import ImageProcessingPipeline, log_failure
+from domain.ports import DatasetDiscoveryPort, FolderWatcherPort, ResultWriterPort
+
+logger = logging.getLogger(__name__)
+
+
+class WatchService:
+    """Processes frames while they are being acquired, appending and flushing their rows right away.
+    Frames past the end of their GPS log wait up to ``gps_wait`` seconds; status goes to ``status_path``."""
+
+    STATUS_INTERVAL = 5.0
+    LATENCY_WINDOW = 256
+
+    def __init__(
+        self,
+        watcher: FolderWatcherPort,
+        discovery: DatasetDiscoveryPort,
+        pipeline: ImageProcessingPipeline,
+        writer: ResultWriterPort,
+        status_path: Path,
+        queue_size: int = 64,
+        poll_interval: float = 1.0,
+        gps_wait: float = 30.0,
+        idle_exit: float = 0.0,
+        info_interval: int = 25
+    ):
+        self.watcher = watcher
+        self.discovery = discovery
+        self.pipeline = pipeline
+        self.writer = writer
+        self.status_path = Path(status_path)
+        self.queue_size = max(1, queue_size)
+        self.poll_interval = poll_interval
+        self.gps_wait = gps_wait
+        self.idle_exit = idle_exit
+        self.info_interval = info_interval
+
+        self._queue: deque[tuple[Path, float, float]] = deque()  # path, mtime, queued at
+        self._latency = deque(maxlen=self.LATENCY_WINDOW)
+        self._processing = deque(maxlen=self.LATENCY_WINDOW)
+        self._stop = threading.Event()
+        self._behind = False
+        self._started = time.time()
+        self._last_result: tuple[str, float] | None = None
+        self._status_at = 0.0
+        self.processed = self.failed = self.measurements = 0
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def run(self) -> None:
+        done = self.writer.open(resume=True)
+        if done:
+            logger.info(f"Resuming: {len(done)} images already in the output are skipped.")
+        previous = None
+        if threading.current_thread() is threading.main_thread():
+            previous = signal.signal(signal.SIGTERM, lambda *_: self.stop())
+        logger.info(f"Watching with {self.watcher.backend}; status in {self.status_path}. Stop with Ctrl+C.")
+
+        idle_since = time.monotonic()
+        ready = None
+        try:
+            while not self._stop.is_set():
+                free = self.queue_size - len(self._queue)
+                for path in self.watcher.poll(timeout=0.0 if ready else self.poll_interval, limit=free):
+                    if str(path) not in done:
+                        self._enqueue(path)
+                self._track_backpressure()
+
+                ready = self._take_ready()
+                if ready is None:
+                    if self.idle_exit and not self._queue and time.monotonic() - idle_since >= self.idle_exit:
+                        logger.info(f"No new frames for {self.idle_exit:g} s; stopping.")
+                        break
+                    if time.monotonic() - self._status_at >= self.STATUS_INTERVAL:
+                        self._write_status("watching")
+                    continue
+
+                if self._process(*ready):
+                    break
+                idle_since = time.monotonic()
+                self._write_status("watching")
+
+        except KeyboardInterrupt:
+            logger.info("Interrupted; stopping.")
+        finally:
+            if previous is not None:
+                signal.signal(signal.SIGTERM, previous)
+            self.writer.close()
+            self.pipeline.close()
+            self.watcher.close()
+            self._write_status("stopped")
+
+        logger.info(f"{self.processed} frames processed, {self.failed} failed, "
+                    f"{self.measurements} measurements written.")
+
+    def _enqueue(self, path: Path) -> None:
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return  # gone again
+        self._queue.append((path, mtime, time.monotonic()))
+
+    def _take_ready(self) -> tuple[Path, float, float] | None:
+        """The oldest queued frame that does not wait for its GPS fix any more."""
+        now = time.monotonic()
+        waiting = set()  # folders whose log was found behind in this call
+        for i, (path, mtime, queued) in enumerate(self._queue):
+            if path.parent in waiting:
+                continue
+            if now - queued < self.gps_wait and self.discovery.awaits_gps(path):
+                waiting.add(path.parent)
+                continue
+            del self._queue[i]
+            return path, mtime, queued
+        return None
+
+    def _process(self, path: Path, mtime: float, queued: float) -> bool:
+        """Measure one frame and flush its rows; True when a FATAL error must stop the service."""
+        start = time.perf_counter()
+        samples = self.discovery.samples_for([path])
+        if not samples:
+            self.failed += 1  # discovery logged why
+            return False
+        sample = samples[0]
+
+        try:
+            ms = self.pipeline.process_image(sample, self.processed + self.failed)
+        except Exception as e:
+            self.failed += 1
+            return log_failure(sample, e)
+
+        self.writer.write(ms)
+        flush = getattr(self.writer, "flush", None)
+        if flush is not None:
+            flush()
+
+        self.processed += 1
+        self.measurements += len(ms)
+        self._latency.append(time.time() - mtime)
+        self._processing.append(time.perf_counter() - start)
+        self._last_result = (str(path), time.time())
+
+        if self.processed % self.info_interval == 0:
+            logger.info(f"{self.processed} frames processed; capture-to-result latency "
+                        f"p50 {np.percentile(self._latency, 50):.1f} s; {len(self._queue)} queued, "
+                        f"{self.watcher.pending} not queued yet.")
+        return False
+
+    def _track_backpressure(self) -> None:
+        behind = len(self._queue) >= self.queue_size and self.watcher.pending > 0
+        if behind and not self._behind:
+            logger.warning(f"[WARN] Processing is behind acquisition: the queue of {self.queue_size} frames is "
+                           f"full and {self.watcher.pending} more are waiting on disk.")
+        elif self._behind and not behind:
+            logger.info("Processing caught up with acquisition.")
+        self._behind = behind
+
+    def _write_status(self, state: str) -> None:
+        def percentiles(values) -> dict | None:
+            if not values:
+                return None
+            v = np.asarray(values)
+            return {"last": round(float(v[-1]), 3), "p50": round(float(np.percentile(v, 50)), 3),
+                    "p95": round(float(np.percentile(v, 95)), 3), "max": round(float(v.max()), 3)}
+
+        status = {
+            "state": state,
+            "backend": self.watcher.backend,
+            "pid": os.getpid(),
+            "started": datetime.fromtimestamp(self._started).isoformat(timespec="seconds"),
+            "updated": datetime.now().isoformat(timespec="seconds"),
+            "processed": self.processed,
+            "failed": self.failed,
+            "measurements": self.measurements,
+            "queued": len(self._queue),
+            "queue_size": self.queue_size,
+            "backlog": self.watcher.pending,  # found on disk but not queued: still being written, or held back
+            "behind": self._behind,
+            "last_image": self._last_result[0] if self._last_result else None,
+            "last_result": (datetime.fromtimestamp(self._last_result[1]).isoformat(timespec="seconds")
+                            if self._last_result else None),
+            "latency_s": percentiles(self._latency),        # file mtime -> rows flushed, last LATENCY_WINDOW frames
+            "processing_s": percentiles(self._processing),  # of which spent in the pipeline and writer
+        }
+
+        tmp = self.status_path.with_name(f"{self.status_path.name}.tmp")
+        tmp.write_text(json.dumps(status, indent=2), encoding="utf-8")
+        os.replace(tmp, self.status_path)
+        self._status_at = time.monotonic()
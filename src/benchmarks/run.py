@@ -0,0 +1,331 @@
+"""Throughput benchmarks on synthetic field frames; run from ``src`` as ``python -m benchmarks.run``
+(see Benchmarks in the README)."""
+from dataclasses import replace
+from pathlib import Path
+import argparse
+import csv
+import json
+import logging
+import multiprocessing as mp
+import os
+import platform
+import queue
+import shutil
+import sys
+import time
+import tracemalloc
+import cv2
+import numpy as np
+from benchmarks.synthetic import write_dataset
+from config.settings import ProjectConfig, value_columns
+from domain.entities import DecodedImage, GreennessMeasurement, PatchRegion
+from domain.measurements import MeasurementBuffer
+from domain.exceptions import PipelineError
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+BENCH_ROOT = Path(__file__).resolve().parents[2] / "results" / "benchmarks"
+
+
+def _peak_rss_mb(who=None) -> float:
+    if resource is None:
+        return float("nan")
+    return resource.getrusage(resource.RUSAGE_SELF if who is None else who).ru_maxrss / 1024
+
+
+def _timings(samples_s: list[float], peak_bytes: int) -> dict:
+    ms = np.asarray(samples_s) * 1000
+    return {"calls": len(ms), "mean_ms": float(ms.mean()), "p50_ms": float(np.percentile(ms, 50)),
+            "p95_ms": float(np.percentile(ms, 95)), "peak_heap_mb": peak_bytes / 2**20}
+
+
+def _time_call(fn, repeat: int) -> dict:
+    """Wall time of ``fn()`` over ``repeat`` calls and the peak Python/numpy heap it allocates."""
+    fn()  # warm-up: lazy model loads, LUTs and scratch buffers
+    samples = []
+    tracemalloc.start()
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return _timings(samples, peak)
+
+
+def bench_ports(config: ProjectConfig, frames: list[Path], repeat: int) -> dict:
+    """Time each port of one pipeline on already-decoded inputs, cycling through ``frames``."""
+    from main import build_pipeline
+    from infrastructure.csv_writer import CsvResultWriter
+
+    pipeline = build_pipeline(config)
+    try:
+        # inputs for the later stages come from running the earlier ones once per frame
+        inputs = []
+        for path in frames:
+            frame = pipeline.loader.load(path)
+            try:
+                swatches, quad = pipeline.checker_detector.detect(frame)
+            except PipelineError as e:
+                logger.warning(f"{path.name}: {e.message}; left out of the port benchmarks.")
+                continue
+            mask = pipeline.leaf_segmentor.mask(frame.bgr, quad)
+            calibrated = pipeline.calibrator.calibrate(frame, swatches)
+            inputs.append((path, frame.bgr, swatches, quad, mask, calibrated))
+        if not inputs:
+            raise RuntimeError("No synthetic frame had a detectable colour checker.")
+
+        def cycle():
+            i = 0
+            while True:
+                yield inputs[i % len(inputs)]
+                i += 1
+
+        def each(fn):
+            it = cycle()
+            return lambda: fn(*next(it))
+
+        patch = PatchRegion(x=0, y=0, w=1, h=1, patch_id=0)
+        rows = MeasurementBuffer.of(
+            [GreennessMeasurement(image_path=path, folder_name="bench", lat=0.0, long=0.0, patch_id=0,
+                                  patch_region=patch, greenness_value=0.0) for path, *_ in inputs],
+            pipeline.greenness_calc.columns)
+        writer_dir = BENCH_ROOT / "tmp_writer"
+        writer = CsvResultWriter(writer_dir / "out.csv", value_columns=pipeline.greenness_calc.columns)
+        writer.open()
+        try:
+            results = {
+                "load": _time_call(each(lambda p, *_: pipeline.loader.load(p)), repeat),
+                # fresh DecodedImage every call so its cached colour-space views are rebuilt as in a run
+                "detect_checker": _time_call(
+                    each(lambda p, bgr, *_: pipeline.checker_detector.detect(DecodedImage(p, bgr))), repeat),
+                "segment": _time_call(each(lambda p, bgr, sw, quad, *_: pipeline.leaf_segmentor.mask(bgr, quad)),
+                                      repeat),
+                "calibrate": _time_call(
+                    each(lambda p, bgr, sw, *_: pipeline.calibrator.calibrate(DecodedImage(p, bgr), sw,
+                                                                               session=object())), repeat),
+                "select_patches": _time_call(
+                    each(lambda p, bgr, sw, quad, mask, cal: pipeline.patch_selector.select_patches(
+                        cal, quad, config.num_patches_per_image, mask=mask)), repeat),
+                "greenness_index": _time_call(
+                    each(lambda p, bgr, sw, quad, mask, cal: pipeline.greenness_calc.compute_all(cal, mask)), repeat),
+                "write": _time_call(lambda: writer.write(rows), repeat),
+            }
+        finally:
+            writer.close()
+            shutil.rmtree(writer_dir, ignore_errors=True)
+    finally:
+        pipeline.close()
+
+    return results
+
+
+def _run_dataset(config: ProjectConfig, out: mp.Queue) -> None:
+    """Child process body: one end-to-end run, reported back through ``out``."""
+    # the service's progress output (and its final screen clear) would garble the benchmark log
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, sys.stdout.fileno())
+    logging.basicConfig(level=logging.ERROR)
+    from main import build_pipeline
+    from functools import partial
+    from application.services import DatasetProcessingService
+    from application.profiling import StageProfiler
+    from infrastructure.csv_writer import CsvResultWriter
+    from infrastructure.file_discovery import FolderDatasetDiscovery
+
+    factory = partial(build_pipeline, config)
+    service = DatasetProcessingService(
+        discovery=FolderDatasetDiscovery(),
+        pipeline=factory() if config.num_workers == 1 else None,
+        writer=CsvResultWriter(config.output_csv,
+                               value_columns=value_columns(config.green_indices, config.green_stats)),
+        workers=config.num_workers,
+        pipeline_factory=factory,
+        profiler=StageProfiler(enabled=True),
+    )
+
+    start = time.perf_counter()
+    service.run(config.input_root)
+    seconds = time.perf_counter() - start
+
+    summary = service.profiler.summary()
+    with config.output_csv.open(newline="", encoding="utf-8") as f:
+        measured = len({row["image_path"] for row in csv.DictReader(f)})
+    out.put({
+        "images": summary["images"],
+        "failed_images": summary["images"] - measured,
+        "seconds": seconds,
+        "images_per_s": summary["images"] / seconds if seconds else 0.0,
+        "stage_ms": {name: stats["wall_s"]["p50"] * 1000 for name, stats in summary["run"].items()},
+        "peak_rss_mb": max(_peak_rss_mb(), _peak_rss_mb(resource.RUSAGE_CHILDREN) if resource else 0.0),
+    })
+
+
+def bench_end_to_end(config: ProjectConfig, root: Path) -> dict:
+    """Run the service on ``root`` in a fresh process, so peak RSS belongs to this run alone."""
+    out_dir = root.parent.parent / f"{root.parent.name}_out"
+    shutil.rmtree(out_dir, ignore_errors=True)
+    config = replace(config, input_root=root, output_csv=out_dir / "out.csv", output_figure=out_dir)
+
+    ctx = mp.get_context("spawn")
+    out = ctx.Queue()
+    proc = ctx.Process(target=_run_dataset, args=(config, out))
+    proc.start()
+    try:
+        while True:
+            try:
+                result = out.get(timeout=1.0)
+                break
+            except queue.Empty:
+                if not proc.is_alive():
+                    proc.join()
+                    raise RuntimeError(f"End-to-end run on {root} exited with code {proc.exitcode} "
+                                       f"without a result") from None
+        proc.join()
+    finally:
+        if proc.is_alive():
+            proc.terminate()
+            proc.join()
+        shutil.rmtree(out_dir, ignore_errors=True)
+    return result
+
+
+def _flatten(report: dict) -> dict[str, tuple[float, bool]]:
+    """metric name -> (value, higher_is_better) for every number that is compared against the baseline."""
+    metrics = {}
+    for port, stats in report.get("ports", {}).items():
+        metrics[f"ports.{port}.p50_ms"] = (stats["p50_ms"], False)
+    for size, run in report.get("end_to_end", {}).items():
+        metrics[f"end_to_end.{size}.images_per_s"] = (run["images_per_s"], True)
+        metrics[f"end_to_end.{size}.peak_rss_mb"] = (run["peak_rss_mb"], False)
+        for stage, ms in run["stage_ms"].items():
+            metrics[f"end_to_end.{size}.stage_ms.{stage}"] = (ms, False)
+    return metrics
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Metrics that are worse than the baseline by more than ``tolerance`` (relative)."""
+    regressions = []
+    current = _flatten(report)
+    for name, (base, higher_is_better) in _flatten(baseline).items():
+        if name not in current or not base:
+            continue
+        value = current[name][0]
+        change = (value - base) / base
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append(f"{name}: {base:.3f} -> {value:.3f} ({change:+.1%})")
+    return regressions
+
+
+def environment() -> dict:
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            "numpy": np.__version__, "opencv": cv2.__version__}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Cotton greenness pipeline benchmarks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 100, 10000],
+                        help="Dataset sizes for the end-to-end runs (0 or none to skip them)")
+    parser.add_argument("--width", type=int, default=1856)
+    parser.add_argument("--height", type=int, default=1024)
+    parser.add_argument("--folders", type=int, default=4, help="Plot folders per dataset")
+    parser.add_argument("--repeat", type=int, default=20, help="Calls per port in the isolated benchmarks")
+    parser.add_argument("--skip-ports", action="store_true")
+    parser.add_argument("--segment-method", type=str, default="nexg")
+    parser.add_argument("--green-indx", type=str, default="ngrdi", help="Comma-separated, as for main.py")
+    parser.add_argument("--green-stats", type=str, default="median", help="Comma-separated, as for main.py")
+    parser.add_argument("--num-patches", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--checker-tracking", action="store_true")
+    parser.add_argument("--data-dir", type=str, default=str(BENCH_ROOT / "data"),
+                        help="Where synthetic datasets are generated and reused; must be inside the repository")
+    parser.add_argument("--output", type=str, default=str(BENCH_ROOT / "latest.json"))
+    parser.add_argument("--baseline", type=str, default=str(BENCH_ROOT / "baseline.json"))
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="Relative slow-down (or memory growth) reported as a regression")
+    return parser.parse_args()
+
+
+def main() -> int:
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s | %(name)s | %(message)s")
+    args = parse_args()
+    data_dir = Path(args.data_dir).resolve()
+    indices = args.green_indx.split(",")
+
+    config = ProjectConfig(
+        input_root=data_dir,
+        output_csv=data_dir / "out.csv",
+        output_figure=data_dir,
+        segment_method=args.segment_method,
+        green_indx=indices[0],
+        green_indices=tuple(indices),
+        green_stats=tuple(args.green_stats.split(",")),
+        num_patches_per_image=args.num_patches,
+        num_workers=max(1, args.workers),
+        checker_tracking=args.checker_tracking,
+        profile=True,
+    )
+    sizes = [s for s in args.sizes if s > 0]
+    report = {"environment": environment(), "resolution": [args.width, args.height],
+              "config": {"segment_method": args.segment_method, "green_indx": args.green_indx,
+                         "green_stats": args.green_stats,
+                         "num_patches": args.num_patches, "workers": config.num_workers,
+                         "checker_tracking": args.checker_tracking}}
+
+    if not args.skip_ports:
+        root = write_dataset(data_dir / f"ports_{args.width}x{args.height}", num_images=8,
+                             width=args.width, height=args.height)
+        frames = sorted((root / "frames").glob("*.png"))
+        logger.info(f"Timing ports on {len(frames)} frames, {args.repeat} calls each.")
+        report["ports"] = bench_ports(config, frames, args.repeat)
+        for port, stats in report["ports"].items():
+            logger.info(f"  {port:<16} p50 {stats['p50_ms']:9.2f} ms  p95 {stats['p95_ms']:9.2f} ms  "
+                        f"heap {stats['peak_heap_mb']:8.1f} MB")
+
+    report["end_to_end"] = {}
+    for size in sizes:
+        root = write_dataset(data_dir / f"e2e_{size}_{args.width}x{args.height}", num_images=size,
+                             width=args.width, height=args.height, folders=min(args.folders, size))
+        logger.info(f"End-to-end run on {size} images ...")
+        run = bench_end_to_end(config, root / "ImageData")
+        report["end_to_end"][str(size)] = run
+        stages = ", ".join(f"{k} {v:.1f}" for k, v in run["stage_ms"].items())
+        logger.info(f"  {run['images_per_s']:.2f} images/s, peak RSS {run['peak_rss_mb']:.0f} MB, "
+                    f"{run['failed_images']} images without a result; p50 ms/stage: {stages}")
+
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    logger.info(f"Report written to {output}.")
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(output, baseline_path)
+        logger.info(f"Baseline stored in {baseline_path}.")
+        return 0
+
+    if not baseline_path.exists():
+        logger.info("No baseline to compare against; store one with --save-baseline.")
+        return 0
+
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    if any(baseline.get(key) != report[key] for key in ("environment", "resolution", "config")):
+        logger.warning("Baseline was recorded with a different environment or configuration; "
+                       "differences may not be regressions.")
+    regressions = compare(report, baseline, args.tolerance)
+    for line in regressions:
+        logger.error(f"REGRESSION {line}")
+    if not regressions:
+        logger.info(f"No regressions beyond {args.tolerance:.0%} against {baseline_path}.")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
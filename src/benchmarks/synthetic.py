@@ -0,0 +1,129 @@
+from pathlib import Path
+import os
+import shutil
+import cv2
+import numpy as np
+from infrastructure.color_calibration import SimpleColorCalibrator
+
+
+def srgb_encode(linear: np.ndarray) -> np.ndarray:
+    linear = np.clip(linear, 0.0, 1.0)
+    return np.where(linear <= 0.0031308, 12.92 * linear, 1.055 * np.power(linear, 1 / 2.4) - 0.055)
+
+
+def reference_chart_bgr(swatch_px: int = 60, gap_px: int = 10) -> np.ndarray:
+    """ColorChecker24 drawn from the calibrator's reference swatches: 4 x 6 squares on a black card
+    mounted on a grey board, which keeps the card outline clear of the canopy."""
+    calibrator = SimpleColorCalibrator()
+    rows, cols = calibrator.colour_checker_rows, calibrator.colour_checker_columns
+    colours = np.round(srgb_encode(np.asarray(calibrator.REFERENCE_SWATCHES)) * 255).astype(np.uint8)[:, ::-1]
+
+    pitch = swatch_px + gap_px
+    card = np.full((rows * pitch + gap_px, cols * pitch + gap_px, 3), 18, np.uint8)
+    for i, bgr in enumerate(colours):
+        r, c = divmod(i, cols)
+        y, x = gap_px + r * pitch, gap_px + c * pitch
+        card[y:y + swatch_px, x:x + swatch_px] = bgr
+    return cv2.copyMakeBorder(card, 2 * gap_px, 2 * gap_px, 2 * gap_px, 2 * gap_px, cv2.BORDER_CONSTANT,
+                              value=(150, 150, 150))
+
+
+def render_frame(width: int = 1856, height: int = 1024, seed: int = 0, chart_fraction: float = 0.3,
+                 leaf_cover: float = 0.45) -> np.ndarray:
+    """One BGR field frame: soil, overlapping green leaves with veins and shading, and a slightly rotated
+    colour checker spanning ``chart_fraction`` of the width."""
+    rng = np.random.default_rng(seed)
+
+    # soil: brown with low-frequency shading and pixel noise
+    shade = cv2.resize(rng.normal(0, 12, (height // 64 + 2, width // 64 + 2)).astype(np.float32), (width, height),
+                       interpolation=cv2.INTER_CUBIC)
+    frame = np.empty((height, width, 3), np.float32)
+    frame[:] = (60, 85, 115)
+    frame += shade[:, :, None] + rng.normal(0, 6, (height, width, 1)).astype(np.float32)
+
+    # leaves: filled ellipses until the requested share of the frame is covered
+    leaves = np.zeros((height, width), np.uint8)
+    scale = min(width, height)
+    while np.count_nonzero(leaves) < leaf_cover * width * height:
+        centre = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        axes = (int(scale * rng.uniform(0.04, 0.12)), int(scale * rng.uniform(0.03, 0.09)))
+        angle = float(rng.uniform(0, 180))
+        colour = (rng.uniform(20, 60), rng.uniform(110, 190), rng.uniform(40, 100))
+        cv2.ellipse(frame, centre, axes, angle, 0, 360, colour, -1, cv2.LINE_AA)
+        cv2.ellipse(frame, centre, (axes[0], 1), angle, 0, 360, (colour[0] + 30, colour[1] + 40, colour[2] + 30),
+                    max(1, scale // 400), cv2.LINE_AA)
+        cv2.ellipse(leaves, centre, axes, angle, 0, 360, 255, -1)
+
+    leaf_shade = rng.normal(0, 8, (height, width, 1)).astype(np.float32)
+    frame += np.where(leaves[:, :, None] > 0, leaf_shade, 0)
+
+    # colour checker, slightly rotated, pasted over the scene
+    card = reference_chart_bgr()
+    card_w = int(width * chart_fraction)
+    card = cv2.resize(card, (card_w, card_w * card.shape[0] // card.shape[1]), interpolation=cv2.INTER_AREA)
+    ch, cw = card.shape[:2]
+    diag = int(np.ceil(np.hypot(ch, cw)))
+    if diag >= min(width, height):
+        raise ValueError(f"chart_fraction {chart_fraction} is too large for a {width}x{height} frame")
+
+    x0 = int(rng.integers(0, width - diag))
+    y0 = int(rng.integers(0, height - diag))
+    rot = cv2.getRotationMatrix2D((cw / 2, ch / 2), float(rng.uniform(-8, 8)), 1.0)
+    rot[:, 2] += (diag - cw) / 2, (diag - ch) / 2
+    warped = cv2.warpAffine(card, rot, (diag, diag), flags=cv2.INTER_LINEAR)
+    inside = cv2.warpAffine(np.full((ch, cw), 255, np.uint8), rot, (diag, diag), flags=cv2.INTER_NEAREST) > 0
+
+    region = frame[y0:y0 + diag, x0:x0 + diag]
+    region[inside] = warped[inside]
+
+    return np.clip(frame, 0, 255).astype(np.uint8)
+
+
+def write_dataset(root: Path, num_images: int, width: int = 1856, height: int = 1024, folders: int = 1,
+                  unique_frames: int = 8, seed: int = 0, start_seconds: int = 10 * 3600) -> Path:
+    """Write ``root/ImageData/<folder>/*.png`` frames, hard links to ``unique_frames`` distinct ones, and their
+    ``root/GPSData/<folder>/gps.csv``; an existing dataset with the same image count is reused."""
+    root = Path(root)
+    per_folder = np.array_split(np.arange(num_images), max(1, folders))
+    done_marker = root / f".complete_{num_images}_{width}x{height}_{folders}_{seed}"
+    if done_marker.exists():
+        return root
+    if root.exists():
+        shutil.rmtree(root)
+
+    sources = []
+    for i in range(min(unique_frames, num_images)):
+        path = root / "frames" / f"frame_{i:03d}.png"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        cv2.imwrite(str(path), render_frame(width, height, seed=seed + i))
+        sources.append(path)
+
+    for f, indices in enumerate(per_folder):
+        if len(indices) == 0:
+            continue
+        name = f"plot_{f:03d}"
+        image_dir = root / "ImageData" / name
+        gps_dir = root / "GPSData" / name
+        image_dir.mkdir(parents=True, exist_ok=True)
+        gps_dir.mkdir(parents=True, exist_ok=True)
+
+        t0 = start_seconds + f * 3600
+        for k, i in enumerate(indices):
+            t = t0 + 0.5 * k
+            whole, micro = int(t), int(round((t - int(t)) * 1e6))
+            target = image_dir / f"{whole // 3600:02d}_{whole // 60 % 60:02d}_{whole % 60:02d}_{micro:06d}.png"
+            source = sources[i % len(sources)]
+            try:
+                os.link(source, target)
+            except OSError:
+                shutil.copyfile(source, target)
+
+        duration = int(np.ceil(0.5 * len(indices))) + 2
+        with (gps_dir / "gps.csv").open("w", encoding="utf-8") as fh:
+            for s in range(duration):
+                t = t0 + s
+                fh.write(f"{-88.850 - 1e-5 * s:.8f},{35.632 + 1e-5 * s + 1e-3 * f:.8f},"  # same column order as the field logs
+                         f"{t // 3600:02d}:{t // 60 % 60:02d}:{t % 60:02d}\n")
+
+    done_marker.touch()
+    return root
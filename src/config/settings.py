@@ -1,20 +1,39 @@
 from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Iterable
 import logging
-import torch
+
+
+INDICES = ("bgr", "exg", "ngrdi", "vari", "gli")  # "bgr" is the historical name of ExG
+STATS = ("median", "mean", "std", "min", "max", "pNN")
+
+
+def value_columns(indices: Iterable[str], stats: Iterable[str]) -> list[str]:
+    """Extra output columns for the given indices and statistics; the median of the
+    first index is ``greenness_value`` and has no column of its own."""
+    indices, stats = list(dict.fromkeys(indices)), list(dict.fromkeys(stats))
+    columns = [f"{index}_{stat}" for index in indices for stat in stats]
+    return [c for c in columns if c != f"{indices[0]}_median"] if indices else columns
+
+
+def valid_stat(stat: str) -> bool:
+    if stat in STATS[:-1]:
+        return True
+    return stat[:1] == "p" and stat[1:].replace(".", "", 1).isdigit() and 0 <= float(stat[1:]) <= 100
 
 
 @dataclass
 class SamLeafSegConfig:
     model_type: str = "vit_h"
     checkpoint_path: str = r"./dlModel/sam_vit_h_4b8939.pth"
-    device: str = "cuda" if torch.cuda.is_available() else "cpu"
+    device: str = "auto"  # cuda when available, else cpu; resolved when the model is loaded
 
-    points_per_side: int = 32
+    embed_max_side: int = 1024      # frames are downscaled to this longest side before embedding
+    seed_grid: int = 12             # at most seed_grid x seed_grid point prompts, seeded from the HSV mask
+    points_per_batch: int = 64
     pred_iou_thresh: float = 0.88
     stability_score_thresh: float = 0.92
-    crop_n_layers: int = 1
-    min_mask_region_area: int = 400
+    min_mask_region_area: int = 400  # in full-resolution pixels
 
     min_area_frac: float = 0.002
     max_area_frac: float = 0.80
@@ -31,12 +50,43 @@ class ProjectConfig:
     segment_method: str
     green_indx: str
     num_patches_per_image: int = 1
+    patch_fraction: float = 0.25
+    tile_memory_mb: int = 0  # 0 = whole-frame processing
+    green_indices: tuple[str, ...] = ()
+    green_stats: tuple[str, ...] = ("median",)
+    num_workers: int = 1
+    prefetch: int = 0
+    prefetch_mb: int = 512
+    shard_index: int = 0
+    shard_count: int = 1
+    shard_by: str = "folder"
+    folder_batch: int = 0  # checker probe frames per folder; 0 = every frame on its own
+    watch: bool = False
+    watch_polling: bool = False
+    watch_interval: float = 1.0
+    watch_settle: float = 2.0
+    watch_queue: int = 64
+    watch_gps_wait: float = 30.0
+    watch_idle_exit: float = 0.0  # 0 = run until stopped
+    watch_status: Path | None = None
+    output_format: str = "csv"
+    max_samples: int | None = None
+    resume: bool = False
+    gps_interpolate: bool = False
+    checker_tracking: bool = False
+    checker_proxy_width: int = 0
+    ccm_tolerance: float = 0.0
+    profile: bool = False
+    profile_top_n: int = 0
+    cache_dir: Path | None = None
+    cache_max_gb: float = 10.0
+    cache_key: str = "stat"
 
     sam_config: SamLeafSegConfig = field(default_factory=SamLeafSegConfig)
 
 
-def setup_logging(path: Path, level=logging.INFO):
-    path = path.parent / 'run.log'
+def setup_logging(path: Path, level=logging.INFO, name: str = 'run.log'):
+    path = path.parent / name
     path.parent.mkdir(parents=True, exist_ok=True)
     logging.basicConfig(
         level=level,
@@ -1,5 +1,25 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from functools import cache, cached_property
 from pathlib import Path
+import hashlib
+import numpy as np
+
+
+# 8-bit code value -> float in [0, 1] (same rounding as colour.io.read_image) and -> linear sRGB.
+_UINT8_TO_FLOAT = (np.arange(256) / 255).astype(np.float32)
+_UINT8_TO_LINEAR = np.where(_UINT8_TO_FLOAT <= 0.04045,
+                            _UINT8_TO_FLOAT / 12.92,
+                            ((_UINT8_TO_FLOAT.astype(np.float64) + 0.055) / 1.055) ** 2.4)
+
+
+@cache
+def _uint16_tables() -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """16-bit code value -> 8-bit code value, float in [0, 1] and linear sRGB; built on first use."""
+    code = np.arange(65536)
+    to_float = (code / 65535).astype(np.float32)
+    to_linear = np.where(to_float <= 0.04045, to_float / 12.92,
+                         ((to_float.astype(np.float64) + 0.055) / 1.055) ** 2.4)
+    return np.round(code / 257).astype(np.uint8), to_float, to_linear
 
 
 @dataclass(frozen=True)
@@ -37,3 +57,114 @@ class GreennessMeasurement:
     patch_id: int
     patch_region: PatchRegion
     greenness_value: float
+    values: dict[str, float] = field(default_factory=dict, hash=False)  # extra index/statistic columns
+
+
+@dataclass(frozen=True, eq=False)
+class FolderCalibration:
+    """Checker position, swatches and colour-correction matrix shared by every frame of a folder."""
+    quad: np.ndarray
+    swatches: np.ndarray
+    matrix: np.ndarray
+    probes: int      # frames the checker was searched in
+    agreeing: int    # of which found it at the common position
+
+
+@dataclass(frozen=True)
+class PlotSummary:
+    """Greenness of one plot folder over its frames; a frame's value is the median over its patches."""
+    folder_name: str
+    folder_path: Path
+    frames: int
+    failed: int
+    redetected: int  # frames that searched for the checker on their own instead of using the folder's
+    lat: float
+    long: float
+    greenness_mean: float
+    greenness_median: float
+    greenness_iqr: float
+
+
+class DecodedImage:
+    """A frame decoded once and shared by every stage; the float views are derived from ``bgr`` on first use.
+    Sixteen-bit frames keep ``bgr_full``, from which the float views are taken at full precision."""
+
+    def __init__(self, path: Path, bgr: np.ndarray, bgr_full: np.ndarray | None = None):
+        self.path = path
+        self.bgr = bgr
+        self.bgr_full = bgr_full
+
+    @classmethod
+    def from_decoded(cls, path: Path, img: np.ndarray) -> "DecodedImage":
+        """Wrap a BGR frame decoded with IMREAD_ANYDEPTH | IMREAD_COLOR."""
+        if img.dtype == np.uint16:
+            return cls(path, _uint16_tables()[0][img], bgr_full=img)
+        if img.dtype != np.uint8:  # 32-bit float TIFF
+            img = np.clip(np.round(img.astype(np.float32) * 255), 0, 255).astype(np.uint8)
+        return cls(path, img)
+
+    @property
+    def shape(self) -> tuple[int, ...]:
+        return self.bgr.shape
+
+    @cached_property
+    def rgb(self) -> np.ndarray:
+        """RGB float32 in [0, 1], as returned by colour.io.read_image."""
+        if self.bgr_full is not None:
+            return _uint16_tables()[1][self.bgr_full[:, :, ::-1]]
+        return _UINT8_TO_FLOAT[self.bgr[:, :, ::-1]]
+
+    @cached_property
+    def linear_rgb(self) -> np.ndarray:
+        """Linear RGB float64, as returned by colour.cctf_decoding on the RGB view."""
+        if self.bgr_full is not None:
+            return _uint16_tables()[2][self.bgr_full[:, :, ::-1]]
+        return _UINT8_TO_LINEAR[self.bgr[:, :, ::-1]]
+
+    def drop_views(self) -> None:
+        """Free the cached float views; they are rebuilt if accessed again."""
+        self.__dict__.pop("rgb", None)
+        self.__dict__.pop("linear_rgb", None)
+
+    def linear_rgb_region(self, x0: int, y0: int, x1: int, y1: int) -> np.ndarray:
+        """Linear RGB of a rectangle, without linearising the whole frame."""
+        if "linear_rgb" in self.__dict__:
+            return self.linear_rgb[y0:y1, x0:x1]
+        if self.bgr_full is not None:
+            return _uint16_tables()[2][self.bgr_full[y0:y1, x0:x1, ::-1]]
+        return _UINT8_TO_LINEAR[self.bgr[y0:y1, x0:x1, ::-1]]
+
+
+SHARD_BY = ("folder", "path")
+
+
+@dataclass(frozen=True)
+class ShardSpec:
+    """One of ``count`` deterministic shards, by a hash of each image's folder or path relative to the root."""
+
+    index: int = 0
+    count: int = 1
+    by: str = "folder"
+
+    def __post_init__(self):
+        if self.by not in SHARD_BY:
+            raise ValueError(f"Unknown shard key {self.by!r}; expected one of {', '.join(SHARD_BY)}")
+        if not 0 <= self.index < self.count:
+            raise ValueError(f"Shard index {self.index} is outside 0..{self.count - 1}")
+
+    @property
+    def tag(self) -> str:
+        return f"shard-{self.index}-of-{self.count}"
+
+    def shard_of(self, path: Path, root: Path) -> int:
+        relative = Path(path).relative_to(root)
+        key = relative.parent if self.by == "folder" else relative
+        digest = hashlib.sha1(key.as_posix().encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "big") % self.count
+
+    def contains(self, path: Path, root: Path) -> bool:
+        return self.count == 1 or self.shard_of(path, root) == self.index
+
+    def output_path(self, path: Path) -> Path:
+        """``out.csv`` -> ``out.shard-<i>-of-<n>.csv``; unchanged for an unsharded run."""
+        return path if self.count == 1 else path.with_name(f"{path.stem}.{self.tag}{path.suffix}")
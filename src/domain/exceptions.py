@@ -17,4 +17,7 @@ class PipelineError(Exception):
 
     def __str__(self):
         return f'{self.step}: {self.message}'
+
+    def __reduce__(self):
+        return (self.__class__, (self.message, self.step, self.image_path, self.error_type))
     
@@ -0,0 +1,328 @@
+from pathlib import Path
+from typing import Iterable, Iterator, Sequence
+import numpy as np
+from .entities import GreennessMeasurement, ImageSample, PatchRegion
+
+
+_FIELDS = [
+    ("image", np.int32),   # index into the interned image paths
+    ("folder", np.int32),  # index into the interned folder names
+    ("lat", np.float64),
+    ("long", np.float64),
+    ("patch_id", np.int32),
+    ("x", np.int32),
+    ("y", np.int32),
+    ("w", np.int32),
+    ("h", np.int32),
+    ("greenness_value", np.float64),
+]
+
+
+class MeasurementRow:
+    """One row of a MeasurementBuffer, read through the attributes of GreennessMeasurement."""
+
+    __slots__ = ("_buffer", "_index")
+
+    def __init__(self, buffer: "MeasurementBuffer", index: int):
+        self._buffer = buffer
+        self._index = index
+
+    @property
+    def image_path(self) -> Path:
+        return Path(self._buffer._paths[self._buffer._rows["image"][self._index]])
+
+    @property
+    def folder_name(self) -> str:
+        return self._buffer._folders[self._buffer._rows["folder"][self._index]]
+
+    @property
+    def lat(self) -> float:
+        return float(self._buffer._rows["lat"][self._index])
+
+    @property
+    def long(self) -> float:
+        return float(self._buffer._rows["long"][self._index])
+
+    @property
+    def patch_id(self) -> int:
+        return int(self._buffer._rows["patch_id"][self._index])
+
+    @property
+    def patch_region(self) -> PatchRegion:
+        row = self._buffer._rows[self._index]
+        return PatchRegion(x=int(row["x"]), y=int(row["y"]), w=int(row["w"]), h=int(row["h"]),
+                           patch_id=int(row["patch_id"]))
+
+    @property
+    def greenness_value(self) -> float:
+        return float(self._buffer._rows["greenness_value"][self._index])
+
+    @property
+    def values(self) -> dict[str, float]:
+        row = self._buffer._rows[self._index]
+        return {name: float(row[name]) for name in self._buffer.value_columns}
+
+    def to_measurement(self) -> GreennessMeasurement:
+        return GreennessMeasurement(image_path=self.image_path, folder_name=self.folder_name, lat=self.lat,
+                                    long=self.long, patch_id=self.patch_id, patch_region=self.patch_region,
+                                    greenness_value=self.greenness_value, values=self.values)
+
+
+class MeasurementBuffer:
+    """Measurements as rows of one NumPy structured array, with image paths and folder names
+    interned. Iterating yields MeasurementRow views; bulk consumers read ``column``."""
+
+    CHUNK_ROWS = 4096
+
+    def __init__(self, value_columns: Iterable[str] = (), capacity: int = 0):
+        self.value_columns = list(value_columns)
+        self.dtype = np.dtype(_FIELDS + [(name, np.float64) for name in self.value_columns])
+        self._rows = np.empty(capacity, dtype=self.dtype)
+        self._n = 0
+        self._paths: list[str] = []
+        self._folders: list[str] = []
+        self._path_ids: dict[str, int] = {}
+        self._folder_ids: dict[str, int] = {}
+
+    @classmethod
+    def for_image(cls, sample: ImageSample, patches: list[PatchRegion],
+                  results: list[tuple[float, dict[str, float]]]) -> "MeasurementBuffer":
+        """The measurements of one image: one row per patch and its (greenness_value, values) result."""
+        buffer = cls(list(results[0][1]) if results else (), capacity=len(patches))
+        rows = buffer._reserve(len(patches))
+        rows["image"] = buffer._intern_path(str(sample.path))
+        rows["folder"] = buffer._intern_folder(sample.folder_name)
+        rows["lat"] = sample.lat
+        rows["long"] = sample.long
+        for field in ("patch_id", "x", "y", "w", "h"):
+            rows[field] = [getattr(patch, field) for patch in patches]
+        rows["greenness_value"] = [value for value, _ in results]
+        for name in buffer.value_columns:
+            rows[name] = [values.get(name, np.nan) for _, values in results]
+        return buffer
+
+    @classmethod
+    def of(cls, measurements: "MeasurementBuffer | Iterable[GreennessMeasurement]",
+           value_columns: Iterable[str] = ()) -> "MeasurementBuffer":
+        """``measurements`` itself if it is a buffer, else a buffer holding a copy of them."""
+        if isinstance(measurements, MeasurementBuffer):
+            return measurements
+        buffer = cls(value_columns)
+        buffer.extend(measurements)
+        return buffer
+
+    @classmethod
+    def from_columns(cls, columns: dict[str, Sequence], value_columns: Iterable[str] = ()) -> "MeasurementBuffer":
+        """A buffer from whole columns named as in the output (``folder_name``, ``image_path``,
+        ``lat``, ..., ``greenness_value`` and the ``value_columns``), e.g. as read back from it."""
+        buffer = cls(value_columns)
+        rows = buffer._reserve(len(columns["image_path"]))
+        rows["image"] = [buffer._intern_path(str(p)) for p in columns["image_path"]]
+        rows["folder"] = [buffer._intern_folder(f) for f in columns["folder_name"]]
+        for name in ("lat", "long", "patch_id", "x", "y", "w", "h", "greenness_value", *buffer.value_columns):
+            rows[name] = np.asarray(columns[name]).astype(buffer.dtype[name])
+        return buffer
+
+    @classmethod
+    def concat(cls, buffers: Iterable["MeasurementBuffer"]) -> "MeasurementBuffer":
+        buffers = [b for b in buffers if len(b)]
+        result = cls(buffers[0].value_columns if buffers else (), capacity=sum(len(b) for b in buffers))
+        for b in buffers:
+            result.extend(b)
+        return result
+
+    def __len__(self) -> int:
+        return self._n
+
+    def __iter__(self) -> Iterator[MeasurementRow]:
+        return (MeasurementRow(self, i) for i in range(self._n))
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self._view(self._rows[:self._n][key])
+        index = range(self._n)[key]  # bounds check and negative indices
+        return MeasurementRow(self, index)
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state["_rows"] = self._rows[:self._n]
+        del state["_path_ids"], state["_folder_ids"]  # rebuilt from the lists
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._path_ids = {p: i for i, p in enumerate(self._paths)}
+        self._folder_ids = {f: i for i, f in enumerate(self._folders)}
+
+    def column(self, name: str) -> np.ndarray:
+        """A read-only view of one column; ``image`` and ``folder`` hold interned ids."""
+        view = self._rows[name][:self._n]
+        view.flags.writeable = False
+        return view
+
+    def image_paths(self) -> list[str]:
+        return np.asarray(self._paths, dtype=object)[self._rows["image"][:self._n]].tolist() if self._n else []
+
+    def folder_names(self) -> list[str]:
+        return np.asarray(self._folders, dtype=object)[self._rows["folder"][:self._n]].tolist() if self._n else []
+
+    def by_folder(self) -> list[tuple[str, "MeasurementBuffer"]]:
+        """The rows of every folder, in order of first appearance, as buffers sharing the interned strings."""
+        return [(self._folders[f], rows) for f, rows in self._groups("folder")]
+
+    def by_image(self) -> list[tuple[str, "MeasurementBuffer"]]:
+        """The rows of every image, in order of first appearance, as buffers sharing the interned strings."""
+        return [(self._paths[i], rows) for i, rows in self._groups("image")]
+
+    def append(self, measurement: GreennessMeasurement) -> None:
+        self.extend([measurement])
+
+    def extend(self, measurements: "MeasurementBuffer | Iterable[GreennessMeasurement]") -> None:
+        if not isinstance(measurements, MeasurementBuffer):
+            measurements = list(measurements)
+            if not measurements:
+                return
+            rows = self._reserve(len(measurements))
+            rows["image"] = [self._intern_path(str(m.image_path)) for m in measurements]
+            rows["folder"] = [self._intern_folder(m.folder_name) for m in measurements]
+            for field in ("lat", "long", "patch_id", "greenness_value"):
+                rows[field] = [getattr(m, field) for m in measurements]
+            for field in ("x", "y", "w", "h"):
+                rows[field] = [getattr(m.patch_region, field) for m in measurements]
+            for name in self.value_columns:
+                rows[name] = [m.values.get(name, np.nan) for m in measurements]
+            return
+
+        other = measurements
+        if not len(other):
+            return
+        if other.value_columns != self.value_columns:
+            if self._n:
+                raise ValueError(f"Cannot combine measurements with columns {other.value_columns} "
+                                 f"and {self.value_columns}")
+            self.value_columns = list(other.value_columns)
+            self.dtype = other.dtype
+            self._rows = np.empty(0, dtype=self.dtype)
+
+        rows = self._reserve(len(other))
+        rows[...] = other._rows[:other._n]
+        if other._paths is not self._paths:
+            rows["image"] = np.array([self._intern_path(p) for p in other._paths], dtype=np.int32)[rows["image"]]
+        if other._folders is not self._folders:
+            rows["folder"] = np.array([self._intern_folder(f) for f in other._folders], dtype=np.int32)[rows["folder"]]
+
+    def measurements(self) -> list[GreennessMeasurement]:
+        return [row.to_measurement() for row in self]
+
+    def folder_summaries(self) -> dict[str, np.ndarray | list]:
+        """Columns of per-folder statistics of the images' patch medians, in order of first appearance;
+        an image with a NaN patch counts in ``images`` but not in ``measured``."""
+        if not self._n:
+            return {"folder_name": [], **{k: np.empty(0) for k in
+                    ("images", "measured", "lat", "long", "greenness_mean", "greenness_median",
+                     "greenness_q1", "greenness_q3")}}
+        rows = self._rows[:self._n]
+
+        # per image: median over its patches
+        order = np.lexsort((rows["greenness_value"], rows["image"]))
+        values = rows["greenness_value"][order]
+        starts, counts = _segments(rows["image"][order])
+        image_value = _segment_median(values, starts, counts)
+        image_value[np.add.reduceat(np.isnan(values), starts) > 0] = np.nan
+        first = order[starts]
+        image_folder = rows["folder"][first]
+
+        folders, first_seen = np.unique(image_folder, return_index=True)
+        folders = folders[np.argsort(first_seen)]  # order of first appearance
+        slot = np.empty(len(self._folders), dtype=np.intp)
+        slot[folders] = np.arange(len(folders))
+        image_slot = slot[image_folder]
+
+        images = np.bincount(image_slot, minlength=len(folders))
+        lat = np.bincount(image_slot, weights=rows["lat"][first], minlength=len(folders)) / images
+        long = np.bincount(image_slot, weights=rows["long"][first], minlength=len(folders)) / images
+
+        # per folder: statistics of the finite image values
+        finite = np.isfinite(image_value)
+        order = np.lexsort((image_value[finite], image_slot[finite]))
+        values = image_value[finite][order]
+        group_slots = image_slot[finite][order]
+        stats = {name: np.full(len(folders), np.nan) for name in
+                 ("greenness_mean", "greenness_median", "greenness_q1", "greenness_q3")}
+        measured = np.zeros(len(folders), dtype=np.int64)
+        if values.size:
+            starts, counts = _segments(group_slots)
+            present = group_slots[starts]
+            measured[present] = counts
+            stats["greenness_mean"][present] = np.add.reduceat(values, starts) / counts
+            for name, q in (("greenness_q1", 25), ("greenness_median", 50), ("greenness_q3", 75)):
+                stats[name][present] = _segment_percentile(values, starts, counts, q)
+
+        return {"folder_name": [self._folders[f] for f in folders], "images": images, "measured": measured,
+                "lat": lat, "long": long, **stats}
+
+    def _groups(self, field: str) -> list[tuple[int, "MeasurementBuffer"]]:
+        """(id, rows) for every id of an interned ``field``, in order of first appearance."""
+        if not self._n:
+            return []
+        order = np.argsort(self._rows[field][:self._n], kind="stable")
+        grouped = self._rows[:self._n][order]
+        starts, counts = _segments(grouped[field])
+        groups = [(int(grouped[field][start]), self._view(grouped[start:start + count]))
+                  for start, count in zip(starts, counts)]
+        return [groups[i] for i in np.argsort(order[starts], kind="stable")]
+
+    def _view(self, rows: np.ndarray) -> "MeasurementBuffer":
+        view = object.__new__(MeasurementBuffer)
+        view.__dict__.update(self.__dict__)
+        view._rows = rows
+        view._n = len(rows)
+        return view
+
+    def _reserve(self, n: int) -> np.ndarray:
+        """Make room for n more rows and return them (uninitialised)."""
+        needed = self._n + n
+        if needed > len(self._rows):
+            grown = np.empty(max(needed, 2 * len(self._rows), self.CHUNK_ROWS), dtype=self.dtype)
+            grown[:self._n] = self._rows[:self._n]
+            self._rows = grown
+        self._n = needed
+        return self._rows[needed - n:needed]
+
+    def _intern_path(self, path: str) -> int:
+        i = self._path_ids.get(path)
+        if i is None:
+            i = self._path_ids[path] = len(self._paths)
+            self._paths.append(path)
+        return i
+
+    def _intern_folder(self, folder: str) -> int:
+        i = self._folder_ids.get(folder)
+        if i is None:
+            i = self._folder_ids[folder] = len(self._folders)
+            self._folders.append(folder)
+        return i
+
+
+def _segments(keys: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Start and length of every run of equal values in ``keys``."""
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return starts, np.diff(np.r_[starts, len(keys)])
+
+
+def _segment_median(values: np.ndarray, starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """np.median of every sorted segment: the middle value, or the mean of the two middle ones."""
+    lo = values[starts + (counts - 1) // 2]
+    hi = values[starts + counts // 2]
+    return np.where(counts % 2 == 1, lo, (lo + hi) / 2)
+
+
+def _segment_percentile(values: np.ndarray, starts: np.ndarray, counts: np.ndarray, q: float) -> np.ndarray:
+    """np.percentile (linear method) of every sorted segment, with numpy's interpolation formula."""
+    position = (counts - 1) * (q / 100)
+    below = np.floor(position).astype(np.intp)
+    t = position - below
+    a = values[starts + below]
+    b = values[starts + np.minimum(below + 1, counts - 1)]
+    diff = b - a
+    return np.where(t >= 0.5, b - diff * (1 - t), a + diff * t)
@@ -1,21 +1,33 @@
-from typing import Protocol
+from typing import Callable, Hashable, Iterable, Iterator, Protocol
 import numpy as np
 from pathlib import Path
-from .entities import BoundingBox, PatchRegion, GreennessMeasurement, ImageSample
+from .entities import BoundingBox, PatchRegion, GreennessMeasurement, ImageSample, DecodedImage, PlotSummary
+from .measurements import MeasurementBuffer
 
 
 class ImageLoaderPort(Protocol):
-    def load(self, path: Path) -> np.ndarray:
+    def load(self, path: Path) -> DecodedImage:
         ...
 
 
 class ColorCheckerDetectorPort(Protocol):
-    def detect(self, image_path: str) -> tuple[np.ndarray]:
+    def detect(self, image: DecodedImage) -> tuple[np.ndarray, np.ndarray]:
         ...
 
 
 class ColorCalibratorPort(Protocol):
-    def calibrate(self, image: np.ndarray, swatches: np.ndarray) -> np.ndarray:
+    matrix: np.ndarray | None  # colour-correction matrix used by the last calibrate call
+
+    def calibrate(self, image: DecodedImage, swatches: np.ndarray, session: Hashable = None) -> np.ndarray:
+        ...
+
+    def matrix_for(self, swatches: np.ndarray, session: Hashable = None) -> np.ndarray:
+        ...
+
+    def fit_matrix(self, swatches: np.ndarray) -> np.ndarray:
+        ...
+
+    def apply(self, bgr: np.ndarray, matrix: np.ndarray) -> np.ndarray:
         ...
 
 
@@ -24,7 +36,9 @@ class PatchSelectorPort(Protocol):
         self,
         image: np.ndarray,
         checker_bbox: BoundingBox,
-        num_patches: int
+        num_patches: int,
+        mask: np.ndarray | None = None,
+        transform: Callable[[np.ndarray], np.ndarray] | None = None
     ) -> list[PatchRegion]:
         ...
 
@@ -33,9 +47,51 @@ class GreennessIndexCalculatorPort(Protocol):
     def compute(self, patch: np.ndarray, mask: np.ndarray) -> float:
         ...
 
+    def compute_indices(self, patch: np.ndarray, mask: np.ndarray, methods: Iterable[str]) -> dict[str, float]:
+        ...
+
+    def compute_all(self, patch: np.ndarray, mask: np.ndarray) -> tuple[float, dict[str, float]]:
+        ...
+
+    def accumulator(self) -> "PatchAccumulatorPort":
+        ...
+
+
+class PatchAccumulatorPort(Protocol):
+    """compute_all over a patch that is fed in row tiles, top to bottom."""
+
+    def add(self, patch: np.ndarray, mask: np.ndarray) -> None:
+        ...
+
+    def result(self) -> tuple[float, dict[str, float]]:
+        ...
+
 
 class ResultWriterPort(Protocol):
-    def write_all(self, measurements: list[GreennessMeasurement]) -> None:
+    def write_all(self, measurements: MeasurementBuffer | list[GreennessMeasurement]) -> None:
+        ...
+
+    def open(self, resume: bool = False) -> set[str]:
+        ...
+
+    def write(self, measurements: MeasurementBuffer | list[GreennessMeasurement]) -> None:
+        ...
+
+    def read_measurements(self) -> MeasurementBuffer:
+        ...
+
+    def close(self) -> None:
+        ...
+
+
+class PlotSummaryWriterPort(Protocol):
+    def open(self) -> None:
+        ...
+
+    def write(self, summaries: list[PlotSummary]) -> None:
+        ...
+
+    def close(self) -> None:
         ...
 
 
@@ -43,6 +99,52 @@ class DatasetDiscoveryPort(Protocol):
     def discover_images(self, root: Path) -> list[ImageSample]:
         ...
 
+    def iter_images(self, root: Path) -> Iterator[ImageSample]:
+        ...
+
+    def count_images(self, root: Path) -> int:
+        ...
+
+    def iter_paths(self, root: Path) -> Iterator[Path]:
+        ...
+
+    def samples_for(self, paths: list[Path]) -> list[ImageSample]:
+        ...
+
+    def awaits_gps(self, path: Path) -> bool:
+        ...
+
+
+class FolderWatcherPort(Protocol):
+    backend: str
+
+    @property
+    def pending(self) -> int:
+        ...
+
+    def poll(self, timeout: float, limit: int) -> list[Path]:
+        ...
+
+    def close(self) -> None:
+        ...
+
 class LeafSegmentationPort(Protocol):
     def extract(self, image: np.ndarray, checker_bbox: np.ndarray) -> np.ndarray:
+        ...
+
+    def mask(self, image: np.ndarray, checker_bbox: np.ndarray, tile_rows: int | None = None) -> np.ndarray:
+        ...
+
+    def overlay(self, image: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        ...
+
+
+class ArtifactCachePort(Protocol):
+    def image_key(self, path: Path) -> str:
+        ...
+
+    def get(self, key: str) -> dict[str, np.ndarray] | None:
+        ...
+
+    def put(self, key: str, kind: str, image: Path, arrays: dict[str, np.ndarray]) -> None:
         ...
\ No newline at end of file
@@ -0,0 +1,143 @@
+from pathlib import Path
+import hashlib
+import io
+import logging
+import os
+import sqlite3
+import time
+import zipfile
+import zlib
+import numpy as np
+from domain.ports import ArtifactCachePort
+
+logger = logging.getLogger(__name__)
+
+
+class ArtifactCache(ArtifactCachePort):
+    """Per-image cache of intermediate results as ``.npz`` blobs, indexed in SQLite and kept under
+    ``max_bytes`` by evicting the least recently used entries."""
+
+    def __init__(self, directory: Path, max_bytes: int = 10 * 2**30, key_mode: str = "stat"):
+        if key_mode not in ("stat", "content"):
+            raise ValueError(f"Unknown cache key mode: {key_mode}")
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.key_mode = key_mode
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        self._db = sqlite3.connect(self.directory / "index.sqlite", timeout=30, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS entries (
+                                key TEXT PRIMARY KEY, kind TEXT NOT NULL, image TEXT NOT NULL,
+                                size INTEGER NOT NULL, created REAL NOT NULL, last_access REAL NOT NULL)""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_access)")
+        self._total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    def image_key(self, path: Path) -> str:
+        if self.key_mode == "content":
+            digest = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+            return digest.hexdigest()
+
+        st = os.stat(path)
+        return f"{Path(path).resolve()}|{st.st_size}|{st.st_mtime_ns}"
+
+    def get(self, key: str) -> dict[str, np.ndarray] | None:
+        digest = self._digest(key)
+        path = self._blob_path(digest)
+        try:
+            with np.load(path) as data:
+                arrays = {name: data[name] for name in data.files}
+        except FileNotFoundError:  # never stored, or evicted by another process
+            self.misses += 1
+            return None
+        except (OSError, ValueError, zipfile.BadZipFile, zlib.error) as e:  # torn or corrupted blob
+            logger.warning(f"Artifact cache: dropping unreadable entry {path.name}: {e}")
+            self._discard(digest)
+            self.misses += 1
+            return None
+
+        self._db.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), digest))
+        self.hits += 1
+        return arrays
+
+    def put(self, key: str, kind: str, image: Path, arrays: dict[str, np.ndarray]) -> None:
+        digest = self._digest(key)
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **arrays)
+        blob = buffer.getvalue()
+
+        path = self._blob_path(digest)
+        path.parent.mkdir(exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp.write_bytes(blob)
+        os.replace(tmp, path)
+
+        now = time.time()
+        previous = self._db.execute("SELECT size FROM entries WHERE key = ?", (digest,)).fetchone()
+        self._db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                         (digest, kind, str(image), len(blob), now, now))
+        self._total += len(blob) - (previous[0] if previous else 0)
+
+        if self._total > self.max_bytes:
+            self.prune(max_bytes=int(self.max_bytes * 0.9))
+
+    def prune(self, max_bytes: int | None = None, older_than: float | None = None) -> tuple[int, int]:
+        """Evict entries not used for ``older_than`` seconds, then the least recently used ones
+        until at most ``max_bytes`` remain. Returns (entries removed, bytes freed)."""
+        victims = []
+        if older_than is not None:
+            victims += self._db.execute("SELECT key, size FROM entries WHERE last_access < ?",
+                                        (time.time() - older_than,)).fetchall()
+
+        if max_bytes is not None:
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            total -= sum(size for _, size in victims)
+            chosen = {key for key, _ in victims}
+            for key, size in self._db.execute("SELECT key, size FROM entries ORDER BY last_access"):
+                if total <= max_bytes:
+                    break
+                if key not in chosen:
+                    victims.append((key, size))
+                    total -= size
+
+        for key, _ in victims:
+            self._blob_path(key).unlink(missing_ok=True)
+        self._db.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in victims])
+
+        self._total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        freed = sum(size for _, size in victims)
+        if victims:
+            logger.info(f"Artifact cache: evicted {len(victims)} entries ({freed / 2**20:.1f} MB).")
+        return len(victims), freed
+
+    def inspect(self) -> dict:
+        """Entry count and size, overall and per artefact kind, plus the access time range."""
+        count, size, images, oldest, newest = self._db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COUNT(DISTINCT image), MIN(last_access), MAX(last_access) "
+            "FROM entries").fetchone()
+        kinds = {kind: {"entries": n, "bytes": s} for kind, n, s in
+                 self._db.execute("SELECT kind, COUNT(*), SUM(size) FROM entries GROUP BY kind ORDER BY kind")}
+        return {"directory": str(self.directory), "entries": count, "bytes": size, "max_bytes": self.max_bytes,
+                "images": images, "oldest_access": oldest, "newest_access": newest, "kinds": kinds}
+
+    def close(self) -> None:
+        if self.hits or self.misses:
+            logger.info(f"Artifact cache: {self.hits} hits, {self.misses} misses.")
+        self._db.close()
+
+    def _discard(self, digest: str) -> None:
+        self._blob_path(digest).unlink(missing_ok=True)
+        self._db.execute("DELETE FROM entries WHERE key = ?", (digest,))
+        self._total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    @staticmethod
+    def _digest(key: str) -> str:
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def _blob_path(self, digest: str) -> Path:
+        return self.directory / digest[:2] / f"{digest}.npz"
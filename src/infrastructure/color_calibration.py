@@ -1,12 +1,17 @@
+from typing import Hashable, Optional
 import numpy as np
-import cv2
 import colour
 from domain.ports import ColorCalibratorPort
+from domain.entities import DecodedImage
 
 
 class SimpleColorCalibrator(ColorCalibratorPort):
+    """Colour correction from the checker swatches to the reference chart, fitted once per session
+    and reused while the swatches stay within ``swatch_tolerance``."""
 
-    def __init__(self):
+    ENCODING_LUT_SIZE = 1 << 16
+
+    def __init__(self, terms: int = 3, swatch_tolerance: float = 0.0, tile_pixels: int = 1 << 20):
         self.D65 = colour.CCS_ILLUMINANTS["CIE 1931 2 Degree Standard Observer"]["D65"]
         self.REFERENCE_COLOUR_CHECKER = colour.CCS_COLOURCHECKERS["ColorChecker24 - After November 2014"]
         self.colour_checker_rows = self.REFERENCE_COLOUR_CHECKER.rows
@@ -14,12 +19,71 @@ class SimpleColorCalibrator(ColorCalibratorPort):
         self.REFERENCE_SWATCHES = colour.XYZ_to_RGB(colour.xyY_to_XYZ(list(self.REFERENCE_COLOUR_CHECKER.data.values())),
                                                "sRGB",self.REFERENCE_COLOUR_CHECKER.illuminant)  
 
-    
-    def calibrate(self, image: np.ndarray, swatches: np.ndarray) -> np.ndarray:
+        self.terms = terms
+        self.swatch_tolerance = swatch_tolerance
+        self.tile_pixels = tile_pixels
+
+        self.matrix: Optional[np.ndarray] = None
+        self._fitted_swatches: Optional[np.ndarray] = None
+        self._session: Optional[Hashable] = None
+
+        # 8-bit code value -> linear, and linear (quantised to ENCODING_LUT_SIZE steps) -> 8-bit sRGB
+        self._decode_lut = colour.cctf_decoding(np.arange(256) / 255).astype(np.float32)
+        encoded = colour.cctf_encoding(np.linspace(0.0, 1.0, self.ENCODING_LUT_SIZE))
+        self._encode_lut = (encoded * 255).clip(0, 255).astype(np.uint8)
+
+    def fit_matrix(self, swatches: np.ndarray) -> np.ndarray:
+        """Fit the correction matrix (3x3, or 3xN for polynomial terms) from measured swatches."""
+        return colour.matrix_colour_correction(swatches, self.REFERENCE_SWATCHES, method="Cheung 2004", terms=self.terms)
+
+    def calibrate(self, image: DecodedImage, swatches: np.ndarray, session: Hashable = None) -> np.ndarray:
+        return self.apply(image.bgr, self.matrix_for(swatches, session))
+
+    def apply(self, bgr: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+        """Apply a fitted matrix to a BGR uint8 image and return the calibrated BGR uint8 image."""
+        h, w = bgr.shape[:2]
+        rows = min(h, max(1, self.tile_pixels // w))
+        out = np.empty_like(bgr)
+
+        linear = np.empty((rows * w, 3), dtype=np.float32)
+        corrected = np.empty((rows * w, 3), dtype=np.float32)
+        index = np.empty((rows * w, 3), dtype=np.int32)
+        scale = np.float32(self.ENCODING_LUT_SIZE - 1)
+
+        if matrix.shape[1] == 3:
+            # In BGR order the RGB matrix becomes its channel-reversed counterpart.
+            matrix_bgr = np.ascontiguousarray(matrix[::-1, ::-1], dtype=np.float32).T
+
+        for y in range(0, h, rows):
+            tile = bgr[y:y + rows]
+            n = tile.shape[0] * w
+            lin, cor, idx = linear[:n], corrected[:n], index[:n]
+
+            np.take(self._decode_lut, tile.reshape(-1, 3), out=lin)
+            if matrix.shape[1] == 3:
+                np.matmul(lin, matrix_bgr, out=cor)
+            else:
+                rgb = colour.characterisation.apply_matrix_colour_correction_Cheung2004(lin[:, ::-1], matrix, self.terms)
+                cor[...] = rgb[:, ::-1]
+
+            np.multiply(cor, scale, out=cor)
+            np.add(cor, np.float32(0.5), out=cor)
+            np.clip(cor, 0, scale, out=cor)
+            np.copyto(idx, cor, casting="unsafe")
+            np.take(self._encode_lut, idx, out=out[y:y + rows].reshape(-1, 3))
+
+        return out
+
+    def matrix_for(self, swatches: np.ndarray, session: Hashable = None) -> np.ndarray:
+        """The matrix ``calibrate`` would apply, fitted or reused, without applying it."""
+        swatches = np.asarray(swatches, dtype=np.float64)
+        reuse = (self.matrix is not None and session == self._session
+                 and swatches.shape == self._fitted_swatches.shape
+                 and np.max(np.abs(swatches - self._fitted_swatches)) <= self.swatch_tolerance)
+
+        if not reuse:
+            self.matrix = self.fit_matrix(swatches)
+            self._fitted_swatches = swatches
+            self._session = session
 
-        corrected_image = colour.colour_correction(image, swatches, self.REFERENCE_SWATCHES)
-        corrected_image = colour.cctf_encoding(corrected_image)
-        corrected_image = (corrected_image * 255).clip(0, 255).astype("uint8")
-        corrected_image = cv2.cvtColor(corrected_image, cv2.COLOR_RGB2BGR) 
-        
-        return corrected_image
+        return self.matrix
@@ -1,8 +1,9 @@
 import numpy as np
+import cv2
 from typing import Optional, Tuple
 from domain.ports import ColorCheckerDetectorPort
+from domain.entities import DecodedImage
 from domain.exceptions import PipelineError
-import colour
 from colour_checker_detection import (
     detect_colour_checkers_segmentation,
     SETTINGS_SEGMENTATION_COLORCHECKER_CLASSIC
@@ -18,9 +19,9 @@ class DeepColorCheckerDetector(ColorCheckerDetectorPort):
     def _load_model(self):
         return None
 
-    def detect(self, image_path: str) -> Tuple[np.ndarray]:
+    def detect(self, frame: DecodedImage) -> Tuple[np.ndarray, np.ndarray]:
 
-        image = colour.cctf_decoding(colour.io.read_image(image_path))
+        image = frame.linear_rgb
         colour_checkers = detect_colour_checkers_segmentation(image=image, additional_data=True, show=False,
                                                     setting=SETTINGS_SEGMENTATION_COLORCHECKER_CLASSIC)
 
@@ -30,7 +31,22 @@ class DeepColorCheckerDetector(ColorCheckerDetectorPort):
         quad_orig = self._get_colourchecker_quad_on_original(colour_checkers[0], image,
                                                             SETTINGS_SEGMENTATION_COLORCHECKER_CLASSIC['working_width'])
 
-        return image, colour_checkers[0].swatch_colours, quad_orig
+        return colour_checkers[0].swatch_colours, quad_orig
+
+    def swatches_at(self, frame: DecodedImage, quad: np.ndarray, cell: int = 8) -> np.ndarray:
+        """The swatch colours of a checker at a known ``quad``, read from the centre of each swatch."""
+        H, W = frame.shape[:2]
+        (x0, y0), (x1, y1) = np.maximum(quad.min(axis=0), 0), np.minimum(quad.max(axis=0) + 1, (W, H))
+        if x1 <= x0 or y1 <= y0:
+            return np.zeros((24, 3))
+
+        roi = np.ascontiguousarray(frame.linear_rgb_region(int(x0), int(y0), int(x1), int(y1)), dtype=np.float32)
+        # quads run top right, bottom right, bottom left, top left of the chart (swatches in reading order)
+        chart = np.float32([[6 * cell, 0], [6 * cell, 4 * cell], [0, 4 * cell], [0, 0]])
+        warp = cv2.getPerspectiveTransform(np.float32(quad - (x0, y0)), chart)
+        grid = cv2.warpPerspective(roi, warp, (6 * cell, 4 * cell), flags=cv2.INTER_LINEAR)
+        centres = grid.reshape(4, cell, 6, cell, 3)[:, cell // 4:-(cell // 4), :, cell // 4:-(cell // 4)]
+        return centres.mean(axis=(1, 3)).reshape(24, 3)
 
     
     def _get_colourchecker_quad_on_original(self, colour_checker: np.ndarray, image: np.ndarray, working_width) -> np.ndarray:
@@ -0,0 +1,127 @@
+import logging
+from pathlib import Path
+from typing import Optional, Tuple
+import numpy as np
+import cv2
+import colour
+from colour_checker_detection import detect_colour_checkers_segmentation
+from domain.entities import DecodedImage
+from domain.exceptions import PipelineError
+from infrastructure.color_checker_detector_deep import DeepColorCheckerDetector
+
+logger = logging.getLogger(__name__)
+
+
+class TrackingColorCheckerDetector(DeepColorCheckerDetector):
+    """Searches around the previous frame's checker first, then the full frame (on a proxy with ``proxy_width``).
+    Fast detections are kept only when their swatches correlate with the reference chart."""
+
+    def __init__(
+        self,
+        model_path: str = '',
+        device: str = "cpu",
+        roi_margin: float = 0.25,
+        roi_working_width: int = 720,
+        proxy_width: int = 0,
+        min_reference_corr: float = 0.4
+    ):
+        super().__init__(model_path=model_path, device=device)
+        self.roi_margin = roi_margin
+        self.roi_working_width = roi_working_width
+        self.proxy_width = proxy_width
+        self.min_reference_corr = min_reference_corr
+
+        reference = colour.CCS_COLOURCHECKERS["ColorChecker24 - After November 2014"]
+        self.reference_swatches = colour.XYZ_to_RGB(colour.xyY_to_XYZ(list(reference.data.values())),
+                                                    "sRGB", reference.illuminant).ravel()
+
+        self._folder: Optional[Path] = None
+        self._quad: Optional[np.ndarray] = None
+        self._stats = self._new_stats()
+
+    def detect(self, frame: DecodedImage) -> Tuple[np.ndarray, np.ndarray]:
+        if frame.path.parent != self._folder:
+            self._log_stats()
+            self._folder = frame.path.parent
+            self._quad = None
+            self._stats = self._new_stats()
+
+        result = None
+        if self._quad is not None:
+            result = self._detect_roi(frame, self._quad)
+            self._stats["roi_hits" if result is not None else "roi_misses"] += 1
+
+        if result is None:
+            try:
+                result = self._detect_full(frame)
+            except PipelineError:
+                self._stats["full_misses"] += 1
+                self._quad = None
+                raise
+            self._stats["full_hits"] += 1
+
+        self._quad = result[1]
+        return result
+
+    def close(self) -> None:
+        self._log_stats()
+        self._folder = None
+        self._quad = None
+
+    def _detect_full(self, frame: DecodedImage) -> Tuple[np.ndarray, np.ndarray]:
+        H, W = frame.shape[:2]
+
+        if self.proxy_width and max(H, W) > self.proxy_width:
+            scale = self.proxy_width / max(H, W)
+            small = cv2.resize(frame.bgr, (round(W * scale), round(H * scale)), interpolation=cv2.INTER_AREA)
+            proxy = DecodedImage(path=frame.path, bgr=small).linear_rgb
+
+            found = self._detect_in(proxy, min(self.proxy_width, proxy.shape[1]))
+            if found is not None:
+                swatches, quad = found
+                quad = np.rint(quad * (W / proxy.shape[1])).astype(np.int32)
+                return self._detect_roi(frame, quad) or (swatches, quad)
+
+        return super().detect(frame)
+
+    def _detect_roi(self, frame: DecodedImage, quad: np.ndarray) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        H, W = frame.shape[:2]
+        (x0, y0), (x1, y1) = quad.min(axis=0), quad.max(axis=0)
+        mx, my = int((x1 - x0) * self.roi_margin), int((y1 - y0) * self.roi_margin)
+        x0, y0 = max(0, x0 - mx), max(0, y0 - my)
+        x1, y1 = min(W, x1 + mx + 1), min(H, y1 + my + 1)
+        if x1 - x0 < 16 or y1 - y0 < 16:
+            return None
+
+        roi = frame.linear_rgb_region(x0, y0, x1, y1)
+        found = self._detect_in(roi, self.roi_working_width)
+        if found is None:
+            return None
+
+        swatches, roi_quad = found
+        return swatches, roi_quad + np.array([x0, y0], dtype=np.int32)
+
+    def _detect_in(self, image: np.ndarray, working_width: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Search one image at a given working width; returns swatches and the quad in image pixels."""
+        colour_checkers = detect_colour_checkers_segmentation(image=image, additional_data=True, show=False,
+                                                              working_width=working_width,
+                                                              working_height=round(working_width * 2 / 3))
+        if len(colour_checkers) == 0:
+            return None
+
+        swatches = colour_checkers[0].swatch_colours
+        if np.corrcoef(np.ravel(swatches), self.reference_swatches)[0, 1] < self.min_reference_corr:
+            return None
+
+        return swatches, self._get_colourchecker_quad_on_original(colour_checkers[0], image, working_width)
+
+    @staticmethod
+    def _new_stats() -> dict:
+        return {"roi_hits": 0, "roi_misses": 0, "full_hits": 0, "full_misses": 0}
+
+    def _log_stats(self) -> None:
+        if self._folder is None or not any(self._stats.values()):
+            return
+        s = self._stats
+        logger.info(f"Checker tracking for {self._folder}: {s['roi_hits']} ROI hits, {s['roi_misses']} ROI misses, "
+                    f"{s['full_hits']} full-search hits, {s['full_misses']} full-search misses.")
@@ -1,40 +1,194 @@
 import csv
+import io
+import os
 from pathlib import Path
 from typing import List
-from domain.ports import ResultWriterPort
-from domain.entities import GreennessMeasurement
+from domain.ports import ResultWriterPort, PlotSummaryWriterPort
+from domain.entities import GreennessMeasurement, PlotSummary
+from domain.measurements import MeasurementBuffer
+
+
+HEADER = [
+    "folder_name",
+    "image_path",
+    "lat",
+    "long",
+    "patch_id",
+    "x",
+    "y",
+    "w",
+    "h",
+    "greenness_value",
+]
+
+PLOT_HEADER = [
+    "folder_name",
+    "folder_path",
+    "frames",
+    "failed",
+    "redetected",
+    "lat",
+    "long",
+    "greenness_mean",
+    "greenness_median",
+    "greenness_iqr",
+]
 
 
 class CsvResultWriter(ResultWriterPort):
+    """Streams measurements to a CSV file in batches, fsyncing every ``checkpoint_interval`` rows.
+    ``open(resume=True)`` drops the last image in the file, which a crash may have cut short."""
+
+    def __init__(self, output_path: Path, batch_size: int = 64, checkpoint_interval: int = 1024,
+                 value_columns: List[str] = ()):
+        self.output_path = output_path
+        self.value_columns = list(value_columns)
+        self.header = HEADER + self.value_columns
+        self.batch_size = batch_size
+        self.checkpoint_interval = checkpoint_interval
+        self._file = None
+        self._pending: list[tuple] = []
+        self._since_checkpoint = 0
+
+    def write_all(self, measurements: MeasurementBuffer | list[GreennessMeasurement]) -> None:
+        self.open()
+        self.write(measurements)
+        self.close()
+
+    def read_measurements(self) -> MeasurementBuffer:
+        """The rows already in the output, e.g. the ones a resumed run keeps."""
+        if self._file is not None:
+            self.flush()
+        return read_measurements(self.output_path) if self.output_path.exists() else MeasurementBuffer()
+
+    def open(self, resume: bool = False) -> set[str]:
+        """Open the output and return the image paths it already holds (resume only)."""
+        self.output_path.parent.mkdir(parents=True, exist_ok=True)
+
+        done: set[str] = set()
+        if resume and self.output_path.exists():
+            done = self._recover()
+
+        append = resume and self.output_path.exists() and self.output_path.stat().st_size > 0
+        self._file = self.output_path.open("a" if append else "w", newline="", encoding="utf-8")
+        if not append:
+            csv.writer(self._file).writerow(self.header)
+
+        return done
+
+    def write(self, measurements: MeasurementBuffer | list[GreennessMeasurement]) -> None:
+        buffer = MeasurementBuffer.of(measurements, self.value_columns)
+        if len(buffer):
+            n = len(buffer)
+            self._pending.extend(zip(
+                buffer.folder_names(),
+                buffer.image_paths(),
+                *[buffer.column(name).tolist() for name in HEADER[2:]],
+                *[buffer.column(column).tolist() if column in buffer.value_columns else [""] * n
+                  for column in self.value_columns],
+            ))
+
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._pending:
+            # One write call per batch keeps an interrupted flush to a single torn line.
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(self._pending)
+            self._file.write(buffer.getvalue())
+            self._file.flush()
+            self._since_checkpoint += len(self._pending)
+            self._pending.clear()
+
+        if self._since_checkpoint >= self.checkpoint_interval:
+            self.checkpoint()
+
+    def checkpoint(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._since_checkpoint = 0
+
+    def close(self) -> None:
+        if self._file is None:
+            return
+        self.flush()
+        self.checkpoint()
+        self._file.close()
+        self._file = None
+
+    def _recover(self) -> set[str]:
+        """Cut a torn last line and the rows of the last image, which a crash may have left
+        incomplete, and collect the image paths written before it."""
+        with self.output_path.open("rb+") as f:
+            end = f.seek(0, os.SEEK_END)
+            pos = end
+            while pos > 0:
+                step = min(pos, 64 * 1024)
+                f.seek(pos - step)
+                cut = f.read(step).rfind(b"\n")
+                if cut >= 0:
+                    pos = pos - step + cut + 1
+                    break
+                pos -= step
+            if pos < end:
+                f.truncate(pos)
+
+        done: set[str] = set()
+        with self.output_path.open("rb+") as f:
+            line = f.readline()
+            if not line:
+                return done
+            fieldnames = next(csv.reader([line.decode("utf-8")]))
+            if fieldnames != self.header:
+                raise ValueError(f"Cannot resume {self.output_path}: its columns {fieldnames} differ from "
+                                 f"{self.header}. Use the same --green-indx/--green-stats as the first run.")
+            column = fieldnames.index("image_path")
+
+            last, last_start, pos = None, len(line), len(line)
+            for line in f:
+                image = next(csv.reader([line.decode("utf-8")]))[column]
+                if image != last:
+                    if last is not None:
+                        done.add(last)
+                    last, last_start = image, pos
+                pos += len(line)
+            if last is not None:
+                f.truncate(last_start)  # measured again
+        return done
+
+
+def read_measurements(path: Path) -> MeasurementBuffer:
+    """The rows of a CSV written by CsvResultWriter, without its index value columns."""
+    with path.open(newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        columns = list(zip(*reader))
+    if header is None or not columns:
+        return MeasurementBuffer()
+    return MeasurementBuffer.from_columns(dict(zip(header, columns)))
+
+
+class CsvPlotSummaryWriter(PlotSummaryWriterPort):
+    """Writes one row per plot folder, flushed as it comes. The file is rewritten by every run;
+    a resumed run summarises its folders again from the rows already in the per-image output."""
+
     def __init__(self, output_path: Path):
         self.output_path = output_path
+        self._file = None
 
-    def write_all(self, measurements: list[GreennessMeasurement]) -> None:
+    def open(self) -> None:
         self.output_path.parent.mkdir(parents=True, exist_ok=True)
-        with self.output_path.open("w", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                "folder_name",
-                "image_path",
-                "lat",
-                "long",
-                "patch_id",
-                "x",
-                "y",
-                "w",
-                "h",
-                "greenness_value",
-            ])
-            for m in measurements:
-                writer.writerow([
-                    m.folder_name,
-                    str(m.image_path),
-                    m.lat,
-                    m.long,
-                    m.patch_id,
-                    m.patch_region.x,
-                    m.patch_region.y,
-                    m.patch_region.w,
-                    m.patch_region.h,
-                    m.greenness_value,
-                ])
+        self._file = self.output_path.open("w", newline="", encoding="utf-8")
+        csv.writer(self._file).writerow(PLOT_HEADER)
+
+    def write(self, summaries: list[PlotSummary]) -> None:
+        csv.writer(self._file).writerows(
+            [s.folder_name, str(s.folder_path), s.frames, s.failed, s.redetected, s.lat, s.long,
+             s.greenness_mean, s.greenness_median, s.greenness_iqr] for s in summaries)
+        self._file.flush()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
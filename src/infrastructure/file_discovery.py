@@ -1,72 +1,140 @@
 from pathlib import Path
-import pandas as pd
+from typing import Iterator
+import io
+import os
+import numpy as np
 import logging
 from domain.ports import DatasetDiscoveryPort
 from domain.entities import ImageSample
+from infrastructure.gps_track import GpsTrack, image_clock_seconds
 
 logger = logging.getLogger(__name__)
 
 
 class FolderDatasetDiscovery(DatasetDiscoveryPort):
-    def __init__(self, valid_exts: tuple[str, ...] = (".jpg", ".jpeg", ".png", ".tif")):
+    """``reload_gps`` re-reads a folder's GPS log whenever it changed on disk, for logs
+    that are still being written while images are processed."""
+
+    def __init__(self, valid_exts: tuple[str, ...] = (".jpg", ".jpeg", ".png", ".tif"),
+                 interpolate_gps: bool = False, max_time_gap: float = 1.0, reload_gps: bool = False):
         self.valid_exts = valid_exts
-        self.GPS_data = {}
-        self.last_time_index = 0
+        self.interpolate_gps = interpolate_gps
+        self.max_time_gap = max_time_gap
+        self.reload_gps = reload_gps
+        self.GPS_data: dict[Path, GpsTrack] = {}
+        self._gps_stamps: dict[Path, tuple] = {}  # directory -> (csv, size, mtime) it was read from
 
     def discover_images(self, root: Path) -> list[ImageSample]:
-        samples: list[ImageSample] = []
+        return list(self.iter_images(root))
+
+    def iter_images(self, root: Path) -> Iterator[ImageSample]:
+        """Yield samples folder by folder while the tree is still being scanned."""
+        for directory, image_paths in self._walk(root):
+            yield from self._samples(directory, image_paths)
+
+    def samples_for(self, paths: list[Path]) -> list[ImageSample]:
+        """Samples for the given image files, with one GPS lookup per folder."""
+        by_folder: dict[Path, list[Path]] = {}
+        for p in paths:
+            by_folder.setdefault(Path(p).parent, []).append(Path(p))
+        return [s for directory, image_paths in by_folder.items() for s in self._samples(directory, image_paths)]
+
+    def awaits_gps(self, path: Path) -> bool:
+        """True while the folder's GPS log has no fix yet for the image's capture time."""
+        try:
+            track = self._track(Path(path).parent)
+        except Exception:
+            return True  # no readable log yet
+        t = image_clock_seconds([Path(path)])[0]
+        return bool(t > track.times[-1] + self.max_time_gap)
+
+    def count_images(self, root: Path) -> int:
+        """Count image files by name only: no GPS parsing and no samples are built."""
+        return sum(len(image_paths) for _, image_paths in self._walk(root))
+
+    def iter_paths(self, root: Path) -> Iterator[Path]:
+        """Image paths in the order iter_images yields them, without reading GPS logs."""
+        for _, image_paths in self._walk(root):
+            yield from image_paths
+
+    def _walk(self, root: Path) -> Iterator[tuple[Path, list[Path]]]:
+        """Depth-first walk yielding each directory with its image files, both in sorted order."""
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            try:
+                with os.scandir(directory) as it:
+                    entries = sorted(it, key=lambda e: e.name)
+            except OSError as e:
+                logger.warning(f"[WARN] for {directory}: could not list directory ({e}).")
+                continue
 
-        for p in root.rglob("*"):
+            image_paths = [directory / e.name for e in entries
+                           if os.path.splitext(e.name)[1].lower() in self.valid_exts and e.is_file()]
+            if image_paths:
+                yield directory, image_paths
 
-            try:
-                if p.suffix.lower() in self.valid_exts:
-                    rel = p.relative_to(Path.cwd().parent)
-                    root_path = rel.parent
-                    folder_name = p.parent.name
+            stack.extend(directory / e.name for e in reversed(entries) if e.is_dir(follow_symlinks=False))
 
-                    if p.parent not in self.GPS_data:
-                        gps_path = Path(str(p.parent).replace('ImageData', 'GPSData'))
-                        self.GPS_data[p.parent] = self._read_GPS_data(gps_path)
-                        self.last_time_index = 0
+    def _samples(self, directory: Path, image_paths: list[Path]) -> Iterator[ImageSample]:
+        try:
+            lats, longs = self._read_lat_long(directory, image_paths)
+        except Exception as e:
+            logger.exception(f"Unexpected error for {directory} in Dataset Discovery step: {e}. "
+                             f"{len(image_paths)} images skipped.")
+            return
 
-                    lat, long = self._read_lat_long(p)
+        for p, lat, long in zip(image_paths, lats, longs):
 
-                    samples.append(ImageSample(path=p, root_path=root_path, folder_name=folder_name, lat=lat, long=long))
+            try:
+                rel = p.relative_to(Path.cwd().parent)
+                root_path = rel.parent
+                folder_name = p.parent.name
 
             except Exception as e:
                 logger.exception(f"Unexpected error for {p} in Dataset Discovery step: {e}.")
                 continue
 
-
-        return samples
-
-    def _read_GPS_data(self, path: Path) -> dict:
-        gps_csv = list(path.glob('*.csv'))[0]
-        df = pd.read_csv(gps_csv, header=None)
-        df.columns = ['Lat.', 'Long.', 'time']
-        gps_data = df.to_dict(orient='list')
-
-        return gps_data
-
-    def _read_lat_long(self, path: Path):
-
-        name = path.name
-        time = name[:name.rfind('_')]
-        time = time.replace('_', ':')
-
-        if time not in self.GPS_data[path.parent]['time']:
-            time_index = self.last_time_index
-            logger.warning(f"[WARN] for {path}: {'Image time is not in GPS data. Last time is used.'}")
-        else:
-            time_index = self.GPS_data[path.parent]['time'].index(time)
-
-        lat = self.GPS_data[path.parent]['Lat.'][time_index]
-        long = self.GPS_data[path.parent]['Long.'][time_index]
-
-        self.last_time_index = time_index
-
-        return lat, long
-
-
-
-
+            yield ImageSample(path=p, root_path=root_path, folder_name=folder_name, lat=lat, long=long)
+
+    def _read_GPS_data(self, path: Path) -> GpsTrack:
+        gps_csv = sorted(path.glob('*.csv'))[0]
+        return GpsTrack.from_csv(gps_csv)
+
+    def _track(self, directory: Path) -> GpsTrack:
+        gps_path = Path(str(directory).replace('ImageData', 'GPSData'))
+        if not self.reload_gps:
+            if directory not in self.GPS_data:
+                self.GPS_data[directory] = self._read_GPS_data(gps_path)
+            return self.GPS_data[directory]
+
+        gps_csv = sorted(gps_path.glob('*.csv'))[0]
+        st = gps_csv.stat()
+        stamp = (gps_csv, st.st_size, st.st_mtime_ns)
+        if self._gps_stamps.get(directory) != stamp:
+            data = gps_csv.read_bytes()
+            # a log that is still being written may end in a torn line
+            self.GPS_data[directory] = GpsTrack.from_csv(io.BytesIO(data[:data.rfind(b"\n") + 1]))
+            self._gps_stamps[directory] = stamp
+        return self.GPS_data[directory]
+
+    def _read_lat_long(self, directory: Path, image_paths: list[Path]) -> tuple[list[float], list[float]]:
+        """Locate every image of one folder on its GPS track with a single bulk lookup."""
+        track = self._track(directory)
+
+        times = image_clock_seconds(image_paths)
+
+        unknown = np.isnan(times)
+        if unknown.any():
+            for p in np.asarray(image_paths, dtype=object)[unknown]:
+                logger.warning(f"[WARN] for {p}: {'Image name has no HH_MM_SS time. Previous image time is used.'}")
+            # forward-fill from the previous image of the folder, or the first fix
+            last_known = np.maximum.accumulate(np.where(unknown, 0, np.arange(len(times))))
+            times = np.where(unknown[last_known], track.times[0], times[last_known])
+
+        lat, long, gap = track.lookup(times, interpolate=self.interpolate_gps)
+
+        for p in np.asarray(image_paths, dtype=object)[gap > self.max_time_gap]:
+            logger.warning(f"[WARN] for {p}: {'Image time is not in GPS data. Closest time is used.'}")
+
+        return lat.tolist(), long.tolist()
@@ -0,0 +1,232 @@
+from pathlib import Path
+import ctypes
+import ctypes.util
+import heapq
+import logging
+import os
+import select
+import struct
+import sys
+import time
+from domain.ports import FolderWatcherPort
+
+logger = logging.getLogger(__name__)
+
+VALID_EXTS = (".jpg", ".jpeg", ".png", ".tif")
+
+# <sys/inotify.h>
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_WATCH_MASK = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len; followed by len bytes of name
+
+
+class PollingFolderWatcher(FolderWatcherPort):
+    """Finds new image files under ``root`` by listing the tree every ``interval`` seconds; a file is handed
+    out once its size and mtime have not changed for ``settle`` seconds."""
+
+    backend = "polling"
+
+    def __init__(self, root: Path, valid_exts: tuple[str, ...] = VALID_EXTS, settle: float = 2.0,
+                 interval: float = 1.0):
+        self.root = Path(root)
+        self.valid_exts = valid_exts
+        self.settle = settle
+        self.interval = interval
+
+        self._known: set[Path] = set()
+        self._changing: dict[Path, tuple[int, int, float]] = {}  # path -> size, mtime_ns, unchanged since
+        self._stable: list[tuple[int, Path]] = []  # heap on mtime_ns
+        self._next_scan = 0.0
+        self._next_check = 0.0
+
+    @property
+    def pending(self) -> int:
+        return len(self._changing) + len(self._stable)
+
+    def poll(self, timeout: float, limit: int) -> list[Path]:
+        """Wait up to ``timeout`` seconds for a stable new file; return up to ``limit`` of them."""
+        deadline = time.monotonic() + timeout
+        while True:
+            self._wait(deadline)
+            self._check(time.monotonic())
+            if self._stable or time.monotonic() >= deadline:
+                break
+
+        ready = []
+        while self._stable and len(ready) < limit:
+            ready.append(heapq.heappop(self._stable)[1])
+        return ready
+
+    def close(self) -> None:
+        pass
+
+    def _wait(self, deadline: float) -> None:
+        now = time.monotonic()
+        if now >= self._next_scan:
+            self._scan(self.root)
+            self._next_scan = now + self.interval
+        else:
+            time.sleep(max(0.0, min(deadline, self._next_scan, self._next_check) - now))
+
+    def _scan(self, directory: Path) -> None:
+        stack = [directory]
+        while stack:
+            directory = stack.pop()
+            try:
+                with os.scandir(directory) as it:
+                    entries = list(it)
+            except OSError:
+                continue  # removed since it was listed, or unreadable; the next scan retries
+            for e in entries:
+                if e.is_dir(follow_symlinks=False):  # a linked directory would be walked twice, or forever
+                    stack.append(Path(e.path))
+                elif os.path.splitext(e.name)[1].lower() in self.valid_exts:
+                    self._saw(Path(e.path))
+
+    def _saw(self, path: Path) -> None:
+        if path not in self._known:
+            self._known.add(path)
+            self._changing[path] = (-1, -1, time.monotonic())
+            self._next_check = 0.0
+
+    def _check(self, now: float) -> None:
+        """Move files that stopped changing ``settle`` seconds ago to the stable heap."""
+        if now < self._next_check:
+            return
+        self._next_check = now + min(self.interval, self.settle / 2)
+
+        for path, (size, mtime, since) in list(self._changing.items()):
+            try:
+                st = os.stat(path)
+            except OSError:
+                del self._changing[path]  # deleted or renamed while being written
+                self._known.discard(path)
+                continue
+            if (st.st_size, st.st_mtime_ns) != (size, mtime):
+                self._changing[path] = (st.st_size, st.st_mtime_ns, now)
+            elif st.st_size > 0 and now - since >= self.settle:
+                del self._changing[path]
+                heapq.heappush(self._stable, (st.st_mtime_ns, path))
+
+
+class InotifyFolderWatcher(PollingFolderWatcher):
+    """PollingFolderWatcher driven by Linux inotify events, through libc with ctypes; the tree is
+    listed again only after the event queue overflows."""
+
+    backend = "inotify"
+
+    def __init__(self, root: Path, valid_exts: tuple[str, ...] = VALID_EXTS, settle: float = 2.0,
+                 interval: float = 1.0):
+        super().__init__(root, valid_exts=valid_exts, settle=settle, interval=interval)
+        self._libc = _inotify_libc()
+        if self._libc is None:
+            raise OSError("inotify is not available on this platform")
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_init1: {os.strerror(ctypes.get_errno())}")
+        self._watches: dict[int, Path] = {}
+        self._watch_failed = False
+        self._next_scan = float("inf")  # only on queue overflow
+        self._scan(self.root)
+        if not self._watches:
+            self.close()
+            raise OSError(f"Cannot watch {self.root}")
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def _wait(self, deadline: float) -> None:
+        now = time.monotonic()
+        if now >= self._next_scan:
+            self._next_scan = float("inf")
+            self._scan(self.root)
+        timeout = max(0.0, deadline - now)
+        if self._changing:
+            timeout = min(timeout, max(0.0, self._next_check - now))
+        if select.select([self._fd], [], [], timeout)[0]:
+            self._read_events()
+
+    def _scan(self, directory: Path) -> None:
+        # watch before listing, so files created in between are not missed
+        stack = [directory]
+        while stack:
+            directory = stack.pop()
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), _WATCH_MASK)
+            if wd < 0:
+                if not self._watch_failed:
+                    logger.warning(f"Cannot watch {directory} ({os.strerror(ctypes.get_errno())}); "
+                                   f"unwatched directories are listed every {self.interval:g} s instead.")
+                self._watch_failed = True
+            else:
+                self._watches[wd] = directory
+            try:
+                with os.scandir(directory) as it:
+                    entries = list(it)
+            except OSError:
+                continue
+            for e in entries:
+                if e.is_dir(follow_symlinks=False):  # a linked directory would be walked twice, or forever
+                    stack.append(Path(e.path))
+                elif os.path.splitext(e.name)[1].lower() in self.valid_exts:
+                    self._saw(Path(e.path))
+        if self._watch_failed:
+            self._next_scan = min(self._next_scan, time.monotonic() + self.interval)
+
+    def _read_events(self) -> None:
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _EVENT.unpack_from(data, offset)
+                name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b"\0")
+                offset += _EVENT.size + length
+
+                if mask & _IN_Q_OVERFLOW:
+                    logger.warning("inotify event queue overflowed; listing the watched tree again.")
+                    self._next_scan = 0.0
+                    continue
+                directory = self._watches.get(wd)
+                if mask & _IN_IGNORED:
+                    self._watches.pop(wd, None)  # the directory was removed
+                    continue
+                if directory is None or not name:
+                    continue
+                path = directory / os.fsdecode(name)
+                if mask & _IN_ISDIR:
+                    if mask & (_IN_CREATE | _IN_MOVED_TO):
+                        self._scan(path)
+                elif os.path.splitext(path.name)[1].lower() in self.valid_exts:
+                    self._saw(path)
+
+
+def create_watcher(root: Path, settle: float = 2.0, interval: float = 1.0, polling: bool = False) -> FolderWatcherPort:
+    """An inotify watcher where the platform has inotify, else (or with ``polling``) a polling one."""
+    if not polling:
+        try:
+            return InotifyFolderWatcher(root, settle=settle, interval=interval)
+        except OSError as e:
+            logger.warning(f"inotify unavailable ({e}); polling {root} every {interval:g} s.")
+    return PollingFolderWatcher(root, settle=settle, interval=interval)
+
+
+def _inotify_libc():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    except (OSError, AttributeError):
+        return None
+    return libc
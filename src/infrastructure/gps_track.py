@@ -0,0 +1,75 @@
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+
+def parse_clock_seconds(values) -> np.ndarray:
+    """Vectorised 'HH:MM:SS[.ffffff]' -> seconds since midnight; unparsable entries become NaN."""
+    parts = pd.Series(values, dtype="string").str.strip().str.split(":", n=2, expand=True)
+    if parts.shape[1] < 3:
+        return np.full(len(parts), np.nan)
+
+    parts = parts.apply(pd.to_numeric, errors="coerce")
+    return (parts[0] * 3600 + parts[1] * 60 + parts[2]).to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def image_clock_seconds(paths: list[Path]) -> np.ndarray:
+    """Capture time of timestamp-named images ('HH_MM_SS_ffffff.png') with sub-second precision."""
+    stamps = []
+    for p in paths:
+        fields = p.stem.split("_")
+        stamps.append(":".join(fields[:2]) + ":" + ".".join(fields[2:4]) if len(fields) >= 3 else "")
+
+    return parse_clock_seconds(stamps)
+
+
+class GpsTrack:
+    """GPS log of one folder, parsed once into time-sorted numeric arrays."""
+
+    def __init__(self, times: np.ndarray, lat: np.ndarray, long: np.ndarray):
+        order = np.argsort(times, kind="stable")
+        self.times = times[order]
+        self.lat = lat[order]
+        self.long = long[order]
+
+    @classmethod
+    def from_csv(cls, path: Path) -> "GpsTrack":
+        df = pd.read_csv(path, header=None, names=['Lat.', 'Long.', 'time'], dtype={'time': str})
+        lat = pd.to_numeric(df['Lat.'], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+        long = pd.to_numeric(df['Long.'], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+        times = parse_clock_seconds(df['time'])
+
+        valid = ~(np.isnan(lat) | np.isnan(long) | np.isnan(times))  # header, blank and torn rows
+        if not valid.any():
+            raise ValueError(f"No usable GPS records in {path}")
+
+        return cls(times[valid], lat[valid], long[valid])
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def lookup(self, times: np.ndarray, interpolate: bool = False) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(lat, long, gap) for many query times, gap being the seconds to the closest fix; with ``interpolate``
+        lat/long are interpolated between the fixes around each time, clamped at the ends."""
+        times = np.asarray(times, dtype=np.float64)
+        last = len(self.times) - 1
+
+        right = np.searchsorted(self.times, times, side="left")
+        hi = np.minimum(right, last)
+        lo = np.maximum(right - 1, 0)
+
+        d_lo = np.abs(times - self.times[lo])
+        d_hi = np.abs(self.times[hi] - times)
+        nearest = np.where(d_hi <= d_lo, hi, lo)
+        gap = np.minimum(d_lo, d_hi)
+
+        if not interpolate:
+            return self.lat[nearest], self.long[nearest], gap
+
+        span = self.times[hi] - self.times[lo]
+        w = np.divide(times - self.times[lo], span, out=np.zeros_like(times), where=span > 0)
+        np.clip(w, 0.0, 1.0, out=w)
+
+        lat = self.lat[lo] + w * (self.lat[hi] - self.lat[lo])
+        long = self.long[lo] + w * (self.long[hi] - self.long[lo])
+        return lat, long, gap
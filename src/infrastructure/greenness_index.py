@@ -1,59 +1,252 @@
-from typing import Literal
+from typing import Iterable, Literal
 import numpy as np
-import cv2
-from domain.ports import GreennessIndexCalculatorPort
+from config.settings import INDICES, STATS, valid_stat, value_columns
+from domain.ports import GreennessIndexCalculatorPort, PatchAccumulatorPort
 from domain.exceptions import PipelineError
 
 
+def _ngrdi_table() -> np.ndarray:
+    """NGRDI of every (g, r) pair, evaluated with the same float32 operations as on the pixels."""
+    g = np.arange(256, dtype=np.float32)[:, None]
+    r = np.arange(256, dtype=np.float32)[None, :]
+    return ((g - r) / (g + r + 1e-6)).astype(np.float32)
+
+
+_NGRDI = _ngrdi_table()
+_NGRDI_FLAT = _NGRDI.ravel()
+_NGRDI_ORDER = np.argsort(_NGRDI_FLAT, kind="stable")
+_EXG_OFFSET = 510  # 2g - r - b lies in [-510, 510]
+
+
+def _exg_sample(counts: np.ndarray) -> "_HistogramSample":
+    return _HistogramSample(counts, np.arange(-_EXG_OFFSET, _EXG_OFFSET + 1, dtype=np.float32))
+
+
+def _ngrdi_sample(counts: np.ndarray) -> "_HistogramSample":
+    # counts per g * 256 + r
+    return _HistogramSample(counts[_NGRDI_ORDER], _NGRDI_FLAT[_NGRDI_ORDER])
+
+
+def _median_of_two(a: np.float32, b: np.float32) -> float:
+    # np.median averages the two middle values of float32 data in float32
+    return float(np.float32(np.float32(a) + np.float32(b)) / np.float32(2))
+
+
+class _HistogramSample:
+    """A sample of a uint8-derived index, held as counts over its ascending distinct values."""
+
+    def __init__(self, counts: np.ndarray, values: np.ndarray):
+        self.counts = counts
+        self.values = values
+        self.n = int(counts.sum())
+        self._cumulative = None
+
+    def _at_rank(self, ranks) -> np.ndarray:
+        if self._cumulative is None:
+            self._cumulative = np.cumsum(self.counts)
+        return self.values[np.searchsorted(self._cumulative, ranks, side="right")]
+
+    def median(self) -> float:
+        lo, hi = self._at_rank([(self.n - 1) // 2, self.n // 2])
+        return _median_of_two(lo, hi)
+
+    def percentile(self, q: float) -> float:
+        rank = q / 100 * (self.n - 1)
+        lo, hi = self._at_rank([int(np.floor(rank)), int(np.ceil(rank))]).astype(np.float64)
+        return float(lo + (hi - lo) * (rank - np.floor(rank)))
+
+    def mean(self) -> float:
+        return float(self.counts @ self.values.astype(np.float64) / self.n)
+
+    def std(self) -> float:
+        dev = self.values.astype(np.float64) - self.mean()
+        return float(np.sqrt(self.counts @ (dev * dev) / self.n))
+
+    def min(self) -> float:
+        return float(self.values[np.flatnonzero(self.counts)[0]])
+
+    def max(self) -> float:
+        return float(self.values[np.flatnonzero(self.counts)[-1]])
+
+
+class _VectorSample:
+    """A sample held as its values."""
+
+    def __init__(self, values: np.ndarray):
+        self.values = values
+        self.n = len(values)
+
+    def median(self) -> float:
+        return float(np.median(self.values))
+
+    def percentile(self, q: float) -> float:
+        return float(np.percentile(self.values, q))
+
+    def mean(self) -> float:
+        return float(np.mean(self.values, dtype=np.float64))
+
+    def std(self) -> float:
+        return float(np.std(self.values, dtype=np.float64))
+
+    def min(self) -> float:
+        return float(self.values.min())
+
+    def max(self) -> float:
+        return float(self.values.max())
+
+
 class ExcessGreenIndexCalculator(GreennessIndexCalculatorPort):
+    """Greenness statistics of the leaf pixels of a patch; ``method`` is reported as ``greenness_value``.
+    ExG and NGRDI come from exact histograms, so their medians equal ``np.median``."""
+
+    # below this many pixels a partition-based median beats the 64K-bin NGRDI histogram
+    NGRDI_HISTOGRAM_MIN_PIXELS = 1 << 15
 
-    def __init__(self, method: Literal["bgr"] = "bgr"):
+    def __init__(self, method: Literal["bgr", "exg", "ngrdi", "vari", "gli"] = "bgr",
+                 indices: Iterable[str] = (), stats: Iterable[str] = ("median",)):
         self.method = method
+        self.indices = list(dict.fromkeys([method, *indices]))
+        self.stats = list(dict.fromkeys(stats))
+        self.columns = value_columns(self.indices, self.stats)
+        self._methods = {"bgr": self._bgr_method, "exg": self._bgr_method, "ngrdi": self._ngrdi_method,
+                         "vari": self._vari_method, "gli": self._gli_method}
+
+        unknown = [s for s in self.stats if not valid_stat(s)]
+        if unknown:
+            raise ValueError(f"Unknown greenness statistics {unknown}; expected {', '.join(STATS)}")
 
     def compute(self, patch: np.ndarray, mask: np.ndarray) -> float:
         """
         # patch assumed in BGR (OpenCV)
-        # b = patch[:, :, 0].astype(np.float32)
-        # g = patch[:, :, 1].astype(np.float32)
-        # r = patch[:, :, 2].astype(np.float32)
         """
-        
-        green_pixels = self._extract_green_pixels(patch, mask)
+        return self.compute_indices(patch, mask, (self.method,))[self.method]
+
+    def compute_all(self, patch: np.ndarray, mask: np.ndarray) -> tuple[float, dict[str, float]]:
+        """The ``method`` median and every configured index/statistic column, from one gather."""
+        return self._results(self._samples(patch, mask, self.indices))
+
+    def accumulator(self) -> "_PatchAccumulator":
+        """``compute_all`` for a patch that arrives in row tiles; see ``_PatchAccumulator``."""
+        return _PatchAccumulator(self)
+
+    def _results(self, samples: dict) -> tuple[float, dict[str, float]]:
+        values = {}
+        for index, sample in samples.items():
+            for stat in self.stats:
+                column = f"{index}_{stat}"
+                if column in self.columns:
+                    values[column] = self._statistic(sample, stat)
+
+        return self._statistic(samples[self.method], "median"), values
+
+    def compute_indices(self, patch: np.ndarray, mask: np.ndarray, methods: Iterable[str]) -> dict[str, float]:
+        """Medians of several indices of one patch from a single gather of its leaf pixels."""
+        return {method: self._statistic(sample, "median")
+                for method, sample in self._samples(patch, mask, methods).items()}
 
-        if self.method == "bgr":
-            green_inx = self._bgr_method(green_pixels)
-        elif self.method == "ngrdi":
-            green_inx = self._ngrdi_method(green_pixels)        
-        else:
-            raise PipelineError(message=f"Unknown method: {self.method}", step='Green Index Calculator')        
+    def _samples(self, patch: np.ndarray, mask: np.ndarray, methods: Iterable[str]) -> dict:
+        methods = list(methods)
+        for method in methods:
+            if method not in self._methods:
+                raise PipelineError(message=f"Unknown method: {method}", step='Green Index Calculator')
 
+        b, g, r, keep = self._extract_green_pixels(patch, mask)
 
-        return green_inx
-    
-    def _extract_green_pixels(self, patch: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        return {method: self._methods[method](b, g, r, keep) for method in methods}
+
+    @staticmethod
+    def _statistic(sample, stat: str) -> float:
+        if sample.n == 0:
+            return float("nan")
+        if stat.startswith("p"):
+            return sample.percentile(float(stat[1:]))
+        return getattr(sample, stat)()
+
+    def _extract_green_pixels(self, patch: np.ndarray, mask: np.ndarray) -> tuple[np.ndarray, ...]:
+        """b, g, r (int16) of the masked pixels, and which of them pass the dark-pixel filter."""
         h_p, w_p = patch.shape[:2]
         h_m, w_m = mask.shape[:2]
 
         if h_p != h_m or w_p != w_m:
             raise PipelineError(message=f'SHAPE_MISMATCH] Patch shape {h_p, w_p} != mask shape {h_m, w_m}', step='Green Index Calculator')
-        
-        green_pixels = cv2.bitwise_and(patch, patch, mask=mask)
-        green_pixels = green_pixels.astype(np.float32)
 
-        return green_pixels
-    
-    def _bgr_method(self, green_pixels: np.ndarray) -> float:
-        b, g, r = cv2.split(green_pixels)
-        exg = 2 * g - r - b
+        # (N, 3) uint8, the only copy of pixel data
+        pixels = np.compress(mask.reshape(-1) != 0, patch.reshape(-1, patch.shape[2]), axis=0)
+        b = pixels[:, 0].astype(np.int16)
+        g = pixels[:, 1].astype(np.int16)
+        r = pixels[:, 2].astype(np.int16)
+
+        keep = ((g + r) > 20) & (np.abs(g - r) > 2)  # remove dark pixels
+        return b, g, r, keep
+
+    def _bgr_method(self, b: np.ndarray, g: np.ndarray, r: np.ndarray, keep: np.ndarray) -> _HistogramSample:
+        bins = 2 * _EXG_OFFSET + 1
+        exg = np.where(keep, 2 * g - r - b + _EXG_OFFSET, bins)  # dark pixels go to an extra bin
+        counts = np.bincount(exg, minlength=bins + 1)[:bins]
+        return _exg_sample(counts)
+
+    def _ngrdi_method(self, b: np.ndarray, g: np.ndarray, r: np.ndarray, keep: np.ndarray):
+        bins = 256 * 256
+        if len(g) < self.NGRDI_HISTOGRAM_MIN_PIXELS:
+            return _VectorSample(_NGRDI_FLAT[g[keep].astype(np.int32) * 256 + r[keep]])
+
+        index = np.where(keep, g.astype(np.int32) * 256 + r, bins)
+        counts = np.bincount(index, minlength=bins + 1)[:bins]
+        return _ngrdi_sample(counts)
+
+    def _vari_method(self, b: np.ndarray, g: np.ndarray, r: np.ndarray, keep: np.ndarray) -> _VectorSample:
+        # (g - r) / (g + r - b); pixels with a zero denominator are left out
+        denominator = g + r - b
+        keep = keep & (denominator != 0)
+        return _VectorSample((g[keep] - r[keep]).astype(np.float32) / denominator[keep])
+
+    def _gli_method(self, b: np.ndarray, g: np.ndarray, r: np.ndarray, keep: np.ndarray) -> _VectorSample:
+        # (2g - r - b) / (2g + r + b); the denominator is > 20 after the dark-pixel filter
+        g2, r, b = 2 * g[keep], r[keep], b[keep]
+        return _VectorSample((g2 - r - b).astype(np.float32) / (g2 + r + b))
+
+
+class _PatchAccumulator(PatchAccumulatorPort):
+    """Leaf-pixel statistics of one patch fed in row tiles, top to bottom; ``result`` equals ``compute_all``."""
+
+    def __init__(self, calc: ExcessGreenIndexCalculator):
+        self.calc = calc
+        self.n = 0  # masked pixels, the quantity that picks NGRDI's representation
+        self._counts: dict[str, np.ndarray] = {}
+        self._parts: dict[str, list[np.ndarray]] = {index: [] for index in calc.indices}
+
+    def add(self, patch: np.ndarray, mask: np.ndarray) -> None:
+        b, g, r, keep = self.calc._extract_green_pixels(patch, mask)
+        self.n += len(g)
 
-        mask = ((g + r) > 20) & (np.abs(g - r) > 2)  # remove dark pixels
+        for index in self.calc.indices:
+            if index in ("bgr", "exg"):
+                self._add_counts(index, self.calc._bgr_method(b, g, r, keep).counts)
+            elif index == "ngrdi":
+                self._parts[index].append(g[keep].astype(np.int32) * 256 + r[keep])
+                if self.n >= self.calc.NGRDI_HISTOGRAM_MIN_PIXELS:
+                    codes = np.concatenate(self._parts[index])
+                    self._add_counts(index, np.bincount(codes, minlength=256 * 256))
+                    self._parts[index].clear()
+            else:
+                self._parts[index].append(self.calc._methods[index](b, g, r, keep).values)
 
-        return float(np.median(exg[mask]))
-    
-    def _ngrdi_method(self, green_pixels: np.ndarray) -> float:
-        b, g, r = cv2.split(green_pixels)
-        ngrdi = (g - r) / (g + r + 1e-6)
+    def result(self) -> tuple[float, dict[str, float]]:
+        samples = {}
+        for index in self.calc.indices:
+            parts = self._parts[index]
+            if index in ("bgr", "exg"):
+                samples[index] = _exg_sample(self._counts.get(index, np.zeros(2 * _EXG_OFFSET + 1, np.int64)))
+            elif index == "ngrdi" and self.n >= self.calc.NGRDI_HISTOGRAM_MIN_PIXELS:
+                samples[index] = _ngrdi_sample(self._counts[index])
+            elif index == "ngrdi":
+                samples[index] = _VectorSample(_NGRDI_FLAT[np.concatenate(parts)] if parts else
+                                               np.empty(0, np.float32))
+            else:
+                samples[index] = _VectorSample(np.concatenate(parts) if parts else np.empty(0, np.float32))
 
-        mask = ((g + r) > 20) & (np.abs(g - r) > 2)  # remove dark pixels
+        return self.calc._results(samples)
 
-        return float(np.median(ngrdi[mask]))
\ No newline at end of file
+    def _add_counts(self, index: str, counts: np.ndarray) -> None:
+        previous = self._counts.get(index)
+        self._counts[index] = counts if previous is None else previous + counts
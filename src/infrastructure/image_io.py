@@ -1,13 +1,107 @@
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, TypeVar
+import logging
+import time
 import cv2
 import numpy as np
-from pathlib import Path
 from domain.ports import ImageLoaderPort
+from domain.entities import DecodedImage
 from domain.exceptions import PipelineError
 
+logger = logging.getLogger(__name__)
+T = TypeVar("T")
+
+# 16-bit PNG/TIFF frames keep their depth; DecodedImage reduces them to 8 bits where needed
+IMREAD_FLAGS = cv2.IMREAD_ANYDEPTH | cv2.IMREAD_COLOR
+
 
 class OpenCVImageLoader(ImageLoaderPort):
-    def load(self, path: Path) -> np.ndarray:
-        img = cv2.imread(str(path), cv2.IMREAD_COLOR)
+    def load(self, path: Path) -> DecodedImage:
+        img = cv2.imread(str(path), IMREAD_FLAGS)
+        if img is None:
+            raise PipelineError(message='Could not load image', step='Image Loader')
+        return DecodedImage.from_decoded(path, img)
+
+
+class PrefetchingImageLoader(ImageLoaderPort):
+    """Decodes the next ``depth`` images on a thread pool while the current one is processed,
+    with at most ``max_bytes`` of decoded frames waiting."""
+
+    def __init__(self, depth: int = 4, threads: int | None = None, max_bytes: int = 512 * 2**20):
+        self.depth = max(1, depth)
+        self.max_bytes = max_bytes
+        self._pool = ThreadPoolExecutor(max_workers=threads or min(self.depth, 4), thread_name_prefix="prefetch")
+        self._queue: OrderedDict[Path, Future] = OrderedDict()
+        self._frame_bytes = 0  # size of the last decoded frame
+
+        self.ready = 0      # loads served from a frame that was already decoded
+        self.starved = 0    # loads that had to wait for their frame
+        self.wait_s = 0.0
+        self.unscheduled = 0
+
+    def prefetch(self, items: Iterable[T], path: Callable[[T], Path] = lambda sample: sample.path) -> Iterator[T]:
+        """Yield ``items`` unchanged, keeping the images of the next ones decoding ahead."""
+        items = iter(items)
+        ahead: list[T] = []
+        while True:
+            while len(ahead) <= self.depth and self._queued_bytes() < self.max_bytes:
+                item = next(items, None)
+                if item is None:
+                    break
+                ahead.append(item)
+                p = Path(path(item))
+                self._queue[p] = self._pool.submit(self._read, p)
+            if not ahead:
+                return
+            yield ahead.pop(0)
+
+    def load(self, path: Path) -> DecodedImage:
+        path = Path(path)
+        future = self._queue.get(path)
+        if future is None:
+            self.unscheduled += 1
+            img = self._read(path)
+        else:
+            # frames scheduled before this one were skipped by the caller
+            while next(iter(self._queue)) != path:
+                self._queue.popitem(last=False)[1].cancel()
+            if future.done():
+                self.ready += 1
+            else:
+                self.starved += 1
+                start = time.perf_counter()
+                wait([future])
+                self.wait_s += time.perf_counter() - start
+            del self._queue[path]
+            img = future.result()
+
         if img is None:
             raise PipelineError(message='Could not load image', step='Image Loader')
+        return DecodedImage.from_decoded(path, img)
+
+    def close(self) -> None:
+        for future in self._queue.values():
+            future.cancel()
+        self._queue.clear()
+        self._pool.shutdown(wait=True)
+        loads = self.ready + self.starved
+        if loads:
+            logger.info(f"Prefetch: {self.ready} of {loads} frames were ready; waited {self.wait_s:.2f} s "
+                        f"for the other {self.starved}.")
+
+    def _read(self, path: Path) -> np.ndarray | None:
+        try:
+            with open(path, "rb") as f:
+                data = np.frombuffer(f.read(), dtype=np.uint8)
+        except OSError:
+            return None  # reported like an undecodable file, as cv2.imread does
+        img = cv2.imdecode(data, IMREAD_FLAGS)
+        if img is not None:
+            self._frame_bytes = img.nbytes
         return img
+
+    def _queued_bytes(self) -> int:
+        return sum(f.result().nbytes if f.done() and not f.exception() and f.result() is not None
+                   else self._frame_bytes for f in self._queue.values())
@@ -4,7 +4,7 @@ import cv2
 from domain.ports import LeafSegmentationPort
 from domain.exceptions import PipelineError, PipelineErrorType
 from config.settings import SamLeafSegConfig
-from segment_anything import sam_model_registry, SamAutomaticMaskGenerator
+from infrastructure.mask_kernels import ThresholdMaskEngine
 
 
 
@@ -29,11 +29,67 @@ class LeafSegmentor(LeafSegmentationPort):
         self.hsv_v_min = hsv_v_min
         self.mask_are_min = mask_are_min
         self.sam_config = sam_config
+        self.mask_engine = ThresholdMaskEngine(nexg_thresh, exg_thresh, hsv_h_range, hsv_s_min, hsv_v_min)
+        self._scratch = np.empty(0, dtype=np.uint8)
 
         if self.sam_config is not None:
             self._load_sam()
 
+    # rows above and below a pixel that _morphology_mask's result at that pixel depends on
+    MORPHOLOGY_HALO = 9
+    # _morphology_mask's result lies within an 11x11 dilation of its first erosion
+    MORPHOLOGY_MAX_GROWTH = 11 * 11
+
+    _RECT_3 = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+    _RECT_5 = cv2.getStructuringElement(cv2.MORPH_RECT, (5, 5))
+    _RECT_7 = cv2.getStructuringElement(cv2.MORPH_RECT, (7, 7))
+
     def extract(self, image_rgb: np.ndarray, checker_bbox: np.ndarray) -> np.ndarray:
+        mask = self.mask(image_rgb, checker_bbox)
+        overlay = self._overlay_img_mask(image_rgb, mask)
+
+        return mask, overlay
+
+    def mask(self, image_rgb: np.ndarray, checker_bbox: np.ndarray, tile_rows: int | None = None) -> np.ndarray:
+        """The leaf mask without the overlay. With ``tile_rows`` it is built in bands read with a
+        MORPHOLOGY_HALO on both sides, which gives the same mask; SAM ignores ``tile_rows``."""
+        h = image_rgb.shape[0]
+        if tile_rows is None or tile_rows >= h or self.method == "sam":
+            mask = self._threshold_mask(image_rgb)
+            cv2.fillPoly(mask, [checker_bbox], (0, 0, 0))
+            mask = self._morphology_mask(mask, reject_small=True)
+        else:
+            # fillPoly clips at the canvas border, so the checker is rasterised once over the
+            # full-width rows it spans, which clips exactly like the whole-frame call
+            c0, c1 = max(0, int(checker_bbox[:, 1].min())), min(h, int(checker_bbox[:, 1].max()) + 1)
+            checker = np.full((max(0, c1 - c0), image_rgb.shape[1]), 255, dtype=np.uint8)
+            cv2.fillPoly(checker, [checker_bbox - np.array([0, c0], dtype=checker_bbox.dtype)], (0, 0, 0))
+
+            mask = np.empty(image_rgb.shape[:2], dtype=np.uint8)
+            for y0 in range(0, h, tile_rows):
+                y1 = min(h, y0 + tile_rows)
+                top, bottom = max(0, y0 - self.MORPHOLOGY_HALO), min(h, y1 + self.MORPHOLOGY_HALO)
+                band = self._threshold_mask(image_rgb[top:bottom])
+                a, b = max(top, c0), min(bottom, c1)
+                if a < b:
+                    np.bitwise_and(band[a - top:b - top], checker[a - c0:b - c0], out=band[a - top:b - top])
+                mask[y0:y1] = self._morphology_mask(band)[y0 - top:y1 - top]
+
+        if cv2.countNonZero(mask) * 255 < self.mask_are_min:  # the mask is 0/255; the limit is on its sum
+            raise PipelineError(message='No leaf detected', step='Leaf Segmentor')
+
+        return mask
+
+    def overlay(self, image: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        return self._overlay_img_mask(image, mask)
+
+    def _threshold_mask(self, image_rgb: np.ndarray) -> np.ndarray:
+        if self.method in ("nexg", "exg", "hsv") and image_rgb.dtype == np.uint8 and image_rgb.ndim == 3:
+            return self.mask_engine.mask(image_rgb, self.method)
+        return (self._reference_mask(image_rgb) * 255).astype(np.uint8)
+
+    def _reference_mask(self, image_rgb: np.ndarray) -> np.ndarray:
+        """Boolean mask from the float formulas; the fast kernels must match these bit for bit."""
         if self.method == "nexg":
             mask = self._nexg_mask(image_rgb)
         elif self.method == "exg":
@@ -43,19 +99,11 @@ class LeafSegmentor(LeafSegmentationPort):
         elif self.method == 'sam':
             if self.sam_config is None:
                 raise PipelineError(message="SAM Config can not be None", step='Leaf Segmentor', error_type=PipelineErrorType.FATAL)
-            mask = self._hsv_mask(image_rgb)
+            mask = self._sam_masks(image_rgb)
         else:
             raise PipelineError(message=f"Unknown method: {self.method}", step='Leaf Segmentor', error_type=PipelineErrorType.FATAL)
 
-        mask = (mask * 255).astype(np.uint8)
-        cv2.fillPoly(mask, [checker_bbox], (0, 0, 0))
-        mask = self._morphology_mask(mask)
-        overlay = self._overlay_img_mask(image_rgb, mask)
-        
-        if np.sum(mask) < self.mask_are_min:
-            raise PipelineError(message='No leaf detected', step='Leaf Segmentor')
-
-        return mask, overlay
+        return mask
     
     
     def _nexg_mask(self, image_rgb: np.ndarray) -> np.ndarray:
@@ -95,48 +143,118 @@ class LeafSegmentor(LeafSegmentationPort):
         return mask
     
     def _sam_masks(self, image_rgb: np.ndarray) -> np.ndarray:
+        """Leaf mask from SAM on a downscaled frame, prompted with points seeded from the HSV mask
+        and filtered by quality, area and green ratio."""
+        import torch
+        from segment_anything.utils.amg import calculate_stability_score
 
-        hsv_mask = self._hsv_mask(image_rgb)
-
+        cfg = self.sam_config
         H, W = image_rgb.shape[:2]
-        img_area = H * W
+        scale = min(1.0, cfg.embed_max_side / max(H, W))
+        small = image_rgb if scale == 1.0 else cv2.resize(image_rgb, (round(W * scale), round(H * scale)),
+                                                          interpolation=cv2.INTER_AREA)
+        h, w = small.shape[:2]
 
-        masks = self.mask_gen.generate(image_rgb)
-        mask = np.zeros((H, W), dtype=bool)
+        hsv_mask = self._hsv_mask(small)
+        seeds = self._sam_seed_points(hsv_mask)
+        if len(seeds) == 0:
+            return np.zeros((H, W), dtype=bool)
 
-        for m in masks:
-            seg = m["segmentation"]
-            area_frac = seg.sum() / img_area
-            if area_frac < self.sam_config.min_area_frac or area_frac > self.sam_config.max_area_frac:
-                continue
+        # the pipeline hands over OpenCV's channel order
+        self.sam_predictor.set_image(small, image_format="BGR")
+        threshold = self.sam_predictor.model.mask_threshold
+        device = self.sam_predictor.device
 
-            green_ratio = float((hsv_mask & seg).sum() / seg.sum())
+        masks, quality = [], []
+        with torch.inference_mode():
+            for start in range(0, len(seeds), cfg.points_per_batch):
+                points = torch.as_tensor(seeds[start:start + cfg.points_per_batch], device=device)
+                coords = self.sam_predictor.transform.apply_coords_torch(points[:, None, :], (h, w))
+                labels = torch.ones(coords.shape[:2], dtype=torch.int, device=device)
+                logits, iou, _ = self.sam_predictor.predict_torch(coords, labels, multimask_output=True,
+                                                                  return_logits=True)
+                rows = torch.arange(len(iou), device=device)
+                best = iou.argmax(dim=1)
+                logits, iou = logits[rows, best], iou[rows, best]
+                stability = calculate_stability_score(logits, threshold, 1.0)
 
-            if green_ratio < self.sam_config.green_score_thresh:
-                continue
+                masks.append((logits > threshold).cpu().numpy())
+                quality.append(torch.stack([iou, stability], dim=1).cpu().numpy())
+        self.sam_predictor.reset_image()
 
-            mask |= seg
+        masks = np.concatenate(masks)  # (N, h, w) bool
+        iou, stability = np.concatenate(quality).T
+
+        flat = masks.reshape(len(masks), -1)
+        area = np.count_nonzero(flat, axis=1)
+        green = np.count_nonzero(flat[:, hsv_mask.reshape(-1)], axis=1)
+        area_frac = area / (h * w)
+        min_area_frac = max(cfg.min_area_frac, cfg.min_mask_region_area / (H * W))
+
+        keep = ((iou >= cfg.pred_iou_thresh) & (stability >= cfg.stability_score_thresh)
+                & (area_frac >= min_area_frac) & (area_frac <= cfg.max_area_frac)
+                & (green >= cfg.green_score_thresh * np.maximum(area, 1)))
+
+        mask = masks[keep].any(axis=0) if keep.any() else np.zeros((h, w), dtype=bool)
+        if scale != 1.0:
+            mask = cv2.resize(mask.astype(np.uint8), (W, H), interpolation=cv2.INTER_NEAREST).astype(bool)
+
+        return mask
+
+    def _sam_seed_points(self, green: np.ndarray) -> np.ndarray:
+        """(x, y) prompts: the most interior green pixel of each cell of a seed_grid x seed_grid grid."""
+        n = self.sam_config.seed_grid
+        dist = cv2.distanceTransform(green.astype(np.uint8), cv2.DIST_L2, 3)
+
+        h, w = dist.shape
+        ch, cw = -(-h // n), -(-w // n)
+        padded = np.zeros((ch * n, cw * n), np.float32)
+        padded[:h, :w] = dist
+        cells = padded.reshape(n, ch, n, cw).transpose(0, 2, 1, 3).reshape(n * n, ch * cw)
+
+        best = cells.argmax(axis=1)
+        depth = cells[np.arange(n * n), best]
+        cell_y, cell_x = np.divmod(np.arange(n * n), n)
+        x = cell_x * cw + best % cw
+        y = cell_y * ch + best // cw
+
+        # at least 2 px inside a green region, so speckle does not become a prompt
+        return np.stack([x, y], axis=1)[depth >= 2].astype(np.float32)
 
-        return mask 
-    
-    
     def _load_sam(self):
+        """Build the SAM predictor once; it stays loaded for every image this segmentor sees."""
+        import torch
+        from segment_anything import sam_model_registry, SamPredictor
+
+        device = self.sam_config.device
+        if device == "auto":
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+
         sam = sam_model_registry[self.sam_config.model_type](checkpoint=self.sam_config.checkpoint_path)
-        sam.to(device=self.sam_config.device)
-
-        self.mask_gen = SamAutomaticMaskGenerator(
-            model=sam,
-            points_per_side=self.sam_config.points_per_side,
-            pred_iou_thresh=self.sam_config.pred_iou_thresh,
-            stability_score_thresh=self.sam_config.stability_score_thresh,
-            crop_n_layers=self.sam_config.crop_n_layers,
-            min_mask_region_area=self.sam_config.min_mask_region_area,
-        )        
-    
-    
-    @staticmethod
-    def _morphology_mask(mask: np.ndarray) -> np.ndarray:
+        sam.to(device=device)
+        sam.eval()
+
+        self.sam_predictor = SamPredictor(sam)
+
+    def _morphology_mask(self, mask: np.ndarray, reject_small: bool = False) -> np.ndarray:
+        """``_reference_morphology`` in place, in four passes instead of nine. ``reject_small`` rejects
+        frames after the first pass once they cannot reach ``mask_are_min`` (only empty ones by default)."""
+        if self._scratch.size < mask.size:
+            self._scratch = np.empty(mask.size, dtype=np.uint8)
+        scratch = self._scratch[:mask.size].reshape(mask.shape)
 
+        cv2.erode(mask, self._RECT_3, dst=scratch)
+        if reject_small and cv2.countNonZero(scratch) * self.MORPHOLOGY_MAX_GROWTH * 255 < self.mask_are_min:
+            raise PipelineError(message='No leaf detected', step='Leaf Segmentor')
+        cv2.dilate(scratch, self._RECT_7, dst=mask)
+        cv2.erode(mask, self._RECT_7, dst=scratch)
+        cv2.dilate(scratch, self._RECT_5, dst=mask)
+
+        return mask
+
+    @staticmethod
+    def _reference_morphology(mask: np.ndarray) -> np.ndarray:
+        """The post-processing as originally written; _morphology_mask must match it bit for bit."""
         kernel = np.ones((3, 3), np.uint8)
         mask_morph = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=1)
         mask_morph = cv2.morphologyEx(mask_morph, cv2.MORPH_CLOSE, kernel, iterations=2)
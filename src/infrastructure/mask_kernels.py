@@ -0,0 +1,88 @@
+import math
+import numpy as np
+import cv2
+
+
+class ThresholdMaskEngine:
+    """Tiled kernels for the nexg, exg and hsv masks, bit-identical to LeafSegmentor's float formulas."""
+
+    def __init__(
+        self,
+        nexg_thresh: float,
+        exg_thresh: float,
+        hsv_h_range: tuple[int, int],
+        hsv_s_min: int,
+        hsv_v_min: int,
+        tile_pixels: int = 1 << 20
+    ):
+        self.nexg_thresh = np.float32(nexg_thresh)
+        self.exg_thresh = float(np.float32(exg_thresh))
+        self.hsv_lower = (max(0, math.ceil(hsv_h_range[0])), max(0, math.ceil(hsv_s_min)), max(0, math.ceil(hsv_v_min)))
+        self.hsv_upper = (min(255, math.floor(hsv_h_range[1])), 255, 255)
+        self.tile_pixels = tile_pixels
+        self._width = None
+
+    def mask(self, image_rgb: np.ndarray, method: str) -> np.ndarray:
+        kernel = {"nexg": self._nexg_tile, "exg": self._exg_tile, "hsv": self._hsv_tile}[method]
+
+        h, w = image_rgb.shape[:2]
+        rows = self._prepare(w)
+        out = np.empty((h, w), dtype=np.uint8)
+        for y in range(0, h, rows):
+            kernel(image_rgb[y:y + rows], out[y:y + rows])
+
+        return out
+
+    def _prepare(self, width: int) -> int:
+        rows = max(1, self.tile_pixels // width)
+        if self._width != width:
+            self._width = width
+            self._s16 = np.empty((rows, width), dtype=np.int16)
+            self._d16 = np.empty((rows, width), dtype=np.int16)
+            self._f32 = np.empty((rows, width), dtype=np.float32)
+            self._flag = np.empty((rows, width), dtype=bool)
+            self._hsv = np.empty((rows, width, 3), dtype=np.uint8)
+        return rows
+
+    def _nexg_tile(self, tile: np.ndarray, out: np.ndarray) -> None:
+        # nexg = 2g - r - b = (3G - S) / S, so nexg > t  <=>  3G - S > t * S  (S = R + G + B > 0).
+        n = tile.shape[0]
+        R, G, B = tile[:, :, 0], tile[:, :, 1], tile[:, :, 2]
+        s, d, margin, flag = self._s16[:n], self._d16[:n], self._f32[:n], self._flag[:n]
+
+        np.add(R, G, out=s, dtype=np.int16)
+        np.add(s, B, out=s)
+        np.multiply(G, 3, out=d, dtype=np.int16)
+        np.subtract(d, s, out=d)
+
+        np.multiply(s, -self.nexg_thresh, out=margin)
+        np.add(margin, d, out=margin)
+        np.greater(margin, 0, out=flag)
+        np.multiply(flag, 255, out=out, dtype=np.uint8, casting="unsafe")
+
+        # Close to the threshold the float32 rounding of the reference formula decides, so
+        # those few pixels (and S == 0) are re-evaluated with the exact reference arithmetic.
+        np.abs(margin, out=margin)
+        np.less_equal(margin, np.add(s, 1, dtype=np.float32) * (1e-3 * max(1.0, abs(float(self.nexg_thresh)))), out=flag)
+        ys, xs = np.nonzero(flag)
+        if len(ys):
+            px = tile[ys, xs].astype(np.float32)
+            sum_rgb = px[:, 0] + px[:, 1] + px[:, 2] + 1e-6
+            nexg = 2 * (px[:, 1] / sum_rgb) - px[:, 0] / sum_rgb - px[:, 2] / sum_rgb
+            out[ys, xs] = (nexg > self.nexg_thresh) * np.uint8(255)
+
+    def _exg_tile(self, tile: np.ndarray, out: np.ndarray) -> None:
+        # 2G - R - B is an exact integer, so the comparison needs no floating point at all.
+        n = tile.shape[0]
+        e, flag = self._d16[:n], self._flag[:n]
+
+        np.multiply(tile[:, :, 1], 2, out=e, dtype=np.int16)
+        np.subtract(e, tile[:, :, 0], out=e)
+        np.subtract(e, tile[:, :, 2], out=e)
+        np.greater(e, self.exg_thresh, out=flag)
+        np.multiply(flag, 255, out=out, dtype=np.uint8, casting="unsafe")
+
+    def _hsv_tile(self, tile: np.ndarray, out: np.ndarray) -> None:
+        hsv = self._hsv[:tile.shape[0]]
+        cv2.cvtColor(tile, cv2.COLOR_RGB2HSV, dst=hsv)
+        cv2.inRange(hsv, self.hsv_lower, self.hsv_upper, dst=out)
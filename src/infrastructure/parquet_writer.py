@@ -0,0 +1,166 @@
+from pathlib import Path
+import logging
+import os
+import re
+import numpy as np
+from domain.ports import ResultWriterPort
+from domain.entities import GreennessMeasurement
+from domain.measurements import MeasurementBuffer
+
+logger = logging.getLogger(__name__)
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("--output-format parquet needs pyarrow (pip install pyarrow)") from e
+    return pyarrow, pyarrow.parquet
+
+
+class ParquetResultWriter(ResultWriterPort):
+    """Streams measurements to ``<output_dir>/folder_name=<name>/part-<n>.parquet``; parts are fsynced and
+    renamed from ``.tmp`` every ``checkpoint_interval`` rows."""
+
+    def __init__(self, output_dir: Path, value_columns: list[str] = (), batch_size: int = 4096,
+                 checkpoint_interval: int = 65536, compression: str = "zstd"):
+        self.pa, self.pq = _import_pyarrow()
+        self.output_dir = Path(output_dir)
+        self.value_columns = list(value_columns)
+        self.batch_size = batch_size
+        self.checkpoint_interval = checkpoint_interval
+        self.compression = compression
+
+        pa = self.pa
+        self.schema = pa.schema([
+            ("image_path", pa.dictionary(pa.int32(), pa.string())),
+            ("lat", pa.float64()),
+            ("long", pa.float64()),
+            ("patch_id", pa.int32()),
+            ("x", pa.int32()),
+            ("y", pa.int32()),
+            ("w", pa.int32()),
+            ("h", pa.int32()),
+            ("greenness_value", pa.float32()),
+            *[(column, pa.float32()) for column in self.value_columns],
+        ])
+        self._tables: dict[str, list] = {}  # folder -> pending pyarrow tables
+        self._pending = 0
+        self._since_checkpoint = 0
+        self._writers: dict[str, tuple] = {}  # folder -> (ParquetWriter, tmp path)
+        self._part = 0
+
+    def write_all(self, measurements: MeasurementBuffer | list[GreennessMeasurement]) -> None:
+        self.open()
+        self.write(measurements)
+        self.close()
+
+    def read_measurements(self) -> MeasurementBuffer:
+        """The rows in the finished parts of the dataset, e.g. the ones a resumed run keeps."""
+        return read_measurements(self.output_dir)
+
+    def open(self, resume: bool = False) -> set[str]:
+        """Prepare the dataset directory and return the image paths it already holds (resume only)."""
+        done: set[str] = set()
+        if self.output_dir.exists():
+            for leftover in self.output_dir.glob("folder_name=*/*.parquet.tmp"):
+                leftover.unlink()  # part of a crashed run that never reached a checkpoint
+            parts = sorted(self.output_dir.glob("folder_name=*/part-*.parquet"))
+            if resume:
+                done = self._recover(parts)
+            else:
+                for part in parts:
+                    part.unlink()
+
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        existing = [int(m.group(1)) for p in self.output_dir.glob("folder_name=*/part-*.parquet")
+                    if (m := re.fullmatch(r"part-(\d+)\.parquet", p.name))]
+        self._part = max(existing, default=-1) + 1
+
+        return done
+
+    def write(self, measurements: MeasurementBuffer | list[GreennessMeasurement]) -> None:
+        buffer = MeasurementBuffer.of(measurements, self.value_columns)
+        for folder, rows in buffer.by_folder():
+            columns = {"image_path": rows.image_paths()}
+            for name in self.schema.names[1:]:
+                if name in rows.dtype.names:
+                    columns[name] = np.ascontiguousarray(rows.column(name))
+                else:
+                    columns[name] = [None] * len(rows)  # column this run never computed
+            self._tables.setdefault(folder, []).append(self.pa.Table.from_pydict(columns, schema=self.schema))
+        self._pending += len(buffer)
+
+        if self._pending >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        for folder, tables in self._tables.items():
+            table = self.pa.concat_tables(tables).combine_chunks()
+            self._writer_for(folder).write_table(table)
+        self._since_checkpoint += self._pending
+        self._tables.clear()
+        self._pending = 0
+
+        if self._since_checkpoint >= self.checkpoint_interval:
+            self.checkpoint()
+
+    def checkpoint(self) -> None:
+        """Finish the open parts; later rows go to new parts."""
+        for writer, tmp in self._writers.values():
+            writer.close()
+            with open(tmp, "rb") as f:
+                os.fsync(f.fileno())
+            os.replace(tmp, tmp.with_suffix(""))
+        if self._writers:
+            self._part += 1
+        self._writers.clear()
+        self._since_checkpoint = 0
+
+    def close(self) -> None:
+        self.flush()
+        self.checkpoint()
+
+    def _writer_for(self, folder: str):
+        if folder not in self._writers:
+            directory = self.output_dir / f"folder_name={_partition_value(folder)}"
+            directory.mkdir(parents=True, exist_ok=True)
+            tmp = directory / f"part-{self._part:05d}.parquet.tmp"
+            writer = self.pq.ParquetWriter(tmp, self.schema, compression=self.compression)
+            self._writers[folder] = (writer, tmp)
+        return self._writers[folder][0]
+
+    def _recover(self, parts: list[Path]) -> set[str]:
+        done: set[str] = set()
+        for part in parts:
+            schema = self.pq.read_schema(part)
+            if schema.names != self.schema.names:
+                raise ValueError(f"Cannot resume {self.output_dir}: {part} has columns {schema.names}, "
+                                 f"expected {self.schema.names}. Use the same --green-indx/--green-stats "
+                                 f"as the first run.")
+            paths = self.pq.read_table(part, columns=["image_path"]).column("image_path")
+            done.update(paths.combine_chunks().dictionary_decode().to_pylist())
+        return done
+
+
+def read_measurements(output_dir: Path) -> MeasurementBuffer:
+    """The rows of a dataset written by ParquetResultWriter, part by part, without its index
+    value columns. Values stored as float32 come back widened to float64."""
+    pa, pq = _import_pyarrow()
+    columns = ["image_path", "lat", "long", "patch_id", "x", "y", "w", "h", "greenness_value"]
+    parts = sorted(Path(output_dir).glob("folder_name=*/part-*.parquet"), key=lambda p: (p.name, p.parent.name))
+    buffers = []
+    for part in parts:
+        table = pq.read_table(part, columns=columns)
+        values = {name: table.column(name).to_numpy() for name in columns[1:]}
+        values["image_path"] = table.column("image_path").combine_chunks().dictionary_decode().to_pylist()
+        folder = re.sub(r"%([0-9A-F]{2})", lambda m: chr(int(m.group(1), 16)), part.parent.name[len("folder_name="):])
+        values["folder_name"] = [folder] * table.num_rows
+        buffers.append(MeasurementBuffer.from_columns(values))
+    return MeasurementBuffer.concat(buffers)
+
+
+def _partition_value(folder: str) -> str:
+    # Hive partition values are URL-style; escape what would break the path
+    return re.sub(r'[/\\:%=]', lambda m: f"%{ord(m.group()):02X}", folder)
@@ -1,26 +1,115 @@
+from typing import Callable
+import math
+import cv2
 import numpy as np
 from domain.ports import PatchSelectorPort
 from domain.entities import PatchRegion
+from domain.exceptions import PipelineError
 
 
-def _extract_feature(patch: np.ndarray) -> np.ndarray:
-    pass
+def _extract_feature(colour_sum: np.ndarray, leaf_count: np.ndarray) -> np.ndarray:
+    """Mean leaf colour from summed colour and leaf pixel count (rows of windows, or one window)."""
+    return colour_sum / np.maximum(leaf_count, 1e-9)[..., None]
 
 
-def _cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
-    pass
+def _cosine_similarity(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Cosine similarity of each row of ``a`` with the vector ``b``."""
+    return (a @ b) / np.maximum(np.linalg.norm(a, axis=-1) * np.linalg.norm(b), 1e-12)
+
+
+def _summed_area_table(cells: np.ndarray) -> np.ndarray:
+    """Zero-padded 2-D prefix sums, so any block of cells sums with four lookups."""
+    table = np.zeros((cells.shape[0] + 1, cells.shape[1] + 1) + cells.shape[2:], dtype=np.float64)
+    table[1:, 1:] = cells.cumsum(axis=0).cumsum(axis=1)
+    return table
 
 
 class CorrelationBasedPatchSelector(PatchSelectorPort):
-    def __init__(self, stride_fraction: float = 0.5):
+    """Picks the ``num_patches`` square windows with the most leaf whose colour is closest to the frame's;
+    ``num_patches == 1`` keeps the whole frame."""
+
+    # Scores are cell averages, so they are taken from a regular subsample: about 32
+    # pixels along each side of a cell, more for small cells while the frame's sample
+    # stays under SAMPLE_PIXELS, but never fewer than 8.
+    SAMPLE_PIXELS = 1 << 20
+
+    def __init__(self, stride_fraction: float = 0.5, patch_fraction: float = 0.25,
+                 min_coverage: float = 0.05, max_iou: float = 0.0):
         self.stride_fraction = stride_fraction
+        self.patch_fraction = patch_fraction
+        self.min_coverage = min_coverage
+        self.max_iou = max_iou
+
+    def select_patches(self, image: np.ndarray, checker_bbox: np.ndarray, num_patches: int,
+                       mask: np.ndarray | None = None,
+                       transform: Callable[[np.ndarray], np.ndarray] | None = None) -> list[PatchRegion]:
+        """``transform`` is a per-pixel colour transform (e.g. the colour correction) to apply
+        to the sampled pixels, for callers that do not hold a transformed copy of the frame."""
+        h_img, w_img = image.shape[:2]
+        if num_patches <= 1:
+            return [PatchRegion(x=0, y=0, w=w_img-1, h=h_img-1, patch_id=0)]
+
+        # windows are k x k cells of cell x cell pixels and move one cell at a time
+        side = max(1, round(min(h_img, w_img) * self.patch_fraction))
+        cell = max(1, round(side * self.stride_fraction))
+        k = max(1, round(side / cell))
+        side = k * cell
+        rows, cols = h_img // cell, w_img // cell
+        if rows < k or cols < k:
+            raise PipelineError(message=f'Image {w_img}x{h_img} smaller than a {side}px patch', step='Patch Selector')
+
+        size = (cols, rows)
+        step = max(1, min(cell // 8, max(cell // 32, math.isqrt(h_img * w_img // self.SAMPLE_PIXELS))))
+        crop = (slice(0, rows * cell, step), slice(0, cols * cell, step))
+        pixels = np.ascontiguousarray(image[crop])
+        if transform is not None:
+            pixels = transform(pixels)
+        if mask is None:
+            leaf = np.ones((rows, cols), dtype=np.float32)
+            colour = cv2.resize(pixels, size, interpolation=cv2.INTER_AREA).astype(np.float32)
+        else:
+            leaf_pixels = np.ascontiguousarray(mask[crop])
+            leaf = cv2.resize(leaf_pixels, size, interpolation=cv2.INTER_AREA).astype(np.float32) / 255
+            masked = cv2.bitwise_and(pixels, pixels, mask=leaf_pixels)
+            colour = cv2.resize(masked, size, interpolation=cv2.INTER_AREA).astype(np.float32)
 
-    def select_patches(self, image: np.ndarray, checker_bbox: np.ndarray, num_patches: int) -> list[PatchRegion]:
-        h_img, w_img, _ = image.shape
-        # x1, y1 = np.min(checker_bbox, axis=0)
-        # x2, y2 = np.max(checker_bbox, axis=0)
+        leaf_table = _summed_area_table(leaf)
+        colour_table = _summed_area_table(colour)
+
+        def window_sums(table):
+            return table[k:, k:] - table[:-k, k:] - table[k:, :-k] + table[:-k, :-k]
+
+        leaf_sum = window_sums(leaf_table).reshape(-1)
+        colour_sum = window_sums(colour_table).reshape(leaf_sum.size, -1)
+        coverage = leaf_sum / (k * k)
+
+        reference = _extract_feature(colour_table[-1, -1], leaf_table[-1, -1])
+        score = coverage * np.clip(_cosine_similarity(_extract_feature(colour_sum, leaf_sum), reference), 0, 1)
+
+        win_y, win_x = np.divmod(np.arange(leaf_sum.size), cols - k + 1)
+        win_x, win_y = win_x * cell, win_y * cell
+
+        valid = coverage >= self.min_coverage
+        if checker_bbox is not None and len(checker_bbox):
+            x1, y1 = np.min(checker_bbox, axis=0)
+            x2, y2 = np.max(checker_bbox, axis=0)
+            valid &= (win_x > x2) | (win_x + side <= x1) | (win_y > y2) | (win_y + side <= y1)
+        score = np.where(valid, score, -np.inf)
 
         selected: list[PatchRegion] = []
-        selected.append(PatchRegion(x=0, y=0, w=w_img-1, h=h_img-1, patch_id=0))
+        area = side * side
+        while len(selected) < num_patches:
+            best = int(np.argmax(score))
+            if not np.isfinite(score[best]):
+                break
+            x, y = int(win_x[best]), int(win_y[best])
+            selected.append(PatchRegion(x=x, y=y, w=side, h=side, patch_id=len(selected)))
+
+            # all windows have the same size, so IoU only depends on the offsets
+            overlap = (np.maximum(0, side - np.abs(win_x - x)) * np.maximum(0, side - np.abs(win_y - y))).astype(np.float64)
+            score[overlap / (2 * area - overlap) > self.max_iou] = -np.inf
+
+        if not selected:
+            raise PipelineError(message='No patch with enough leaf coverage', step='Patch Selector')
 
         return selected
@@ -0,0 +1,230 @@
+from pathlib import Path
+from typing import Callable, Iterable
+import csv
+import re
+import shutil
+import numpy as np
+from domain.entities import PlotSummary, ShardSpec
+from domain.measurements import MeasurementBuffer
+from infrastructure.csv_writer import CsvPlotSummaryWriter
+
+# "[WARN] at <step> step for <path>: <message>." and "Unexpected error for <path>: <error>." in run logs
+_FAILURE_LINES = (re.compile(r"\[WARN\] at (?P<step>.+?) step for (?P<path>.+?): (?P<message>.*)\.$"),
+                  re.compile(r"Unexpected error for (?P<path>.+?): (?P<message>.*?)\.?$"))
+
+
+class ShardMerger:
+    """Combines the outputs of ``--shard-count n`` runs into the result of a single run, and lists the
+    images without rows in ``<stem>.coverage.csv``."""
+
+    def __init__(self, output: Path, root: Path, discovered: Iterable[Path], shard_by: str = "folder",
+                 shard_count: int | None = None):
+        self.output = Path(output)
+        self.root = Path(root)
+        self.discovered = list(discovered)
+        self.shard_by = shard_by
+        self._rank = {path.relative_to(self.root).parts: i for i, path in enumerate(self.discovered)}
+        self._folder_rank: dict[tuple[str, ...], int] = {}
+        for i, path in enumerate(self.discovered):
+            self._folder_rank.setdefault(path.parent.relative_to(self.root).parts, i)
+
+        self.shard_count, self.shards = self._find_shards(self.output, shard_count)
+
+    def merge_csv(self) -> dict:
+        header, rows = None, {}  # image_path -> its rows, in shard file order
+        duplicates = 0
+        for index, path in sorted(self.shards.items()):
+            with path.open(newline="", encoding="utf-8") as f:
+                reader = csv.reader(f)
+                shard_header = next(reader, None)
+                if shard_header is None:
+                    continue
+                if header is None:
+                    header = shard_header
+                elif shard_header != header:
+                    raise ValueError(f"{path} has columns {shard_header}, expected {header}")
+                column = header.index("image_path")
+
+                seen_here = set()
+                for row in reader:
+                    image = row[column]
+                    if image in rows and image not in seen_here:
+                        duplicates += 1  # also in an earlier shard; keep the first
+                        continue
+                    seen_here.add(image)
+                    rows.setdefault(image, []).append(row)
+
+        ranks = {image: self._rank_of(image) for image in rows}
+        ranked = sorted(rows, key=lambda image: (ranks[image] is None, ranks[image] or 0))  # unmatched last
+        with self.output.open("w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(header or [])
+            for image in ranked:
+                writer.writerows(rows[image])
+
+        return self._report(rows.keys(), duplicates)
+
+    def merge_parquet(self) -> dict:
+        """Copy every shard's parts into one dataset, renumbered; Parquet has no row order to restore."""
+        import pyarrow.parquet as pq
+
+        for part in self.output.glob("folder_name=*/part-*.parquet"):
+            part.unlink()
+        self.output.mkdir(parents=True, exist_ok=True)
+
+        images, duplicates, number = set(), 0, 0
+        for index, directory in sorted(self.shards.items()):
+            for part in sorted(directory.glob("folder_name=*/part-*.parquet")):
+                paths = pq.read_table(part, columns=["image_path"]).column("image_path")
+                part_images = set(paths.combine_chunks().dictionary_decode().to_pylist())
+                duplicates += len(part_images & images)
+                images |= part_images
+
+                target = self.output / part.parent.name / f"part-{number:05d}.parquet"
+                target.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(part, target)
+                number += 1
+
+        return self._report(images, duplicates)
+
+    def merge_plots(self, read_measurements: Callable[[Path], MeasurementBuffer]) -> Path | None:
+        """Combine the shards' plot summaries, with the greenness statistics computed again from the merged
+        output, which ``read_measurements`` reads back; None without plot summaries."""
+        pattern = re.compile(rf"{re.escape(self.output.stem)}\.shard-(\d+)-of-{self.shard_count}\.plots\.csv")
+        plots = sorted((int(m[1]), p) for p in self.output.parent.iterdir() if (m := pattern.fullmatch(p.name)))
+        if not plots:
+            return None
+
+        folders: dict[tuple[str, ...], list] = {}  # folder -> name, path, frames, failed, redetected, lat/long sums
+        for _, path in plots:
+            with path.open(newline="", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    frames = int(row["frames"])
+                    entry = folders.setdefault(self._folder_of(row["folder_path"]),
+                                               [row["folder_name"], row["folder_path"], 0, 0, 0, 0.0, 0.0])
+                    entry[2] += frames
+                    entry[3] += int(row["failed"])
+                    entry[4] += int(row["redetected"])
+                    entry[5] += float(row["lat"]) * frames
+                    entry[6] += float(row["long"]) * frames
+
+        images: dict[tuple[str, ...], list[MeasurementBuffer]] = {}
+        for image, rows in read_measurements(self.output).by_image():
+            images.setdefault(self._folder_of(str(Path(image).parent)), []).append(rows)
+
+        summaries = []
+        for folder in sorted(folders, key=lambda k: (self._folder_rank.get(k) is None, self._folder_rank.get(k, 0))):
+            name, folder_path, frames, failed, redetected, lat, long = folders[folder]
+            stats = MeasurementBuffer.concat(images.get(folder, [])).folder_summaries()
+            value = {k: float(stats[k][0]) if len(stats[k]) else np.nan
+                     for k in ("greenness_mean", "greenness_median", "greenness_q1", "greenness_q3")}
+            summaries.append(PlotSummary(folder_name=name, folder_path=Path(folder_path), frames=frames,
+                                         failed=failed, redetected=redetected, lat=lat / frames if frames else np.nan,
+                                         long=long / frames if frames else np.nan,
+                                         greenness_mean=value["greenness_mean"],
+                                         greenness_median=value["greenness_median"],
+                                         greenness_iqr=value["greenness_q3"] - value["greenness_q1"]))
+
+        writer = CsvPlotSummaryWriter(self.output.with_name(f"{self.output.stem}.plots.csv"))
+        writer.open()
+        writer.write(summaries)
+        writer.close()
+        return writer.output_path
+
+    def merge_logs(self) -> Path:
+        """Concatenate the shard logs, each under a header line, into ``run.log``."""
+        merged = self.output.parent / "run.log"
+        with merged.open("w", encoding="utf-8") as out:
+            for index in range(self.shard_count):
+                tag = ShardSpec(index, self.shard_count).tag
+                log = self.output.parent / f"run.{tag}.log"
+                out.write(f"==== {tag} ({log.name}) ====\n")
+                if log.exists():
+                    out.write(log.read_text(encoding="utf-8", errors="replace"))
+                else:
+                    out.write("(log not found)\n")
+        return merged
+
+    def _report(self, measured: Iterable[str], duplicates: int) -> dict:
+        covered, unmatched = set(), 0
+        for image in measured:
+            rank = self._rank_of(image)
+            if rank is None:
+                unmatched += 1
+            else:
+                covered.add(rank)
+
+        failures = self._failures()
+        spec = ShardSpec(0, self.shard_count, self.shard_by)
+        report_path = self.output.with_name(f"{self.output.stem}.coverage.csv")
+        failed = missing = 0
+        with report_path.open("w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["image_path", "shard", "status", "message"])
+            for rank, path in enumerate(self.discovered):
+                if rank in covered:
+                    continue
+                message = failures.get(rank)
+                failed += message is not None
+                missing += message is None
+                writer.writerow([str(path), spec.shard_of(path, self.root),
+                                 "failed" if message is not None else "missing", message or ""])
+
+        return {"shards": self.shard_count, "shards_found": sorted(self.shards),
+                "shards_missing": sorted(set(range(self.shard_count)) - set(self.shards)),
+                "images": len(self.discovered), "measured": len(covered), "failed": failed, "missing": missing,
+                "unmatched": unmatched, "duplicates": duplicates, "report": report_path}
+
+    def _failures(self) -> dict[int, str]:
+        """Discovery rank -> the last error a shard logged for that image."""
+        failures = {}
+        for log in self.output.parent.glob(f"run.shard-*-of-{self.shard_count}.log"):
+            with log.open(encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    for pattern in _FAILURE_LINES:
+                        match = pattern.search(line.rstrip("\n"))
+                        if match:
+                            rank = self._rank_of(match["path"])
+                            if rank is not None:
+                                step = match.groupdict().get("step")
+                                failures[rank] = f"{step}: {match['message']}" if step else match["message"]
+                            break
+        return failures
+
+    def _folder_of(self, folder: str) -> tuple[str, ...]:
+        """A folder path written by a shard as its path under ``root``, matched like ``_rank_of``;
+        unmatched folders keep all their parts."""
+        parts = Path(folder).parts
+        for start in range(len(parts)):
+            if parts[start:] in self._folder_rank:
+                return parts[start:]
+        return parts
+
+    def _rank_of(self, image: str) -> int | None:
+        """Discovery position of an image path written by a shard, matched on its longest suffix
+        that is a path under ``root``."""
+        parts = Path(image).parts
+        for start in range(len(parts)):
+            rank = self._rank.get(parts[start:])
+            if rank is not None:
+                return rank
+        return None
+
+    @staticmethod
+    def _find_shards(output: Path, shard_count: int | None) -> tuple[int, dict[int, Path]]:
+        pattern = re.compile(rf"{re.escape(output.stem)}\.shard-(\d+)-of-(\d+){re.escape(output.suffix)}")
+        found: dict[int, dict[int, Path]] = {}
+        for path in output.parent.iterdir():
+            match = pattern.fullmatch(path.name)
+            if match:
+                found.setdefault(int(match[2]), {})[int(match[1])] = path
+
+        if shard_count is None:
+            if len(found) > 1:
+                raise ValueError(f"Shard outputs of {output} from runs with different shard counts "
+                                 f"{sorted(found)}; pass --shard-count")
+            if not found:
+                raise ValueError(f"No shard outputs of {output} found in {output.parent}")
+            shard_count = next(iter(found))
+
+        return shard_count, found.get(shard_count, {})
@@ -1,52 +1,200 @@
+import time
+_STARTED = time.perf_counter()
+
 import logging
-from presentation.cli import parse_args, visualizer
-from config.settings import ProjectConfig, setup_logging, SamLeafSegConfig
-from infrastructure.image_io import OpenCVImageLoader
-from infrastructure.file_discovery import FolderDatasetDiscovery
-from infrastructure.color_checker_detector_deep import DeepColorCheckerDetector
-from infrastructure.leaf_segmentation import LeafSegmentor
-from infrastructure.color_calibration import SimpleColorCalibrator
-from infrastructure.patch_selection import CorrelationBasedPatchSelector
-from infrastructure.greenness_index import ExcessGreenIndexCalculator
-from infrastructure.csv_writer import CsvResultWriter
+from functools import partial
+from datetime import datetime
+from pathlib import Path
+import sys
+from presentation.cli import parse_args, parse_cache_args, parse_merge_args
+from config.settings import ProjectConfig, setup_logging, value_columns
 from application.services import ImageProcessingPipeline, DatasetProcessingService
+from application.profiling import StageProfiler
+from domain.entities import ShardSpec
+
+logger = logging.getLogger(__name__)
+
+
+def build_pipeline(config: ProjectConfig) -> ImageProcessingPipeline:
+    """Build one ImageProcessingPipeline, importing only the adapters the configuration uses."""
+    from presentation.figures import BackgroundFigureRenderer
+    from infrastructure.image_io import OpenCVImageLoader, PrefetchingImageLoader
+    from infrastructure.leaf_segmentation import LeafSegmentor
+    from infrastructure.color_calibration import SimpleColorCalibrator
+    from infrastructure.patch_selection import CorrelationBasedPatchSelector
+    from infrastructure.greenness_index import ExcessGreenIndexCalculator
+
+    # Infrastructure instances
+    if config.prefetch:
+        loader = PrefetchingImageLoader(depth=config.prefetch, max_bytes=config.prefetch_mb * 2**20)
+    else:
+        loader = OpenCVImageLoader()
+    if config.checker_tracking:
+        from infrastructure.color_checker_tracking import TrackingColorCheckerDetector
+        checker_detector = TrackingColorCheckerDetector(proxy_width=config.checker_proxy_width)
+    else:
+        from infrastructure.color_checker_detector_deep import DeepColorCheckerDetector
+        checker_detector = DeepColorCheckerDetector()
+    segmentor = LeafSegmentor(method=config.segment_method,
+                              sam_config=config.sam_config
+                              if config.segment_method == 'sam' else None)
+    calibrator = SimpleColorCalibrator(swatch_tolerance=config.ccm_tolerance)
+    patch_selector = CorrelationBasedPatchSelector(stride_fraction=0.5, patch_fraction=config.patch_fraction)
+    greenness_calc = ExcessGreenIndexCalculator(method=config.green_indx, indices=config.green_indices,
+                                                stats=config.green_stats)
+    cache = None
+    if config.cache_dir is not None:
+        from infrastructure.artifact_cache import ArtifactCache
+        cache = ArtifactCache(config.cache_dir, max_bytes=int(config.cache_max_gb * 2**30), key_mode=config.cache_key)
+
+    return ImageProcessingPipeline(
+        loader=loader,
+        checker_detector=checker_detector,
+        leaf_segmentor=segmentor,
+        calibrator=calibrator,
+        patch_selector=patch_selector,
+        greenness_calc=greenness_calc,
+        config=config,
+        show_func=BackgroundFigureRenderer(),
+        cache=cache,
+        profiler=StageProfiler(enabled=config.profile, top_n_cprofile=config.profile_top_n)
+    )
+
+
+def cache_main(argv: list[str]) -> None:
+    from infrastructure.artifact_cache import ArtifactCache
+
+    args = parse_cache_args(argv)
+    cache = ArtifactCache(Path(args.cache_dir))
+    try:
+        if args.command == "prune":
+            max_bytes = 0 if args.all else (int(args.max_gb * 2**30) if args.max_gb is not None else None)
+            older_than = args.older_than_days * 86400 if args.older_than_days is not None else None
+            removed, freed = cache.prune(max_bytes=max_bytes, older_than=older_than)
+            print(f"Removed {removed} entries ({freed / 2**20:.1f} MB).")
+
+        info = cache.inspect()
+        print(f"{info['directory']}: {info['entries']} entries for {info['images']} images, "
+              f"{info['bytes'] / 2**20:.1f} MB")
+        for kind, stats in info["kinds"].items():
+            print(f"  {kind:<8} {stats['entries']:>8} entries {stats['bytes'] / 2**20:>10.1f} MB")
+        if info["entries"]:
+            print(f"  last used between {datetime.fromtimestamp(info['oldest_access']):%Y-%m-%d %H:%M} and "
+                  f"{datetime.fromtimestamp(info['newest_access']):%Y-%m-%d %H:%M}")
+    finally:
+        cache.close()
+
+
+def merge_main(argv: list[str]) -> None:
+    from infrastructure.file_discovery import FolderDatasetDiscovery
+    from infrastructure.shard_merge import ShardMerger
+
+    args = parse_merge_args(argv)
+    root, output = Path(args.input_root), Path(args.output_csv)
+    if args.output_format == "parquet":
+        output = output.with_suffix(".parquet")
+
+    try:
+        merger = ShardMerger(output, root, FolderDatasetDiscovery().iter_paths(root), shard_by=args.shard_by,
+                             shard_count=args.shard_count)
+        if args.output_format == "parquet":
+            from infrastructure.parquet_writer import read_measurements
+            report = merger.merge_parquet()
+        else:
+            from infrastructure.csv_writer import read_measurements
+            report = merger.merge_csv()
+    except ValueError as e:
+        sys.exit(f"merge: {e}")
+    plots = merger.merge_plots(read_measurements)
+    log = merger.merge_logs()
+
+    print(f"Merged {len(report['shards_found'])} of {report['shards']} shards into {output}; logs in {log}.")
+    if report["shards_missing"]:
+        print(f"  shards without output: {', '.join(map(str, report['shards_missing']))}")
+    print(f"  {report['measured']} of {report['images']} images measured, {report['failed']} failed, "
+          f"{report['missing']} missing (listed in {report['report']})")
+    if plots is not None:
+        print(f"  plot summaries in {plots}")
+    if report["unmatched"] or report["duplicates"]:
+        print(f"  {report['unmatched']} measured images are not under {root}; "
+              f"{report['duplicates']} images appeared in more than one shard (first kept)")
+
+
+def watch(config: ProjectConfig, discovery, writer) -> None:
+    from application.watching import WatchService
+    from infrastructure.folder_watcher import create_watcher
+
+    service = WatchService(
+        watcher=create_watcher(config.input_root, settle=config.watch_settle, interval=config.watch_interval,
+                               polling=config.watch_polling),
+        discovery=discovery,
+        pipeline=build_pipeline(config),
+        writer=writer,
+        status_path=config.watch_status or config.output_csv.parent / "status.json",
+        queue_size=config.watch_queue,
+        poll_interval=config.watch_interval,
+        gps_wait=config.watch_gps_wait,
+        idle_exit=config.watch_idle_exit,
+    )
+    service.run()
 
 
 def main():
+    if sys.argv[1:2] == ["cache"]:
+        cache_main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["merge"]:
+        merge_main(sys.argv[2:])
+        return
+
     try:
         config: ProjectConfig = parse_args()
-        setup_logging(config.output_csv)
+        shard = ShardSpec(config.shard_index, config.shard_count, config.shard_by)
+        if shard.count > 1:  # every shard writes its own output, log and profile
+            config.output_csv = shard.output_path(config.output_csv)
+        setup_logging(config.output_csv, name=f"run.{shard.tag}.log" if shard.count > 1 else "run.log")
+        imported = time.perf_counter()
 
-        # Infrastructure instances
-        loader = OpenCVImageLoader()
-        discovery = FolderDatasetDiscovery()
-        checker_detector = DeepColorCheckerDetector()
-        segmentor = LeafSegmentor(method=config.segment_method,
-                                  sam_config=config.sam_config
-                                  if config.segment_method == 'sam' else None)
-        calibrator = SimpleColorCalibrator()
-        patch_selector = CorrelationBasedPatchSelector(stride_fraction=0.5)
-        greenness_calc = ExcessGreenIndexCalculator(method=config.green_indx)
-        writer = CsvResultWriter(output_path=config.output_csv)
-
-        # Pipeline & service
-        pipeline = ImageProcessingPipeline(
-            loader=loader,
-            checker_detector=checker_detector,
-            leaf_segmentor=segmentor,
-            calibrator=calibrator,
-            patch_selector=patch_selector,
-            greenness_calc=greenness_calc,
-            config=config,
-            show_func=visualizer
-        )
+        from infrastructure.file_discovery import FolderDatasetDiscovery
 
+        discovery = FolderDatasetDiscovery(interpolate_gps=config.gps_interpolate, reload_gps=config.watch)
+        columns = value_columns((config.green_indx, *config.green_indices), config.green_stats)
+        if config.output_format == "parquet":
+            from infrastructure.parquet_writer import ParquetResultWriter
+            writer = ParquetResultWriter(output_dir=config.output_csv.with_suffix(".parquet"), value_columns=columns)
+        else:
+            from infrastructure.csv_writer import CsvResultWriter
+            writer = CsvResultWriter(output_path=config.output_csv, value_columns=columns)
+        plot_writer = None
+        if config.folder_batch:
+            from infrastructure.csv_writer import CsvPlotSummaryWriter
+            plot_writer = CsvPlotSummaryWriter(config.output_csv.with_name(f"{config.output_csv.stem}.plots.csv"))
+
+        if config.watch:
+            watch(config, discovery, writer)
+            return
+
+        # Pipeline & service; with several workers every process builds its own pipeline
+        pipeline_factory = partial(build_pipeline, config)
         service = DatasetProcessingService(
             discovery=discovery,
-            pipeline=pipeline,
+            pipeline=pipeline_factory() if config.num_workers == 1 else None,
             writer=writer,
+            workers=config.num_workers,
+            pipeline_factory=pipeline_factory,
+            max_samples=config.max_samples,
+            resume=config.resume,
+            profiler=StageProfiler(enabled=config.profile, top_n_cprofile=config.profile_top_n),
+            profile_dir=(config.output_csv.parent / (f"profile.{shard.tag}" if shard.count > 1 else "")
+                         if config.profile else None),
+            shard=shard,
+            folder_batch=config.folder_batch > 0,
+            plot_writer=plot_writer,
         )
 
+        logger.info(f"Startup took {time.perf_counter() - _STARTED:.2f} s "
+                    f"({imported - _STARTED:.2f} s to parse arguments, the rest for adapters and models).")
+
         service.run(config.input_root)
 
     finally:
@@ -1,7 +1,6 @@
 import argparse
 from pathlib import Path
-from config.settings import ProjectConfig
-import matplotlib.pyplot as plt
+from config.settings import INDICES, STATS, ProjectConfig, valid_stat
 import os
 
 
@@ -11,21 +10,162 @@ def parse_args() -> ProjectConfig:
     parser.add_argument("--output-csv", type=str, required=True)
     parser.add_argument("--output-fig", type=str, default=None)
     parser.add_argument("--num-patches", type=int, default=1)
+    parser.add_argument("--patch-fraction", type=float, default=0.25,
+                        help="Side of each patch as a fraction of the shorter image side (with --num-patches > 1)")
     parser.add_argument("--segment-method", type=str, default="nexg")
-    parser.add_argument("--green-indx", type=str, default="ngrdi")
+    parser.add_argument("--green-indx", type=str, default="ngrdi",
+                        help="Comma-separated indices (bgr/exg, ngrdi, vari, gli); the first is greenness_value")
+    parser.add_argument("--green-stats", type=str, default="median",
+                        help="Comma-separated statistics per index: median, mean, std, min, max, pNN (e.g. p90)")
+    parser.add_argument("--output-format", choices=("csv", "parquet"), default="csv",
+                        help="parquet writes a folder-partitioned dataset next to --output-csv (needs pyarrow)")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--prefetch", type=int, default=0,
+                        help="Read and decode this many upcoming images on background threads (0 = off)")
+    parser.add_argument("--prefetch-mb", type=int, default=512,
+                        help="Memory cap of the decoded images waiting in the read-ahead queue")
+    parser.add_argument("--tile-memory-mb", type=int, default=0,
+                        help="Segment, calibrate and measure in row tiles using about this much working memory "
+                             "per worker (0 = whole frame)")
+    parser.add_argument("--max-samples", type=int, default=None)
+    parser.add_argument("--shard-index", type=int, default=0,
+                        help="Process only this shard (0-based) of --shard-count; outputs get a .shard-<i>-of-<n> suffix")
+    parser.add_argument("--shard-count", type=int, default=1,
+                        help="Split the dataset into this many deterministic shards, e.g. one per machine")
+    parser.add_argument("--shard-by", choices=("folder", "path"), default="folder",
+                        help="Assign whole folders (keeps GPS and checker tracking together) or single images to shards")
+    parser.add_argument("--folder-batch", type=int, default=0, metavar="PROBES",
+                        help="Process each folder as a unit: search for the checker in this many evenly spaced "
+                             "frames and, when they agree, calibrate all frames with one matrix; also writes "
+                             "per-plot rows to <output>.plots.csv (0 = off)")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep running and process new frames under --input-root as they are written")
+    parser.add_argument("--watch-polling", action="store_true",
+                        help="List the tree every --watch-interval instead of using inotify (e.g. network shares)")
+    parser.add_argument("--watch-interval", type=float, default=1.0, help="Seconds between listings when polling")
+    parser.add_argument("--watch-settle", type=float, default=2.0,
+                        help="Seconds a new file's size must stay unchanged before it is read")
+    parser.add_argument("--watch-queue", type=int, default=64,
+                        help="Frames queued for processing; further frames wait on disk while it is full")
+    parser.add_argument("--watch-gps-wait", type=float, default=30.0,
+                        help="Seconds a frame captured after the last GPS fix waits for the log to grow")
+    parser.add_argument("--watch-idle-exit", type=float, default=0.0,
+                        help="Stop after this many seconds without new frames (0 = run until stopped)")
+    parser.add_argument("--watch-status", type=str, default=None,
+                        help="Status file rewritten while watching (default: status.json next to the output)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Append to an existing output CSV, skipping images already in it")
+    parser.add_argument("--gps-interpolate", action="store_true",
+                        help="Interpolate lat/long between GPS fixes instead of using the closest fix")
+    parser.add_argument("--checker-tracking", action="store_true",
+                        help="Search for the colour checker around its position in the previous frame first")
+    parser.add_argument("--checker-proxy-width", type=int, default=0,
+                        help="Run full checker searches on a proxy downscaled to this width (0 = off)")
+    parser.add_argument("--ccm-tolerance", type=float, default=0.0,
+                        help="Reuse a folder's colour-correction matrix while swatches differ by at most this much")
+    parser.add_argument("--profile", action="store_true",
+                        help="Record per-stage timing and memory; written as profile.json/csv next to run.log")
+    parser.add_argument("--profile-top", type=int, default=0,
+                        help="Also keep cProfile dumps of the N slowest images (implies --profile)")
+    parser.add_argument("--cache-dir", type=str, default=None,
+                        help="Cache checker detections, leaf masks and colour matrices here and reuse them on reruns")
+    parser.add_argument("--cache-max-gb", type=float, default=10.0,
+                        help="Size limit of the cache; least recently used entries are evicted beyond it")
+    parser.add_argument("--cache-key", choices=("stat", "content"), default="stat",
+                        help="Identify images by path, size and mtime (stat) or by a hash of their bytes (content)")
     args = parser.parse_args()
 
+    indices = [i.strip() for i in args.green_indx.split(",") if i.strip()]
+    stats = [s.strip() for s in args.green_stats.split(",") if s.strip()]
+    unknown = [i for i in indices if i not in INDICES]
+    if not indices or unknown:
+        parser.error(f"--green-indx: unknown indices {unknown}; expected a list of {', '.join(INDICES)}")
+    invalid = [s for s in stats if not valid_stat(s)]
+    if not stats or invalid:
+        parser.error(f"--green-stats: unknown statistics {invalid}; expected a list of {', '.join(STATS)}")
+    if args.shard_count < 1 or not 0 <= args.shard_index < args.shard_count:
+        parser.error(f"--shard-index must be in 0..{args.shard_count - 1} and --shard-count at least 1")
+    if args.watch and (args.workers > 1 or args.prefetch or args.folder_batch or args.shard_count > 1):
+        parser.error("--watch processes frames one by one as they arrive; it cannot be combined with "
+                     "--workers, --prefetch, --folder-batch or --shard-count")
+
     return ProjectConfig(
         input_root=Path(args.input_root),
         output_csv=Path(args.output_csv),
         output_figure=Path(args.output_fig) if args.output_fig else Path(args.output_csv).parent,
         num_patches_per_image=args.num_patches,
+        patch_fraction=args.patch_fraction,
         segment_method=args.segment_method,
-        green_indx=args.green_indx,
+        green_indx=indices[0],
+        green_indices=tuple(indices),
+        green_stats=tuple(stats),
+        num_workers=max(1, args.workers),
+        tile_memory_mb=max(0, args.tile_memory_mb),
+        prefetch=max(0, args.prefetch),
+        prefetch_mb=args.prefetch_mb,
+        shard_index=args.shard_index,
+        shard_count=args.shard_count,
+        shard_by=args.shard_by,
+        folder_batch=max(0, args.folder_batch),
+        watch=args.watch,
+        watch_polling=args.watch_polling,
+        watch_interval=args.watch_interval,
+        watch_settle=args.watch_settle,
+        watch_queue=max(1, args.watch_queue),
+        watch_gps_wait=args.watch_gps_wait,
+        watch_idle_exit=args.watch_idle_exit,
+        watch_status=Path(args.watch_status) if args.watch_status else None,
+        output_format=args.output_format,
+        max_samples=args.max_samples,
+        resume=args.resume,
+        gps_interpolate=args.gps_interpolate,
+        checker_tracking=args.checker_tracking or args.checker_proxy_width > 0,
+        checker_proxy_width=args.checker_proxy_width,
+        ccm_tolerance=args.ccm_tolerance,
+        profile=args.profile or args.profile_top > 0,
+        profile_top_n=max(0, args.profile_top),
+        cache_dir=Path(args.cache_dir) if args.cache_dir else None,
+        cache_max_gb=args.cache_max_gb,
+        cache_key=args.cache_key,
     )
 
+
+def parse_cache_args(argv: list[str]) -> argparse.Namespace:
+    """``main.py cache inspect|prune`` maintenance commands for --cache-dir."""
+    parser = argparse.ArgumentParser(prog="main.py cache", description="Inspect or prune the artifact cache")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    inspect = commands.add_parser("inspect", help="Show entry counts and sizes per artefact kind")
+    inspect.add_argument("--cache-dir", type=str, required=True)
+
+    prune = commands.add_parser("prune", help="Evict entries by age and/or down to a size")
+    prune.add_argument("--cache-dir", type=str, required=True)
+    prune.add_argument("--max-gb", type=float, default=None, help="Evict least recently used entries beyond this size")
+    prune.add_argument("--older-than-days", type=float, default=None, help="Evict entries unused for this long")
+    prune.add_argument("--all", action="store_true", help="Empty the cache")
+
+    return parser.parse_args(argv)
+
+
+def parse_merge_args(argv: list[str]) -> argparse.Namespace:
+    """``main.py merge``: combine the outputs of a --shard-count run."""
+    parser = argparse.ArgumentParser(prog="main.py merge",
+                                     description="Merge shard outputs into one result in discovery order, "
+                                                 "with a coverage report of images missing from every shard")
+    parser.add_argument("--input-root", type=str, required=True, help="The dataset root the shards processed")
+    parser.add_argument("--output-csv", type=str, required=True,
+                        help="The --output-csv given to the shards; the merged result is written here")
+    parser.add_argument("--output-format", choices=("csv", "parquet"), default="csv")
+    parser.add_argument("--shard-count", type=int, default=None,
+                        help="Expected number of shards (default: taken from the shard file names)")
+    parser.add_argument("--shard-by", choices=("folder", "path"), default="folder",
+                        help="The --shard-by of the shard runs; used to name each missing image's shard")
+    return parser.parse_args(argv)
+
 def visualizer(path: Path, show: bool ,**images) -> None:
     """PLot images in one row."""
+    import matplotlib.pyplot as plt
+
     n = len(images)
     plt.figure(num='Results', figsize=(16, 5))
     for i, (name, image) in enumerate(images.items()):
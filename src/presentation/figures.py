@@ -0,0 +1,98 @@
+from pathlib import Path
+import logging
+import queue
+import threading
+import numpy as np
+import cv2
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundFigureRenderer:
+    """Draws downscaled result figures on a background thread. A figure is dropped only after
+    waiting ``put_timeout`` seconds for a free slot; drops are reported on close."""
+
+    def __init__(self, max_side: int = 1024, dpi: int = 150, queue_size: int = 8, put_timeout: float = 5.0):
+        self.max_side = max_side
+        self.dpi = dpi
+        self.put_timeout = put_timeout
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._thread: threading.Thread | None = None
+        self.dropped = 0
+
+    def __call__(self, path: Path, show: bool, **images) -> None:
+        if show:
+            from presentation.cli import visualizer  # interactive windows must stay on the main thread
+            visualizer(path, show, **images)
+            return
+
+        if path is None:
+            return
+
+        previews = {name: self._downscale(image) for name, image in images.items()}
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="figure-renderer", daemon=True)
+            self._thread.start()
+
+        try:
+            self._queue.put((path, previews), timeout=self.put_timeout)
+        except queue.Full:
+            self.dropped += 1
+            logger.warning(f"[WARN] figure renderer is {self._queue.maxsize} figures behind for more than "
+                           f"{self.put_timeout:g} s; figure {path.name} dropped.")
+
+    def close(self) -> None:
+        """Wait until every queued figure is written."""
+        if self._thread is None:
+            return
+        self._queue.put((None, None))
+        self._thread.join()
+        self._thread = None
+        if self.dropped:
+            logger.warning(f"[WARN] {self.dropped} requested figures were not saved because rendering fell behind.")
+
+    def _downscale(self, image: np.ndarray) -> np.ndarray:
+        h, w = image.shape[:2]
+        scale = self.max_side / max(h, w)
+        if scale >= 1:
+            return image.copy()
+        return cv2.resize(image, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+
+    def _run(self) -> None:
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        figure = Figure(figsize=(16, 5))
+        FigureCanvasAgg(figure)
+        names: tuple[str, ...] = ()
+
+        while True:
+            path, previews = self._queue.get()
+            if path is None:
+                break
+
+            try:
+                if tuple(previews) != names:
+                    names = tuple(previews)
+                    figure.clear()
+                    for i, (name, image) in enumerate(previews.items()):
+                        ax = figure.add_subplot(1, len(previews), i + 1)
+                        ax.set_xticks([])
+                        ax.set_yticks([])
+                        ax.set_title(' '.join(name.split('_')).title())
+                        ax.imshow(image, cmap='viridis')
+                    figure.tight_layout()
+                else:
+                    for ax, image in zip(figure.axes, previews.values()):
+                        h, w = image.shape[:2]
+                        ax.images[0].set_data(image)
+                        ax.images[0].set_extent((-0.5, w - 0.5, h - 0.5, -0.5))
+                        ax.set_xlim(-0.5, w - 0.5)
+                        ax.set_ylim(h - 0.5, -0.5)
+
+                path.parent.mkdir(parents=True, exist_ok=True)
+                figure.savefig(path, bbox_inches="tight", dpi=self.dpi)
+
+            except Exception as e:
+                logger.exception(f"Unexpected error while saving figure {path}: {e}.")
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the pipeline runs from src/ (python main.py), so its packages are imported from there
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
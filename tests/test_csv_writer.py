@@ -0,0 +1,87 @@
+from pathlib import Path
+import pytest
+from domain.entities import ImageSample, PatchRegion
+from domain.measurements import MeasurementBuffer
+from infrastructure.csv_writer import CsvResultWriter
+
+COLUMNS = ["exg_median"]
+
+
+def image(i: int) -> MeasurementBuffer:
+    path = Path(f"/data/ImageData/a/{i:03d}.png")
+    sample = ImageSample(path=path, root_path=path.parent, folder_name="a", lat=35.0 + i, long=-88.0)
+    patches = [PatchRegion(x=10 * p, y=0, w=10, h=10, patch_id=p) for p in range(3)]
+    return MeasurementBuffer.for_image(sample, patches, [(0.1 * i + 0.01 * p, {"exg_median": 20.0 + p})
+                                                         for p in range(3)])
+
+
+@pytest.fixture
+def output(tmp_path) -> tuple[Path, bytes, list[bytes]]:
+    """A finished output of four images with three patches each, its bytes and its lines."""
+    path = tmp_path / "out.csv"
+    CsvResultWriter(path, batch_size=1, value_columns=COLUMNS).write_all(
+        MeasurementBuffer.concat([image(i) for i in range(4)]))
+    data = path.read_bytes()
+    return path, data, data.splitlines(keepends=True)
+
+
+def resume(path: Path) -> tuple[CsvResultWriter, set[str]]:
+    writer = CsvResultWriter(path, batch_size=1, value_columns=COLUMNS)
+    return writer, writer.open(resume=True)
+
+
+def done_paths(n: int) -> set[str]:
+    return {str(Path(f"/data/ImageData/a/{i:03d}.png")) for i in range(n)}
+
+
+def test_resume_cuts_a_torn_row_and_its_image(output):
+    path, data, lines = output
+    path.write_bytes(b"".join(lines[:1 + 3 * 3 + 1]) + lines[11][:15])  # image 3: one row and a half
+
+    writer, done = resume(path)
+    writer.close()
+
+    assert done == done_paths(3)
+    assert path.read_bytes() == b"".join(lines[:1 + 3 * 3])
+
+
+def test_resume_cuts_an_image_cut_between_rows(output):
+    path, data, lines = output
+    path.write_bytes(b"".join(lines[:1 + 3 * 2 + 2]))  # image 2: two of its three rows
+
+    writer, done = resume(path)
+    writer.close()
+
+    assert done == done_paths(2)
+    assert path.read_bytes() == b"".join(lines[:1 + 3 * 2])
+
+
+def test_resume_measures_the_last_image_again(output):
+    # a complete file looks the same as one cut after the last row of an image
+    path, data, lines = output
+
+    writer, done = resume(path)
+    writer.write(image(3))
+    writer.close()
+
+    assert done == done_paths(3)
+    assert path.read_bytes() == data
+
+
+def test_resume_of_a_torn_header_starts_over(output):
+    path, data, lines = output
+    path.write_bytes(lines[0][:20])
+
+    writer, done = resume(path)
+    for i in range(4):
+        writer.write(image(i))
+    writer.close()
+
+    assert done == set()
+    assert path.read_bytes() == data
+
+
+def test_resume_rejects_other_columns(output):
+    path, data, lines = output
+    with pytest.raises(ValueError, match="Cannot resume"):
+        CsvResultWriter(path, value_columns=["exg_mean"]).open(resume=True)
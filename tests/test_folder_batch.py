@@ -0,0 +1,219 @@
+from pathlib import Path
+import csv
+import numpy as np
+import pytest
+from application.services import DatasetProcessingService, ImageProcessingPipeline, _folder_chunks, _plot_summary
+from config.settings import ProjectConfig
+from domain.entities import DecodedImage, ImageSample, PatchRegion
+from domain.exceptions import PipelineError
+from domain.measurements import MeasurementBuffer
+from infrastructure.csv_writer import CsvResultWriter, read_measurements
+from infrastructure.shard_merge import ShardMerger
+
+QUAD = np.array([[100, 100], [300, 100], [300, 200], [100, 200]], dtype=np.float64)
+CHART = np.linspace(0.05, 0.9, 72).reshape(24, 3)
+
+
+def sample(folder: str, i: int, lat: float = 35.0, long: float = -88.0) -> ImageSample:
+    path = Path(f"/data/ImageData/{folder}/{i:03d}.png")
+    return ImageSample(path=path, root_path=path.parent, folder_name=folder, lat=lat, long=long)
+
+
+def frame(s: ImageSample, values: list[float]) -> tuple[ImageSample, MeasurementBuffer]:
+    patches = [PatchRegion(x=0, y=0, w=1, h=1, patch_id=i) for i in range(len(values))]
+    return s, MeasurementBuffer.for_image(s, patches, [(v, {}) for v in values])
+
+
+class FakeLoader:
+    def load(self, path: Path) -> DecodedImage:
+        return DecodedImage(path=path, bgr=np.zeros((4, 4, 3), dtype=np.uint8))
+
+
+class FakeDetector:
+    """Finds the checker at QUAD, shifted by ``offsets[frame number]``, or not at all (None)."""
+
+    def __init__(self, offsets: dict[int, float | None]):
+        self.offsets = offsets
+        self.searched: list[int] = []
+        self.sampled: list[int] = []
+
+    @staticmethod
+    def swatches(i: int) -> np.ndarray:
+        return CHART * (1 + 0.1 * i)  # the light changes from frame to frame
+
+    def detect(self, frame: DecodedImage) -> tuple[np.ndarray, np.ndarray]:
+        i = int(frame.path.stem)
+        self.searched.append(i)
+        offset = self.offsets.get(i, 0.0)
+        if offset is None:
+            raise PipelineError(message="No ColorChecker detected", step="Checker Detector")
+        return self.swatches(i), QUAD + offset
+
+    def swatches_at(self, frame: DecodedImage, quad: np.ndarray) -> np.ndarray:
+        """The frame's swatches where its checker is; anywhere else they come out reversed."""
+        i = int(frame.path.stem)
+        self.sampled.append(i)
+        offset = self.offsets.get(i, 0.0)
+        in_place = offset is not None and np.abs(QUAD + offset - quad).max() <= 1
+        return self.swatches(i) if in_place else self.swatches(i)[::-1]
+
+
+class FakeSegmentor:
+    def __init__(self):
+        self.quads: list[np.ndarray] = []  # the checker each frame was masked with
+
+    def mask(self, bgr: np.ndarray, checker_bbox: np.ndarray, tile_rows: int | None = None) -> np.ndarray:
+        self.quads.append(checker_bbox)
+        return np.full(bgr.shape[:2], 255, dtype=np.uint8)
+
+
+class FakeCalibrator:
+    matrix = None
+
+    def fit_matrix(self, swatches: np.ndarray) -> np.ndarray:
+        return np.eye(3) * swatches.mean()
+
+    def calibrate(self, image: DecodedImage, swatches: np.ndarray, session=None) -> np.ndarray:
+        self.matrix = self.fit_matrix(swatches)
+        return image.bgr
+
+    def apply(self, bgr: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+        return bgr
+
+
+class FakePatchSelector:
+    def select_patches(self, image, checker_bbox, num_patches, mask=None, transform=None) -> list[PatchRegion]:
+        return [PatchRegion(x=0, y=0, w=4, h=4, patch_id=0)]
+
+
+class FakeGreenness:
+    def compute_all(self, patch: np.ndarray, mask: np.ndarray) -> tuple[float, dict[str, float]]:
+        return 0.5, {}
+
+
+def pipeline(detector: FakeDetector, probes: int) -> ImageProcessingPipeline:
+    config = ProjectConfig(input_root=Path("/data"), output_csv=Path("out.csv"), output_figure=Path("fig"),
+                           segment_method="hsv", green_indx="ngrdi", folder_batch=probes)
+    return ImageProcessingPipeline(loader=FakeLoader(), checker_detector=detector, leaf_segmentor=FakeSegmentor(),
+                                   calibrator=FakeCalibrator(), patch_selector=FakePatchSelector(),
+                                   greenness_calc=FakeGreenness(), config=config, show_func=None)
+
+
+def outcomes(detector: FakeDetector, probes: int, frames: int) -> tuple[ImageProcessingPipeline, list]:
+    p = pipeline(detector, probes)
+    service = DatasetProcessingService(discovery=None, pipeline=p, writer=None, folder_batch=probes)
+    return p, list(service._iter_serial([sample("a", i) for i in range(frames)]))
+
+
+def test_plot_summary_statistics_and_failed_frames():
+    frames = [frame(sample("a", 0, lat=1.0), [0.1, 0.3, 0.2]),   # frame value 0.2
+              frame(sample("a", 1, lat=2.0), [0.4]),
+              (sample("a", 2, lat=3.0), None),                  # failed
+              frame(sample("a", 3, lat=4.0), [0.6, 0.8]),       # 0.7
+              frame(sample("a", 4, lat=5.0), [np.nan, 0.5]),    # NaN: counted as a frame, not measured
+              frame(sample("a", 5, lat=6.0), [1.0])]
+
+    summary = _plot_summary(frames)
+
+    values = np.array([0.2, 0.4, 0.7, 1.0])
+    q1, median, q3 = np.percentile(values, [25, 50, 75])
+    assert (summary.frames, summary.failed) == (6, 1)
+    assert summary.folder_path == Path("/data/ImageData/a")
+    assert summary.lat == pytest.approx(3.5)
+    assert summary.greenness_mean == pytest.approx(values.mean())
+    assert summary.greenness_median == pytest.approx(median)
+    assert summary.greenness_iqr == pytest.approx(q3 - q1)
+
+
+def test_plot_summary_of_a_folder_without_measurements():
+    summary = _plot_summary([(sample("a", 0), None), (sample("a", 1), None)])
+    assert (summary.frames, summary.failed) == (2, 2)
+    assert np.isnan(summary.greenness_median) and np.isnan(summary.greenness_iqr)
+
+
+def test_folder_chunks_keep_folders_whole_and_in_order():
+    numbered = list(enumerate([sample("a", 0), sample("a", 1), sample("b", 0), sample("c", 0), sample("c", 1)]))
+    chunks = list(_folder_chunks(numbered))
+    assert [[num for num, _ in chunk] for chunk in chunks] == [[0, 1], [2], [3, 4]]
+
+
+def test_calibrate_folder_uses_the_agreeing_probes():
+    detector = FakeDetector({4: 80.0, 8: None})  # frame 4 finds another position, frame 8 none
+    samples = [sample("a", i) for i in range(9)]
+
+    calibration = pipeline(detector, probes=5).calibrate_folder(samples)
+
+    assert detector.searched == [0, 2, 4, 6, 8]
+    assert (calibration.probes, calibration.agreeing) == (5, 3)
+    np.testing.assert_array_equal(calibration.quad, QUAD.astype(np.int32))
+    swatches = np.median([FakeDetector.swatches(i) for i in (0, 2, 6)], axis=0)
+    np.testing.assert_allclose(calibration.swatches, swatches)
+    np.testing.assert_allclose(calibration.matrix, np.eye(3) * swatches.mean())
+
+
+def test_calibrate_folder_falls_back_without_a_majority():
+    detector = FakeDetector({0: None, 2: 80.0})
+    assert pipeline(detector, probes=4).calibrate_folder([sample("a", i) for i in range(4)]) is None
+
+
+def test_frames_whose_checker_moved_are_searched_again():
+    detector = FakeDetector({4: 80.0, 5: 120.0})  # probe 4 disagrees; frame 5, not a probe, was moved
+
+    p, results = outcomes(detector, probes=3, frames=9)
+
+    assert [error for *_, error, _ in results] == [None] * 9
+    assert [searched for *_, searched in results] == [i in (4, 5) for i in range(9)]
+    assert detector.sampled == list(range(9))
+    assert detector.searched == [0, 4, 8, 5]  # the probes are not searched a second time
+    for i, quad in enumerate(p.leaf_segmentor.quads):
+        offset = {4: 80.0, 5: 120.0}.get(i, 0.0)
+        np.testing.assert_array_equal(quad, QUAD + offset, err_msg=f"frame {i}")
+
+
+def test_probe_searches_are_reused_when_the_folder_falls_back():
+    detector = FakeDetector({0: None, 2: 80.0})
+
+    p, results = outcomes(detector, probes=4, frames=4)
+
+    assert detector.searched == [0, 1, 2, 3]
+    assert [searched for *_, searched in results] == [True] * 4
+    assert isinstance(results[0][3], PipelineError) and [r[3] for r in results[1:]] == [None] * 3
+    assert detector.sampled == []
+
+
+def test_plot_summary_counts_redetected_frames():
+    assert _plot_summary([frame(sample("a", 0), [0.1]), (sample("a", 1), None)], redetected=2).redetected == 2
+
+
+def test_merge_plots_recomputes_statistics_over_shards(tmp_path):
+    root = tmp_path / "ds"
+    images = [root / "ImageData" / "a" / f"{i:03d}.png" for i in range(4)]
+    for path in images:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.touch()
+    output = tmp_path / "out.csv"
+
+    # --shard-by path put frames 0, 2 of folder a in shard 0 and 1, 3 (3 failed) in shard 1
+    shards = {0: [(0, 0.1), (2, 0.5)], 1: [(1, 0.3)]}
+    for index, rows in shards.items():
+        stem = f"out.shard-{index}-of-2"
+        writer = CsvResultWriter(tmp_path / f"{stem}.csv")
+        s = [ImageSample(path=images[i], root_path=root, folder_name="a", lat=float(i), long=0.0) for i, _ in rows]
+        writer.write_all(MeasurementBuffer.concat(frame(x, [v])[1] for x, (_, v) in zip(s, rows)))
+        frames, failed, redetected = (2, 0, 1) if index == 0 else (2, 1, 2)
+        with (tmp_path / f"{stem}.plots.csv").open("w", newline="", encoding="utf-8") as f:
+            csv.writer(f).writerows([["folder_name", "folder_path", "frames", "failed", "redetected", "lat", "long",
+                                      "greenness_mean", "greenness_median", "greenness_iqr"],
+                                     ["a", str(images[0].parent), frames, failed, redetected,
+                                      1.0 if index == 0 else 2.0, 0.0, 0, 0, 0]])
+
+    merger = ShardMerger(output, root, images, shard_by="path")
+    merger.merge_csv()
+    plots = merger.merge_plots(read_measurements)
+
+    with plots.open(newline="", encoding="utf-8") as f:
+        (row,) = list(csv.DictReader(f))
+    assert (row["frames"], row["failed"], row["redetected"]) == ("4", "1", "3")
+    assert float(row["lat"]) == pytest.approx(1.5)
+    assert float(row["greenness_median"]) == pytest.approx(0.3)
+    assert float(row["greenness_iqr"]) == pytest.approx(np.subtract(*np.percentile([0.1, 0.3, 0.5], [75, 25])))
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from domain.exceptions import PipelineError
+from infrastructure.leaf_segmentation import LeafSegmentor
+
+
+def random_masks():
+    rng = np.random.default_rng(0)
+    for shape in [(1, 40), (40, 1), (5, 5), (37, 53), (120, 97)]:
+        for density in (0.05, 0.3, 0.5, 0.7, 0.95):
+            yield (rng.random(shape) < density).astype(np.uint8) * 255
+
+
+def edge_masks():
+    """Blobs, lines and single pixels on the frame border, where the two border modes could differ."""
+    h, w = 31, 43
+    yield np.full((h, w), 255, np.uint8)
+    yield np.zeros((h, w), np.uint8)
+    for ys, xs in [(slice(0, 4), slice(None)), (slice(-4, None), slice(None)), (slice(None), slice(0, 4)),
+                   (slice(None), slice(-4, None)), (slice(0, 1), slice(0, 1)), (slice(-2, None), slice(-2, None)),
+                   (slice(0, 6), slice(0, 6)), (slice(-7, None), slice(10, 20)), (slice(None), slice(0, 1))]:
+        mask = np.zeros((h, w), np.uint8)
+        mask[ys, xs] = 255
+        yield mask
+        yield 255 - mask
+
+
+@pytest.mark.parametrize("mask", [*random_masks(), *edge_masks()])
+def test_morphology_matches_reference(mask):
+    segmentor = LeafSegmentor()
+    expected = LeafSegmentor._reference_morphology(mask)
+
+    np.testing.assert_array_equal(segmentor._morphology_mask(mask.copy()), expected)
+
+
+def test_morphology_reuses_scratch_for_smaller_masks():
+    segmentor = LeafSegmentor()
+    rng = np.random.default_rng(1)
+    for shape in [(64, 80), (20, 30), (64, 80)]:
+        mask = (rng.random(shape) < 0.5).astype(np.uint8) * 255
+        expected = LeafSegmentor._reference_morphology(mask)
+
+        np.testing.assert_array_equal(segmentor._morphology_mask(mask.copy()), expected)
+    assert segmentor._scratch.size == 64 * 80
+
+
+def test_early_reject_only_for_empty_erosion():
+    # with the default mask_are_min one pixel surviving the first erosion already passes the bound
+    segmentor = LeafSegmentor()
+    mask = np.zeros((20, 20), np.uint8)
+    mask[5:8, 5:8] = 255
+    segmentor._morphology_mask(mask.copy(), reject_small=True)
+
+    mask[6, 6] = 0
+    with pytest.raises(PipelineError):
+        segmentor._morphology_mask(mask, reject_small=True)
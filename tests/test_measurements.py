@@ -0,0 +1,114 @@
+from pathlib import Path
+import pickle
+import numpy as np
+import pytest
+from domain.entities import GreennessMeasurement, ImageSample, PatchRegion
+from domain.measurements import MeasurementBuffer, _segment_median, _segment_percentile, _segments
+
+
+def image(folder: str, i: int, values: list[float], lat: float = 35.0) -> MeasurementBuffer:
+    path = Path(f"/data/ImageData/{folder}/{i:03d}.png")
+    sample = ImageSample(path=path, root_path=path.parent, folder_name=folder, lat=lat, long=-88.0)
+    patches = [PatchRegion(x=p, y=0, w=1, h=1, patch_id=p) for p in range(len(values))]
+    return MeasurementBuffer.for_image(sample, patches, [(v, {"exg_median": 2 * v}) for v in values])
+
+
+def sorted_segments(seed: int) -> tuple[np.ndarray, np.ndarray, np.ndarray, list[np.ndarray]]:
+    rng = np.random.default_rng(seed)
+    groups = [np.sort(rng.normal(size=n)) for n in [1, 2, 3, 4, 5, 7, 10, 33, 100]]
+    values = np.concatenate(groups)
+    starts, counts = _segments(np.repeat(np.arange(len(groups)), [len(g) for g in groups]))
+    return values, starts, counts, groups
+
+
+@pytest.mark.parametrize("q", [0, 10, 25, 50, 75, 90, 99.5, 100])
+def test_segment_percentile_matches_numpy(q):
+    values, starts, counts, groups = sorted_segments(0)
+    np.testing.assert_array_equal(_segment_percentile(values, starts, counts, q),
+                                  [np.percentile(g, q) for g in groups])
+
+
+def test_segment_median_matches_numpy():
+    values, starts, counts, groups = sorted_segments(1)
+    np.testing.assert_array_equal(_segment_median(values, starts, counts), [np.median(g) for g in groups])
+
+
+def test_folder_summaries_match_per_folder_numpy():
+    rng = np.random.default_rng(2)
+    frames, expected = [], {}
+    for i in range(40):
+        folder = "abc"[rng.integers(3)]  # folders interleave
+        values = list(rng.random(rng.integers(1, 5)))
+        if i % 7 == 3:
+            values[0] = np.nan  # one NaN patch makes the whole image unmeasured
+        frames.append(image(folder, i, values, lat=float(i)))
+        expected.setdefault(folder, []).append((np.median(values), float(i)))
+    frames.append(image("d", 99, [np.nan]))  # a folder without any measured image
+    expected["d"] = [(np.nan, 35.0)]
+
+    summary = MeasurementBuffer.concat(frames).folder_summaries()
+
+    assert summary["folder_name"] == list(expected)
+    for k, (folder, images) in enumerate(expected.items()):
+        medians = np.array([m for m, _ in images])
+        finite = medians[np.isfinite(medians)]
+        assert summary["images"][k] == len(images)
+        assert summary["measured"][k] == len(finite)
+        assert summary["lat"][k] == pytest.approx(np.mean([lat for _, lat in images]))
+        if len(finite):
+            q1, median, q3 = np.percentile(finite, [25, 50, 75])
+            assert summary["greenness_mean"][k] == pytest.approx(finite.mean())
+            assert (summary["greenness_q1"][k], summary["greenness_median"][k], summary["greenness_q3"][k]) == \
+                (q1, median, q3)
+        else:
+            assert np.isnan(summary["greenness_mean"][k]) and np.isnan(summary["greenness_median"][k])
+
+
+def test_folder_summaries_of_an_empty_buffer():
+    summary = MeasurementBuffer().folder_summaries()
+    assert summary["folder_name"] == [] and len(summary["greenness_median"]) == 0
+
+
+def test_concat_reinterns_differing_strings():
+    a = MeasurementBuffer.concat([image("a", 0, [0.1]), image("b", 1, [0.2, 0.3])])
+    b = MeasurementBuffer.concat([image("c", 2, [0.4]), image("b", 1, [0.5]), image("a", 3, [0.6])])
+
+    merged = MeasurementBuffer.concat([a, b])
+
+    assert merged.image_paths() == a.image_paths() + b.image_paths()
+    assert merged.folder_names() == ["a", "b", "b", "c", "b", "a"]
+    assert merged._folders == ["a", "b", "c"]
+    assert len(merged._paths) == 4
+    np.testing.assert_array_equal(merged.column("exg_median"), [0.2, 0.4, 0.6, 0.8, 1.0, 1.2])
+
+
+def test_concat_rejects_other_value_columns():
+    other = MeasurementBuffer(["exg_mean"])
+    other.append(GreennessMeasurement(image_path=Path("x.png"), folder_name="a", lat=0.0, long=0.0, patch_id=0,
+                                      patch_region=PatchRegion(0, 0, 1, 1, 0), greenness_value=0.5,
+                                      values={"exg_mean": 1.0}))
+    with pytest.raises(ValueError, match="Cannot combine"):
+        MeasurementBuffer.concat([image("a", 0, [0.1]), other])
+
+
+def test_pickle_round_trip_keeps_rows_and_interning():
+    buffer = MeasurementBuffer()
+    for i in range(5):
+        buffer.extend(image("a", i, [0.1 * i, 0.2]))
+    assert len(buffer._rows) > len(buffer)  # spare capacity is not pickled
+
+    restored = pickle.loads(pickle.dumps(buffer))
+
+    assert len(restored._rows) == len(restored) == 10
+    assert restored.measurements() == buffer.measurements()
+    restored.extend(image("a", 4, [0.9]))
+    assert len(restored._paths) == 5 and restored.image_paths()[-1] == buffer.image_paths()[-1]
+
+
+def test_pickled_slice_keeps_only_its_rows():
+    buffer = MeasurementBuffer.concat([image("a", i, [0.1, 0.2]) for i in range(5)])
+
+    restored = pickle.loads(pickle.dumps(buffer[2:4]))
+
+    assert len(restored._rows) == 2
+    assert restored.measurements() == buffer.measurements()[2:4]
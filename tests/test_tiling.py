@@ -0,0 +1,102 @@
+from pathlib import Path
+import numpy as np
+import pytest
+from application.services import ImageProcessingPipeline
+from config.settings import ProjectConfig
+from domain.entities import DecodedImage, ImageSample
+from infrastructure.color_calibration import SimpleColorCalibrator
+from infrastructure.greenness_index import ExcessGreenIndexCalculator
+from infrastructure.leaf_segmentation import LeafSegmentor
+from infrastructure.patch_selection import CorrelationBasedPatchSelector
+
+METHODS = ("nexg", "exg", "hsv")
+# the checker's top edge lies above the frame, so fillPoly has to clip it
+QUAD = np.array([[150, -20], [230, -10], [225, 60], [145, 50]], dtype=np.int32)
+
+
+def synthetic_frame(h: int = 300, w: int = 240, seed: int = 0) -> np.ndarray:
+    """Soil-coloured noise with green blobs of various sizes, some cut by the frame border."""
+    rng = np.random.default_rng(seed)
+    bgr = rng.normal((70, 95, 120), 55, size=(h, w, 3))
+    yy, xx = np.mgrid[:h, :w]
+    for cy, cx, r in [(40, 30, 25), (150, 120, 50), (h - 5, 60, 30), (220, 230, 35), (100, 200, 6), (260, 150, 3)]:
+        blob = (yy - cy) ** 2 + (xx - cx) ** 2 < r * r
+        bgr[blob] = rng.normal((50, 150, 60), 55, size=(blob.sum(), 3))
+    return bgr.clip(0, 255).astype(np.uint8)
+
+
+class FrameLoader:
+    def __init__(self, bgr: np.ndarray):
+        self.bgr = bgr
+
+    def load(self, path: Path) -> DecodedImage:
+        return DecodedImage(path=path, bgr=self.bgr.copy())
+
+
+class FixedDetector:
+    def __init__(self, swatches: np.ndarray):
+        self.swatches = swatches
+
+    def detect(self, frame: DecodedImage) -> tuple[np.ndarray, np.ndarray]:
+        return self.swatches, QUAD
+
+
+def pipeline(method: str, tile_memory_mb: int) -> ImageProcessingPipeline:
+    config = ProjectConfig(input_root=Path("/data"), output_csv=Path("out.csv"), output_figure=Path("fig"),
+                           segment_method=method, green_indx="ngrdi", green_indices=("ngrdi", "exg", "vari", "gli"),
+                           green_stats=("median", "mean", "p90"), num_patches_per_image=3,
+                           tile_memory_mb=tile_memory_mb)
+    calibrator = SimpleColorCalibrator()
+    # a checker seen under a warm, dim light, so the fitted matrix is far from the identity
+    swatches = calibrator.REFERENCE_SWATCHES * np.array([0.9, 0.7, 0.5]) + 0.02
+    return ImageProcessingPipeline(
+        loader=FrameLoader(synthetic_frame()), checker_detector=FixedDetector(swatches),
+        leaf_segmentor=LeafSegmentor(method=method, mask_are_min=0), calibrator=calibrator,
+        patch_selector=CorrelationBasedPatchSelector(stride_fraction=0.5, patch_fraction=0.25),
+        greenness_calc=ExcessGreenIndexCalculator(method="ngrdi", indices=config.green_indices,
+                                                  stats=config.green_stats),
+        config=config, show_func=None)
+
+
+@pytest.mark.parametrize("method", METHODS)
+@pytest.mark.parametrize("tile_rows", [17, 64, 299])
+def test_tiled_mask_matches_whole_frame(method, tile_rows):
+    segmentor = LeafSegmentor(method=method, mask_are_min=0)
+    bgr = synthetic_frame()
+
+    whole = segmentor.mask(bgr, QUAD)
+    assert 0 < np.count_nonzero(whole) < whole.size
+
+    np.testing.assert_array_equal(segmentor.mask(bgr, QUAD, tile_rows=tile_rows), whole)
+
+
+@pytest.mark.parametrize("method", METHODS)
+def test_tiled_measurement_matches_whole_frame(method):
+    whole = pipeline(method, tile_memory_mb=0)
+    tiled = pipeline(method, tile_memory_mb=1)
+    frame = whole.loader.load(Path("x.png"))
+    assert tiled._tile_rows(frame.shape) < frame.shape[0]
+
+    path = Path("/data/ImageData/a/000.png")
+    sample = ImageSample(path=path, root_path=path.parent, folder_name="a", lat=35.0, long=-88.0)
+    expected, result = whole.process_image(sample, 1), tiled.process_image(sample, 1)
+
+    assert len(expected) == 3
+    for column in ("x", "y", "w", "h", "greenness_value", *expected.value_columns):
+        np.testing.assert_array_equal(result.column(column), expected.column(column), err_msg=column)
+
+
+@pytest.mark.parametrize("method", METHODS)
+def test_measure_tiled_with_thin_tiles(method):
+    p = pipeline(method, tile_memory_mb=0)
+    bgr = synthetic_frame()
+    swatches, quad = p.checker_detector.detect(None)
+    mask = p.leaf_segmentor.mask(bgr, quad)
+    matrix = p.calibrator.matrix_for(swatches)
+    calibrated = p.calibrator.apply(bgr, matrix)
+    patches = p.patch_selector.select_patches(calibrated, quad, 3, mask=mask)
+
+    expected = [p.greenness_calc.compute_all(calibrated[q.y:q.y + q.h, q.x:q.x + q.w],
+                                             mask[q.y:q.y + q.h, q.x:q.x + q.w]) for q in patches]
+
+    assert p._measure_tiled(bgr, mask, matrix, patches, tile_rows=17) == expected